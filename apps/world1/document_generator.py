@@ -6,6 +6,54 @@ from typing import List, Dict, Any
 import yaml
 from world_bible import WORLD_DATA
 
+class DocumentRecord:
+    """Компактная запись документа: тело хранится один раз, front matter рендерится по запросу
+
+    Поддерживает доступ по ключам (doc['content'], doc['raw_content'] = ...),
+    как прежний словарь документа.
+    """
+
+    __slots__ = ('id', 'type', 'metadata', 'body')
+
+    KEYS = ('id', 'type', 'content', 'metadata', 'raw_content')
+
+    def __init__(self, doc_id: str, doc_type: str, metadata: Dict[str, Any], body: str):
+        self.id = doc_id
+        self.type = doc_type
+        self.metadata = metadata
+        self.body = body
+
+    @property
+    def raw_content(self) -> str:
+        return self.body
+
+    @raw_content.setter
+    def raw_content(self, body: str):
+        self.body = body
+
+    @property
+    def content(self) -> str:
+        """Полный текст документа с YAML front matter"""
+        return f"---\n{yaml.dump(self.metadata, default_flow_style=False)}---\n\n{self.body}"
+
+    def __getitem__(self, key: str):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value):
+        if key == 'content':
+            raise KeyError("content is rendered from metadata and body; set raw_content instead")
+        if key not in self.KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.KEYS
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
 class DocumentGenerator:
     def __init__(self):
         self.world = WORLD_DATA
@@ -60,16 +108,8 @@ class DocumentGenerator:
             'generated_date': datetime.now().strftime("%Y-%m-%d")
         })
 
-        # Формируем полный документ
-        full_doc = f"---\n{yaml.dump(metadata, default_flow_style=False)}---\n\n{content}"
-
-        return {
-            'id': doc_id,
-            'type': doc_type,
-            'content': full_doc,
-            'metadata': metadata,
-            'raw_content': content
-        }
+        # Полный текст с front matter собирается по запросу (DocumentRecord.content)
+        return DocumentRecord(doc_id, doc_type, metadata, content)
 
     def _encyclopedia_template(self, doc_id: str):
         """Шаблон для энциклопедической статьи"""
@@ -91,27 +131,26 @@ class DocumentGenerator:
             'keywords': self._get_keywords(topic_type)
         }
 
-        # Генерация содержания
-        content = f"# {topic}\n\n"
+        # Генерация содержания: части собираются в список и склеиваются один раз
+        parts = [f"# {topic}\n\n"]
 
         if "Magic Potion" in topic:
-            content += self._generate_potion_article()
+            parts.append(self._generate_potion_article())
         elif "Gallic Village" in topic:
-            content += self._generate_village_article()
+            parts.append(self._generate_village_article())
         elif "Roman" in topic:
-            content += self._generate_roman_article()
+            parts.append(self._generate_roman_article())
         elif "Druidic" in topic:
-            content += self._generate_druid_article()
+            parts.append(self._generate_druid_article())
         else:
-            content += self._generate_menhir_article()
+            parts.append(self._generate_menhir_article())
 
         # Добавляем раздел "See Also"
-        content += "\n\n## See Also\n"
+        parts.append("\n\n## See Also\n")
         see_also = random.sample([d for d in self.doc_ids if d != doc_id], min(3, len(self.doc_ids)))
-        for doc in see_also:
-            content += f"- {doc}\n"
+        parts.extend(f"- {doc}\n" for doc in see_also)
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _journal_template(self, doc_id: str):
         """Шаблон для дневниковой записи"""
@@ -129,20 +168,23 @@ class DocumentGenerator:
         }
 
         # Генерация дневниковой записи
-        content = f"## Entry #{random.randint(1, 50)}\n\n"
-        content += f"*Date: {metadata['date']}*\n*Location: {random.choice(['Armorican Village', 'Roman Camp', 'Forest', 'Lutetia'])}*\n\n"
+        parts = [
+            f"## Entry #{random.randint(1, 50)}\n\n",
+            f"*Date: {metadata['date']}*\n*Location: {random.choice(['Armorican Village', 'Roman Camp', 'Forest', 'Lutetia'])}*\n\n"
+        ]
 
+        # Ветки — лямбды: вычисляется (и тратит случайные выборы) только выбранная
         journal_templates = [
-            f"Today we had another encounter with the Romans. {self._get_random_character('roman')} tried to attack our village, but as usual, {self._get_reference('encyclopedia', 'Magic Potion')} made short work of them.",
-            f"{self._get_random_character('hero')} and I went menhir hunting today. Found a particularly fine specimen near {self._get_random_location()}. Must remember to avoid the wild boar traps!",
-            f"Another feast tonight. As expected, {self._get_random_character('bard')} started singing and had to be restrained. The fish from {self._get_random_character('fishmonger')} was particularly salty today.",
-            f"Discussed potion ingredients with {self._get_random_character('druid')}. The mistletoe is particularly potent this season. Note: avoid using oak from the northern grove."
+            lambda: f"Today we had another encounter with the Romans. {self._get_random_character('roman')} tried to attack our village, but as usual, {self._get_reference('encyclopedia', 'Magic Potion')} made short work of them.",
+            lambda: f"{self._get_random_character('hero')} and I went menhir hunting today. Found a particularly fine specimen near {self._get_random_location()}. Must remember to avoid the wild boar traps!",
+            lambda: f"Another feast tonight. As expected, {self._get_random_character('bard')} started singing and had to be restrained. The fish from {self._get_random_character('fishmonger')} was particularly salty today.",
+            lambda: f"Discussed potion ingredients with {self._get_random_character('druid')}. The mistletoe is particularly potent this season. Note: avoid using oak from the northern grove."
         ]
 
-        content += random.choice(journal_templates)
-        content += "\n\n" + self._add_random_observation()
+        parts.append(random.choice(journal_templates)())
+        parts.append("\n\n" + self._add_random_observation())
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _report_template(self, doc_id: str):
         """Шаблон для официального отчета"""
@@ -157,23 +199,25 @@ class DocumentGenerator:
             'subject': random.choice(["Magic Potion Analysis", "Village Defenses", "Roman Camp Status"])
         }
 
-        content = f"# REPORT: {metadata['subject']}\n"
-        content += f"**Classification:** {metadata['classification']}\n"
-        content += f"**Reporter:** {reporter}\n"
-        content += f"**Date:** {random.randint(45, 50)} BC\n\n"
+        parts = [
+            f"# REPORT: {metadata['subject']}\n",
+            f"**Classification:** {metadata['classification']}\n",
+            f"**Reporter:** {reporter}\n",
+            f"**Date:** {random.randint(45, 50)} BC\n\n",
 
-        content += "## Executive Summary\n"
-        content += self._generate_report_summary()
+            "## Executive Summary\n",
+            self._generate_report_summary(),
 
-        content += "\n## Findings\n"
-        content += self._generate_report_findings()
+            "\n## Findings\n",
+            self._generate_report_findings(),
 
-        content += "\n## Recommendations\n"
-        content += self._generate_report_recommendations()
+            "\n## Recommendations\n",
+            self._generate_report_recommendations(),
 
-        content += f"\n\n**References:** {self._get_random_references(2)}"
+            f"\n\n**References:** {self._get_random_references(2)}"
+        ]
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _decree_template(self, doc_id: str):
         """Шаблон для указа или закона"""
@@ -189,18 +233,20 @@ class DocumentGenerator:
         }
 
         decrees = [
-            f"By order of {authority}, the consumption of magic potion is restricted to defensive purposes only. Violators will face boar-cleaning duties.",
-            f"All menhirs must be properly labeled with delivery information. Unlabeled menhirs will be considered property of {self._get_random_character('chief')}.",
-            f"The singing of {self._get_random_character('bard')} is hereby prohibited during feast hours. First offense: warning. Second offense: being tied to a tree.",
-            f"Roman soldiers are banned from entering the village without prior permission. Exception: delivery of olive oil and wine."
+            lambda: f"By order of {authority}, the consumption of magic potion is restricted to defensive purposes only. Violators will face boar-cleaning duties.",
+            lambda: f"All menhirs must be properly labeled with delivery information. Unlabeled menhirs will be considered property of {self._get_random_character('chief')}.",
+            lambda: f"The singing of {self._get_random_character('bard')} is hereby prohibited during feast hours. First offense: warning. Second offense: being tied to a tree.",
+            lambda: f"Roman soldiers are banned from entering the village without prior permission. Exception: delivery of olive oil and wine."
         ]
 
-        content = f"# DECREE OF {authority.upper()}\n\n"
-        content += random.choice(decrees)
-        content += f"\n\n**Signed,**\n{authority}"
-        content += f"\n\n**Witnessed by:** {self._get_random_witness()}"
+        parts = [
+            f"# DECREE OF {authority.upper()}\n\n",
+            random.choice(decrees)(),
+            f"\n\n**Signed,**\n{authority}",
+            f"\n\n**Witnessed by:** {self._get_random_witness()}"
+        ]
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _myth_template(self, doc_id: str):
         """Шаблон для мифа или легенды"""
@@ -221,8 +267,10 @@ class DocumentGenerator:
             'region': "Armorica"
         }
 
-        content = f"# The Legend of {myth_name}\n\n"
-        content += f"*As told by {metadata['storyteller']}*\n\n"
+        parts = [
+            f"# The Legend of {myth_name}\n\n",
+            f"*As told by {metadata['storyteller']}*\n\n"
+        ]
 
         myth_stories = {
             "Origin of Magic Potion": "Long before the Romans came, the druid Getafix was studying mistletoe when a lightning bolt struck his cauldron...",
@@ -231,15 +279,15 @@ class DocumentGenerator:
             "The Singing Bard": "Cacofonix was once a great singer, but he insulted the god of music, who cursed him to sing off-key forever..."
         }
 
-        content += myth_stories.get(myth_name, "This is an ancient tale passed down through generations...")
-        content += "\n\n**Moral:** " + random.choice([
+        parts.append(myth_stories.get(myth_name, "This is an ancient tale passed down through generations..."))
+        parts.append("\n\n**Moral:** " + random.choice([
             "Strength comes from unity, not just potion.",
             "Even giants need to rest sometimes.",
             "Never underestimate a Gaul with a full stomach.",
             "Some curses are blessings in disguise."
-        ])
+        ]))
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _letter_template(self, doc_id: str):
         """Шаблон для письма"""
@@ -258,21 +306,23 @@ class DocumentGenerator:
             'urgency': random.choice(["Normal", "Urgent", "Secret"])
         }
 
-        content = f"Dear {receiver.replace('_', ' ')},\n\n"
+        parts = [f"Dear {receiver.replace('_', ' ')},\n\n"]
 
         letters = [
-            f"I hope this letter finds you well. Things here in the village are as chaotic as ever. {self._get_random_character('blacksmith')} and {self._get_random_character('fishmonger')} had another fight today.",
-            f"Important news! The Romans from {self._get_random_location('roman')} are planning something. Saw them drilling near the forest.",
-            f"Need more mistletoe for potion brewing. The harvest from {random.choice(['oak grove', 'sacred forest', 'druid circle'])} was poor this year.",
-            f"Obelix delivered another batch of menhirs today. One was so large it broke the village gate! Chief {self._get_random_character('chief')} was not amused."
+            lambda: f"I hope this letter finds you well. Things here in the village are as chaotic as ever. {self._get_random_character('blacksmith')} and {self._get_random_character('fishmonger')} had another fight today.",
+            lambda: f"Important news! The Romans from {self._get_random_location('roman')} are planning something. Saw them drilling near the forest.",
+            lambda: f"Need more mistletoe for potion brewing. The harvest from {random.choice(['oak grove', 'sacred forest', 'druid circle'])} was poor this year.",
+            lambda: f"Obelix delivered another batch of menhirs today. One was so large it broke the village gate! Chief {self._get_random_character('chief')} was not amused."
         ]
 
-        content += random.choice(letters)
-        content += f"\n\nRemember what we discussed about {random.choice(['the potion formula', 'Roman movements', 'the next feast'])}."
-        content += f"\n\nYours sincerely,\n{sender}"
-        content += f"\n\nP.S. {self._add_postscript()}"
+        parts.extend([
+            random.choice(letters)(),
+            f"\n\nRemember what we discussed about {random.choice(['the potion formula', 'Roman movements', 'the next feast'])}.",
+            f"\n\nYours sincerely,\n{sender}",
+            f"\n\nP.S. {self._add_postscript()}"
+        ])
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _add_cross_references(self):
         """Добавляет перекрестные ссылки между документами"""
@@ -294,13 +344,9 @@ class DocumentGenerator:
                         sentences[insert_pos] = sentences[insert_pos] + ref_text
                         content = '. '.join(sentences)
 
-            # Обновляем документ
+            # Обновляем документ (front matter рендерится при сохранении)
             doc['raw_content'] = content
 
-            # Обновляем полный контент
-            metadata_yaml = yaml.dump(doc['metadata'], default_flow_style=False)
-            doc['content'] = f"---\n{metadata_yaml}---\n\n{content}"
-
     # Вспомогательные методы для генерации контента
     def _generate_doc_id(self, doc_type: str, index: int) -> str:
         """Генерирует ID документа"""
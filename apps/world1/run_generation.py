@@ -1,59 +1,52 @@
 #!/usr/bin/env python3
 # apps/world1/run_generation.py
+import argparse
 import sys
 import os
-import time
 
-# Добавляем текущую директорию в путь Python
+# Добавляем текущую директорию и корень проекта (общий конвейер pipeline.py) в путь Python
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
 
-def run_python_script(script_name):
-    """Запускает Python скрипт напрямую, без subprocess"""
-    try:
-        print(f"  Executing: {script_name}")
+from pipeline import Pipeline, Stage, print_summary, STATE_FILE
 
-        if script_name == "document_generator.py":
-            from document_generator import main as script_main
-            script_main()
-        elif script_name == "analyze_corpus.py":
-            from analyze_corpus import main as script_main
-            script_main()
-        else:
-            print(f"  ❌ Unknown script: {script_name}")
-            return False
+def generate_documents():
+    os.makedirs("documents", exist_ok=True)
+    from document_generator import main as script_main
+    script_main()
 
-        return True
-    except Exception as e:
-        print(f"  ❌ Error executing {script_name}: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+def analyze_corpus():
+    from analyze_corpus import CorpusAnalyzer
+    CorpusAnalyzer().run_full_analysis()
+
+def build_stages():
+    return [
+        Stage("documents", generate_documents,
+              outputs=["documents", "document_index.json", "qa_pairs.jsonl"],
+              description="Creating documents...", reproducible=False),
+        Stage("analysis", analyze_corpus,
+              inputs=["documents"], outputs=["corpus_network.json"],
+              description="Analyzing corpus...")
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the Asterix universe corpus")
+    parser.add_argument('--force', action='store_true', help="Rerun every step even if its outputs are up to date")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel processes for independent steps")
+    args = parser.parse_args(argv)
 
-def main():
     print("🚀 Asterix Universe Document Generator")
     print("=" * 50)
 
-    # Создаём папки
     output_dir = "documents"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    steps = [
-        ("Creating documents...", "document_generator.py"),
-        ("Analyzing corpus...", "analyze_corpus.py")
-    ]
-
-    for description, script in steps:
-        print(f"\n📝 {description}")
-        success = run_python_script(script)
-        if success:
-            print("  ✅ Done")
-        else:
-            print("  ⚠️  Warning: Script had issues")
-        time.sleep(0.5)
+    results = Pipeline(build_stages(), STATE_FILE, args.workers, args.force).run()
+    print_summary(results)
 
     print("\n" + "=" * 50)
-    print("🎉 Generation complete!")
+    if any(result['status'] in ('failed', 'blocked') for result in results.values()):
+        print("⚠️  Generation finished with errors")
+    else:
+        print("🎉 Generation complete!")
 
     # Проверяем созданные файлы
     generated_files = []
@@ -70,4 +63,4 @@ def main():
         print(f"  {output_dir}/ - {doc_count} document files")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,190 @@
+# apps/world2/batch_worlds.py
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from datetime import datetime
+
+try:
+    from . import fictional_document_generator
+    from .validate_fictional_corpus import FictionalCorpusValidator
+    from .hard_negatives import qa_files
+except ImportError:
+    import fictional_document_generator
+    from validate_fictional_corpus import FictionalCorpusValidator
+    from hard_negatives import qa_files
+
+MANIFEST_FILE = "worlds_manifest.json"
+
+def folder_size(folder):
+    """Число файлов и байт в папке (рекурсивно)"""
+    files = size = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+def count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+def world_summary(output_folder):
+    """Размеры корпуса и QA наборов построенного мира"""
+    knowledge_base_folder = os.path.join(output_folder, "knowledge_base")
+    generated_folder = os.path.join(output_folder, "generated")
+    documents, knowledge_base_bytes = folder_size(knowledge_base_folder)
+    _, generated_bytes = folder_size(generated_folder)
+    with open(os.path.join(generated_folder, "fictional_world.json"), 'r', encoding='utf-8') as f:
+        universe = json.load(f).get('fictional_universe', 'Unknown')
+    return {
+        'universe': universe,
+        'documents': documents,
+        'knowledge_base_bytes': knowledge_base_bytes,
+        'generated_bytes': generated_bytes,
+        'qa_pairs': {os.path.basename(path): count_lines(path) for path in qa_files(generated_folder)}
+    }
+
+def validate_world(output_folder):
+    """Основные оценки валидатора для мира в папке output_folder"""
+    validator = FictionalCorpusValidator(os.path.join(output_folder, "knowledge_base"),
+                                         os.path.join(output_folder, "generated"))
+    report = validator.generate_coherence_report()
+    return {key: report.get(key) for key in ('quality_score', 'quality_percentage', 'broken_refs', 'unique_terms')}
+
+def build_world(seed, output_folder, generator_args=(), validate=True, world=None):
+    """Строит и проверяет один мир; вызывается в отдельном процессе
+
+    Вывод генератора и валидатора пишется в generation.log папки мира,
+    ошибка мира не останавливает остальные: она попадает в результат.
+    seed=None строит мир без фиксированного зерна; world — уже построенный
+    мир этого зерна (build_seeded_world).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    result = {'seed': seed, 'folder': output_folder, 'status': 'ok'}
+    started = time.perf_counter()
+
+    with open(os.path.join(output_folder, "generation.log"), 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            seed_args = ['--seed', str(seed)] if seed is not None else []
+            fictional_document_generator.main([*seed_args, '--output-dir', output_folder, *generator_args], world)
+            result['generation_seconds'] = round(time.perf_counter() - started, 3)
+
+            if validate:
+                validation_started = time.perf_counter()
+                result['validation'] = validate_world(output_folder)
+                result['validation_seconds'] = round(time.perf_counter() - validation_started, 3)
+            result.update(world_summary(output_folder))
+        except (Exception, SystemExit) as e:  # argparse сообщает об ошибке аргументов через SystemExit
+            traceback.print_exc()
+            result['status'] = 'failed'
+            result['error'] = f"{type(e).__name__}: {e}"
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+def _build_world_task(task):
+    return build_world(*task)
+
+def aggregate(results):
+    """Сводка по всем мирам: суммарные размеры и разброс оценок валидации"""
+    built = [result for result in results if result['status'] == 'ok']
+    scores = [result['validation']['quality_percentage'] for result in built]
+    return {
+        'worlds_built': len(built),
+        'worlds_failed': len(results) - len(built),
+        'documents': sum(result['documents'] for result in built),
+        'knowledge_base_bytes': sum(result['knowledge_base_bytes'] for result in built),
+        'generated_bytes': sum(result['generated_bytes'] for result in built),
+        'qa_pairs': sum(sum(result['qa_pairs'].values()) for result in built),
+        'world_seconds': round(sum(result['seconds'] for result in results), 3),
+        'validation_percentage': {
+            'mean': round(sum(scores) / len(scores), 2) if scores else None,
+            'min': min(scores, default=None),
+            'max': max(scores, default=None)
+        }
+    }
+
+def build_worlds(seeds, output_folder="worlds", workers=None, generator_args=()):
+    """Строит миры для всех зёрен параллельно, каждый в своей папке world_<seed>/
+
+    Каждый мир строится в новом процессе (maxtasksperchild=1): генератор
+    использует глобальное состояние модуля random, и миры не должны
+    наследовать его друг от друга. Результат — манифест worlds_manifest.json.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(seeds)))
+    tasks = [(seed, os.path.join(output_folder, f"world_{seed}"), tuple(generator_args)) for seed in seeds]
+    print(f"Building {len(seeds)} worlds in {workers} processes into {output_folder}/")
+
+    started = time.perf_counter()
+    results = []
+    with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(_build_world_task, tasks):
+            results.append(result)
+            if result['status'] == 'ok':
+                print(f"  ✓ world {result['seed']}: {result['universe']}, {result['documents']} documents, "
+                      f"validation {result['validation']['quality_percentage']:.1f}% ({result['seconds']:.1f}s)")
+            else:
+                print(f"  ❌ world {result['seed']}: {result['error']} (see {result['folder']}/generation.log)")
+    results.sort(key=lambda result: seeds.index(result['seed']))
+
+    manifest = {
+        'created': datetime.now().isoformat(),
+        'seeds': list(seeds),
+        'workers': workers,
+        'generator_args': list(generator_args),
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'summary': aggregate(results),
+        'worlds': results
+    }
+    manifest_path = os.path.join(output_folder, MANIFEST_FILE)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"✓ Manifest saved to {manifest_path}")
+    return manifest
+
+def parse_seeds(spec):
+    """Разбирает "1,5,9" и диапазоны "1-20" """
+    seeds = []
+    for item in spec.split(','):
+        first, _, last = item.partition('-')
+        seeds.extend(range(int(first), int(last or first) + 1))
+    return seeds
+
+def main(argv=None):
+    """Строит пакет независимых вымышленных миров"""
+    # Без сокращений: иначе --seed генератора принимался бы за --seeds
+    parser = argparse.ArgumentParser(description="Build many independent fictional worlds in parallel",
+                                     allow_abbrev=False)
+    parser.add_argument('--worlds', type=int, default=10, help="Number of worlds (seeds --first-seed ...)")
+    parser.add_argument('--first-seed', type=int, default=1)
+    parser.add_argument('--seeds', default=None, help='Explicit seeds instead of --worlds, e.g. "1-20" or "3,7,11"')
+    parser.add_argument('--workers', type=int, default=None, help="Parallel processes (default: CPU count)")
+    parser.add_argument('--output-dir', default="worlds", help="Folder for world_<seed>/ outputs and the manifest")
+    # Остальные аргументы передаются генератору каждого мира (--token-budget, --enumerate-templates, ...)
+    args, generator_args = parser.parse_known_args(argv)
+
+    seeds = parse_seeds(args.seeds) if args.seeds else list(range(args.first_seed, args.first_seed + args.worlds))
+    if len(set(seeds)) != len(seeds):
+        parser.error("Seeds must be distinct: every world gets its own output folder")
+    for option in ('--seed', '--output-dir', '--shard'):
+        if any(arg == option or arg.startswith(option + '=') for arg in generator_args):
+            parser.error(f"{option} is set per world by the batch runner")
+
+    manifest = build_worlds(seeds, args.output_dir, args.workers, generator_args)
+    summary = manifest['summary']
+    if summary['worlds_built']:
+        print(f"\n✅ Built {summary['worlds_built']} of {len(seeds)} worlds in {manifest['wall_seconds']:.1f}s: "
+              f"{summary['documents']:,} documents, {summary['qa_pairs']:,} QA pairs, "
+              f"mean validation {summary['validation_percentage']['mean']:.1f}%")
+    if summary['worlds_failed']:
+        print(f"⚠️  {summary['worlds_failed']} worlds failed, see generation.log in their folders")
+    return manifest
+
+if __name__ == "__main__":
+    main()
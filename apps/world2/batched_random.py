@@ -0,0 +1,109 @@
+# apps/world2/batched_random.py
+from bisect import bisect
+from itertools import accumulate
+
+import numpy as np
+
+# Точность выборов: как у random.random(), 53 бита на выбор
+DRAW_BITS = 53
+DRAW_SCALE = 2.0 ** -DRAW_BITS
+
+class BatchedRandom:
+    """Источник выборов с заранее вытянутыми блоками случайных чисел
+
+    Заменяет модуль random там, где генератор делает выборы слотов
+    (choice, randint, sample, ...). Числа тянутся блоками из numpy
+    Generator с заданным зерном одним вызовом и переводятся в список,
+    поэтому каждый выбор — это взятие элемента списка и умножение со
+    сдвигом вместо вызова Python RNG. Один выбор расходует ровно одно
+    число (sample и shuffle — по одному на позицию, getrandbits — по
+    одному на каждые DRAW_BITS бит), так что поток выборов воспроизводим
+    при том же зерне, а размер блока не важен.
+    """
+
+    def __init__(self, seed=None, block_size=65536):
+        self.block_size = block_size
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """Начинает поток выборов заново с зерна (как random.seed)"""
+        self.generator = np.random.default_rng(seed)
+        self.block = []  # Невзятые числа блока в обратном порядке: pop() берёт следующее
+        self.blocks_drawn = 0
+
+    def _refill(self):
+        """Тянет следующий блок и возвращает его первое число"""
+        block = self.generator.integers(0, 1 << DRAW_BITS, size=self.block_size, dtype=np.int64)
+        self.block = block[::-1].tolist()
+        self.blocks_drawn += 1
+        return self.block.pop()
+
+    # Выборы inline: на горячем пути нет вложенных вызовов методов
+
+    def random(self):
+        block = self.block
+        return (block.pop() if block else self._refill()) * DRAW_SCALE
+
+    def randrange(self, start, stop=None):
+        if stop is None:
+            start, stop = 0, start
+        if stop <= start:
+            raise ValueError(f"empty range for randrange({start}, {stop})")
+        block = self.block
+        # Умножение со сдвигом: смещение не больше n / 2^53
+        return start + ((block.pop() if block else self._refill()) * (stop - start) >> DRAW_BITS)
+
+    def randint(self, a, b):
+        if b < a:
+            raise ValueError(f"empty range for randint({a}, {b})")
+        block = self.block
+        return a + ((block.pop() if block else self._refill()) * (b - a + 1) >> DRAW_BITS)
+
+    def choice(self, seq):
+        if not seq:
+            raise IndexError("Cannot choose from an empty sequence")
+        block = self.block
+        return seq[(block.pop() if block else self._refill()) * len(seq) >> DRAW_BITS]
+
+    def choices(self, population, weights=None, k=1):
+        if weights is None:
+            return [self.choice(population) for _ in range(k)]
+        cum_weights = list(accumulate(weights))
+        total = cum_weights[-1]
+        hi = len(population) - 1
+        return [population[bisect(cum_weights, self.random() * total, 0, hi)] for _ in range(k)]
+
+    def sample(self, population, k):
+        pool = list(population)
+        if not 0 <= k <= len(pool):
+            raise ValueError("Sample larger than population or is negative")
+        # Частичная перетасовка Фишера-Йетса: k выборов на k элементов
+        for i in range(k):
+            j = self.randrange(i, len(pool))
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+    def shuffle(self, x):
+        for i in range(len(x) - 1, 0, -1):
+            j = self.randrange(i + 1)
+            x[i], x[j] = x[j], x[i]
+
+    def getrandbits(self, k):
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        # Из чисел блока по DRAW_BITS бит, чтобы поток не зависел от размера блока
+        value = 0
+        for _ in range(-(-k // DRAW_BITS)):
+            block = self.block
+            value = value << DRAW_BITS | (block.pop() if block else self._refill())
+        return value >> (-k % DRAW_BITS)
+
+    def getstate(self):
+        """Состояние для продолжения потока выборов с того же места"""
+        return {'bit_generator': self.generator.bit_generator.state,
+                'block': list(self.block), 'blocks_drawn': self.blocks_drawn}
+
+    def setstate(self, state):
+        self.generator.bit_generator.state = state['bit_generator']
+        self.block = list(state['block'])
+        self.blocks_drawn = state['blocks_drawn']
@@ -0,0 +1,187 @@
+# apps/world2/bm25_index.py
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+from array import array
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Приводит текст к нижнему регистру и разбивает на токены"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """Инвертированный индекс BM25 с постингами в компактных массивах
+
+    Постинги всех терминов лежат подряд в двух массивах uint32
+    (номера документов и частоты), словарь хранит смещение и df термина.
+    После save() индекс открывается через mmap без чтения в память.
+    """
+
+    def __init__(self, doc_ids, vocabulary, postings_docs, postings_tfs, doc_lengths, k1=1.5, b=0.75):
+        self.doc_ids = list(doc_ids)
+        self.vocabulary = vocabulary  # term -> (offset, df)
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if len(doc_lengths) else 0.0
+        self._mmaps = []
+
+    @classmethod
+    def build(cls, documents, k1=1.5, b=0.75):
+        """Строит индекс из пар (doc_id, text)"""
+        doc_ids = []
+        doc_lengths = array('I')
+        term_postings = {}
+
+        for doc_number, (doc_id, text) in enumerate(documents):
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_lengths.append(len(tokens))
+
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_postings.setdefault(token, []).append((doc_number, tf))
+
+        vocabulary = {}
+        postings_docs = array('I')
+        postings_tfs = array('I')
+        for term in sorted(term_postings):
+            postings = term_postings[term]
+            vocabulary[term] = (len(postings_docs), len(postings))
+            postings_docs.extend(doc_number for doc_number, _ in postings)
+            postings_tfs.extend(tf for _, tf in postings)
+
+        return cls(doc_ids, vocabulary, postings_docs, postings_tfs, doc_lengths, k1, b)
+
+    @classmethod
+    def build_from_folder(cls, knowledge_base_folder="knowledge_base", k1=1.5, b=0.75):
+        """Строит индекс по .txt файлам базы знаний"""
+        def read_documents():
+            for filename in sorted(os.listdir(knowledge_base_folder)):
+                if filename.endswith('.txt'):
+                    with open(os.path.join(knowledge_base_folder, filename), 'r', encoding='utf-8') as f:
+                        yield filename[:-len('.txt')], f.read()
+
+        return cls.build(read_documents(), k1, b)
+
+    def idf(self, df):
+        """Сглаженный IDF (вариант Lucene, всегда неотрицательный)"""
+        n = len(self.doc_ids)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _term_scores(self, term):
+        """Вклад термина в оценку каждого документа из его постинга"""
+        entry = self.vocabulary.get(term)
+        if entry is None:
+            return {}
+        offset, df = entry
+        idf = self.idf(df)
+        k1, b, avg = self.k1, self.b, self.avg_doc_length or 1.0
+        docs = self.postings_docs[offset:offset + df]
+        tfs = self.postings_tfs[offset:offset + df]
+        lengths = self.doc_lengths
+        return {
+            doc: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc] / avg))
+            for doc, tf in zip(docs, tfs)
+        }
+
+    def search_batch(self, queries, k=10):
+        """Ищет пачку запросов; каждый постинг читается один раз на пачку
+
+        Возвращает для каждого запроса список (doc_id, score) по убыванию оценки.
+        """
+        tokenized = [tokenize(query) for query in queries]
+        term_cache = {}
+        for tokens in tokenized:
+            for term in tokens:
+                if term not in term_cache:
+                    term_cache[term] = self._term_scores(term)
+
+        results = []
+        for tokens in tokenized:
+            scores = {}
+            for term in tokens:
+                for doc, score in term_cache[term].items():
+                    scores[doc] = scores.get(doc, 0.0) + score
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            results.append([(self.doc_ids[doc], score) for doc, score in top])
+        return results
+
+    def search(self, query, k=10):
+        """Ищет один запрос"""
+        return self.search_batch([query], k)[0]
+
+    def save(self, folder="generated/bm25_index"):
+        """Сохраняет словарь в JSON, массивы постингов — в бинарные файлы"""
+        os.makedirs(folder, exist_ok=True)
+        meta = {
+            'doc_ids': self.doc_ids,
+            'vocabulary': self.vocabulary,
+            'k1': self.k1,
+            'b': self.b,
+            'byteorder': sys.byteorder
+        }
+        with open(os.path.join(folder, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+
+        for name, values in [("postings_docs.bin", self.postings_docs),
+                             ("postings_tfs.bin", self.postings_tfs),
+                             ("doc_lengths.bin", self.doc_lengths)]:
+            with open(os.path.join(folder, name), 'wb') as f:
+                values.tofile(f)
+
+        return folder
+
+    @classmethod
+    def load(cls, folder="generated/bm25_index"):
+        """Открывает сохранённый индекс; массивы постингов отображаются через mmap"""
+        with open(os.path.join(folder, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"Index in {folder} was saved with {meta['byteorder']}-endian byte order")
+
+        mmaps = []
+
+        def map_array(name):
+            with open(os.path.join(folder, name), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return array('I')
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mmaps.append(mapped)
+            return memoryview(mapped).cast('I')
+
+        vocabulary = {term: tuple(entry) for term, entry in meta['vocabulary'].items()}
+        index = cls(meta['doc_ids'], vocabulary, map_array("postings_docs.bin"),
+                    map_array("postings_tfs.bin"), map_array("doc_lengths.bin"), meta['k1'], meta['b'])
+        index._mmaps = mmaps
+        return index
+
+def save_bm25_index(knowledge_base_folder="knowledge_base", generated_folder="generated"):
+    """Строит и сохраняет BM25 индекс базы знаний"""
+    index = BM25Index.build_from_folder(knowledge_base_folder)
+    folder = index.save(os.path.join(generated_folder, "bm25_index"))
+    print(f"✓ BM25 index saved to {folder}/ ({len(index.doc_ids)} documents, {len(index.vocabulary):,} terms)")
+    return index
+
+def main():
+    """Строит индекс по knowledge_base/ и выполняет пробные запросы"""
+    index = save_bm25_index("knowledge_base", "generated")
+    index = BM25Index.load(os.path.join("generated", "bm25_index"))
+
+    queries = sys.argv[1:] or ["elixir ingredients", "settlement defenses", "imperial patrols"]
+    for query, hits in zip(queries, index.search_batch(queries, k=5)):
+        print(f"\n🔎 {query}")
+        for doc_id, score in hits:
+            print(f"  {doc_id}: {score:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# apps/world2/checkpoint.py
+import os
+import pickle
+import random
+import shutil
+
+try:
+    from .document_record import DocumentRecord
+except ImportError:
+    from document_record import DocumentRecord
+
+CHECKPOINT_VERSION = 2
+
+class GenerationCheckpoint:
+    """Контрольные точки генерации документов для продолжения после сбоя
+
+    Документы дописываются в журнал documents.jsonl (только новые с прошлой
+    точки), а в state.pkl атомарно сохраняется всё, от чего зависит
+    продолжение: план и позиция в нём, длина журнала в байтах, состояния
+    random и источника выборов генератора, дата генерации (generated_date
+    в метаданных документов), хеши и SimHash индекс принятых текстов,
+    использованные номера комбинаций шаблонов и мир. Продолжение с точки
+    даёт тот же корпус, что и непрерывный прогон.
+
+    Журнал длиннее записанного в state.pkl (сбой между записями) обрезается
+    при следующем сохранении, лишние строки при загрузке не читаются.
+    """
+
+    STATE_FILE = "state.pkl"
+    DOCUMENTS_FILE = "documents.jsonl"
+
+    def __init__(self, folder="checkpoints", every=1000):
+        self.folder = folder
+        self.every = every  # Документов между точками (0 — только после генерации)
+        self.context = {}  # Данные подготовки (например, калибровка бюджета), нужные при продолжении
+        self.saved_documents = 0
+        self.documents_bytes = 0
+        self.state = None
+
+    @property
+    def state_path(self):
+        return os.path.join(self.folder, self.STATE_FILE)
+
+    @property
+    def documents_path(self):
+        return os.path.join(self.folder, self.DOCUMENTS_FILE)
+
+    def exists(self):
+        return os.path.exists(self.state_path)
+
+    def load(self):
+        """Читает последнюю точку; мир и контекст доступны до создания генератора"""
+        with open(self.state_path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {state.get('version')} in {self.folder}/")
+        self.state = state
+        self.context = state['context']
+        self.saved_documents = state['documents']
+        self.documents_bytes = state['documents_bytes']
+        return state
+
+    def due(self, position):
+        return bool(self.every) and position % self.every == 0
+
+    def save(self, generator, plan, position):
+        """Сохраняет точку после position документов плана"""
+        os.makedirs(self.folder, exist_ok=True)
+        mode = 'r+b' if os.path.exists(self.documents_path) else 'wb'
+        with open(self.documents_path, mode) as f:
+            f.seek(self.documents_bytes)
+            f.truncate()
+            for doc in generator.documents[self.saved_documents:]:
+                f.write(doc.to_record().encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self.documents_bytes = f.tell()
+        self.saved_documents = len(generator.documents)
+
+        content_gen = generator.content_gen
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'plan': plan,
+            'position': position,
+            'documents': self.saved_documents,
+            'documents_bytes': self.documents_bytes,
+            'context': self.context,
+            'world_data': generator.world_data,
+            'terms_map': generator.terms_map,
+            'random': random.getstate(),
+            'rng': generator.rng.getstate() if generator.rng is not random else None,
+            'generated_date': generator.generated_date,
+            'generated_hashes': content_gen.generated_hashes,
+            'near_duplicates': content_gen.near_duplicates,
+            'rejected_drafts': content_gen.rejected_drafts,
+            'template_seed': content_gen.template_seed,
+            'template_draws': {key: space.drawn for key, space in (content_gen.template_spaces or {}).items()}
+        }
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.state_path)
+
+    def restore(self, generator):
+        """Возвращает генератор в состояние точки; результат — (plan, position)"""
+        state = self.state if self.state is not None else self.load()
+
+        with open(self.documents_path, 'rb') as f:
+            documents = [DocumentRecord.from_record(line) for line in f.read(self.documents_bytes).splitlines()]
+        generator.documents = documents
+        generator.doc_ids = [doc.id for doc in documents]
+
+        random.setstate(state['random'])
+        if state['rng'] is not None:
+            generator.rng.setstate(state['rng'])
+        generator.generated_date = state['generated_date']
+
+        content_gen = generator.content_gen
+        content_gen.generated_hashes = state['generated_hashes']
+        content_gen.near_duplicates = state['near_duplicates']
+        content_gen.rejected_drafts = state['rejected_drafts']
+        content_gen.template_seed = state['template_seed']
+        if content_gen.template_spaces is not None:
+            # Пространства, построенные до продолжения (например, для вывода ёмкости), перемешаны
+            # от зерна нового прогона: строим их заново от зерна точки при первом обращении
+            content_gen.resumed_draws.update((key, space.drawn) for key, space in content_gen.template_spaces.items())
+            content_gen.template_spaces.clear()
+            content_gen.resumed_draws.update(state['template_draws'])
+
+        return state['plan'], state['position']
+
+    def clear(self):
+        """Удаляет точки после успешного завершения"""
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
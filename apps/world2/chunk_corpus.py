@@ -0,0 +1,144 @@
+# apps/world2/chunk_corpus.py
+import json
+import os
+import re
+
+HEADING_PATTERN = re.compile(rb'#{1,6} ')
+LIST_ITEM_PATTERN = re.compile(rb'(\d+\.|-) ')
+WHITESPACE = b' \t\r\n'
+
+def _split_long_line(data, start, end, max_bytes):
+    """Режет слишком длинную строку по концу предложения, пробелу или границе символа"""
+    while end - start > max_bytes:
+        limit = start + max_bytes
+        cut = data.rfind(b'. ', start, limit)
+        if cut != -1:
+            cut += 2
+        else:
+            cut = data.rfind(b' ', start, limit)
+            cut = cut + 1 if cut > start else limit
+            # Не разрываем многобайтовый символ UTF-8
+            while cut > start and data[cut] & 0xC0 == 0x80:
+                cut -= 1
+        yield start, cut
+        start = cut
+    yield start, end
+
+def iter_chunks(data, max_bytes=1200, skip_front_matter=True):
+    """Делит байты документа на фрагменты по Markdown структуре за один проход
+
+    Заголовки (#, ##, ...) начинают новый фрагмент, если в текущем уже
+    есть текст; заголовки без текста переходят в следующий фрагмент вместе
+    с ним. Пункты нумерованных и маркированных списков — предпочтительные
+    места разреза при превышении max_bytes. Возвращает (byte_start,
+    byte_end, section); сам текст не копируется.
+    """
+    pos = 0
+    size = len(data)
+    if skip_front_matter and data.startswith(b'---\n'):
+        end = data.find(b'\n---\n', 4)
+        if end != -1:
+            pos = end + len(b'\n---\n')
+
+    section = ''
+    chunk_start = chunk_end = None
+    has_body = False  # Во фрагменте есть текст помимо заголовков
+
+    def finish():
+        # Отрезаем пробельные символы по краям фрагмента
+        start, end = chunk_start, chunk_end
+        while start < end and data[start] in WHITESPACE:
+            start += 1
+        while end > start and data[end - 1] in WHITESPACE:
+            end -= 1
+        return (start, end, section) if end > start else None
+
+    while pos < size:
+        newline = data.find(b'\n', pos)
+        line_end = size if newline == -1 else newline + 1
+        line_size = line_end - pos
+        is_heading = HEADING_PATTERN.match(data, pos) is not None
+        is_item = LIST_ITEM_PATTERN.match(data, pos) is not None
+
+        if has_body and (is_heading or (chunk_end - chunk_start + line_size > max_bytes)):
+            chunk = finish()
+            if chunk:
+                yield chunk
+            chunk_start = chunk_end = None
+            has_body = False
+        elif has_body and is_item and chunk_end - chunk_start + line_size > max_bytes * 0.75:
+            # Пункт списка близко к пределу — разрезаем по нему, а не посреди следующего
+            chunk = finish()
+            if chunk:
+                yield chunk
+            chunk_start = chunk_end = None
+            has_body = False
+
+        if is_heading:
+            section = data[pos:line_end].decode('utf-8').lstrip('#').strip()
+
+        # Незакрытые заголовки без текста остаются в начале фрагмента
+        start = pos if chunk_start is None else chunk_start
+        if line_end - start > max_bytes:
+            for piece_start, piece_end in _split_long_line(data, start, line_end, max_bytes):
+                chunk_start, chunk_end = piece_start, piece_end
+                if piece_end < line_end:
+                    chunk = finish()
+                    if chunk:
+                        yield chunk
+                    chunk_start = chunk_end = None
+        else:
+            chunk_start, chunk_end = start, line_end
+        if not is_heading and data[pos:line_end].strip(WHITESPACE):
+            has_body = True
+
+        pos = line_end
+
+    if chunk_start is not None:
+        chunk = finish()
+        if chunk:
+            yield chunk
+
+def chunk_knowledge_base(knowledge_base_folder="knowledge_base", output_path="generated/chunks.jsonl",
+                         max_bytes=1200, include_text=True):
+    """Пишет фрагменты всех документов базы знаний в JSONL
+
+    Каждый файл читается один раз; смещения указывают в байтах на исходный
+    файл, так что text == file_bytes[byte_start:byte_end].decode('utf-8').
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    total_docs = total_chunks = 0
+
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for filename in sorted(os.listdir(knowledge_base_folder)):
+            if not filename.endswith('.txt'):
+                continue
+            doc_id = filename[:-len('.txt')]
+            with open(os.path.join(knowledge_base_folder, filename), 'rb') as f:
+                data = f.read()
+            view = memoryview(data)
+
+            for number, (start, end, section) in enumerate(iter_chunks(data, max_bytes)):
+                record = {
+                    'doc_id': doc_id,
+                    'chunk_id': f"{doc_id}#{number:04d}",
+                    'source_file': filename,
+                    'byte_start': start,
+                    'byte_end': end,
+                    'section': section
+                }
+                if include_text:
+                    record['text'] = str(view[start:end], 'utf-8')
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                total_chunks += 1
+            total_docs += 1
+
+    print(f"✓ Saved {total_chunks:,} chunks from {total_docs} documents to {output_path}")
+    return total_chunks
+
+def main():
+    """Разбивает knowledge_base/ на фрагменты"""
+    chunk_knowledge_base("knowledge_base", "generated/chunks.jsonl")
+
+if __name__ == "__main__":
+    main()
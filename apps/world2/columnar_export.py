@@ -0,0 +1,250 @@
+# apps/world2/columnar_export.py
+import argparse
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# QA файлы, которые попадают в общую таблицу (few_shot/chain_of_thought — подмножества qa_pairs)
+QA_FILES = ["qa_pairs.jsonl", "fact_qa_pairs.jsonl", "multi_hop_qa_pairs.jsonl"]
+DEFAULT_ROW_GROUP_SIZE = 4096
+
+def require_pyarrow():
+    """Проверяет, что pyarrow установлен"""
+    if pa is None:
+        raise ImportError("Columnar export requires pyarrow: pip install pyarrow")
+
+def split_front_matter(text):
+    """Делит документ на строки front matter и тело"""
+    if text.startswith('---\n'):
+        end = text.find('\n---\n', 4)
+        if end != -1:
+            return text[4:end].split('\n'), text[end + 5:].lstrip('\n')
+    return [], text
+
+def parse_front_matter(lines):
+    """Разбирает front matter: key: value и списки "- item"
+
+    Понимает вывод format_metadata() и простой YAML мира 1 (кавычки у
+    скалярных значений снимаются).
+    """
+    metadata = {}
+    key = None
+    for line in lines:
+        item = line.lstrip()
+        if item.startswith('- ') and key is not None:
+            if not isinstance(metadata[key], list):
+                metadata[key] = []
+            metadata[key].append(item[2:].strip("'\""))
+        elif ':' in line:
+            key, value = line.split(':', 1)
+            metadata[key] = value.strip().strip("'\"")
+    return metadata
+
+def read_front_matter(path):
+    """Читает только front matter файла, не загружая тело"""
+    lines = []
+    with open(path, 'r', encoding='utf-8') as f:
+        if f.readline() != '---\n':
+            return {}
+        for line in f:
+            if line == '---\n':
+                break
+            lines.append(line.rstrip('\n'))
+    return parse_front_matter(lines)
+
+class ColumnarWriter:
+    """Пишет пачки строк в Parquet (одна пачка — одна row group) или Arrow IPC"""
+
+    def __init__(self, path, schema, file_format="parquet"):
+        self.path = path
+        self.schema = schema
+        if file_format == "parquet":
+            self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+        elif file_format == "arrow":
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, schema)
+        else:
+            raise ValueError(f"Unknown columnar format '{file_format}'. Use 'parquet' or 'arrow'")
+        self.file_format = file_format
+        self.rows = 0
+
+    def write_rows(self, rows):
+        """Записывает список словарей как одну row group / record batch"""
+        if not rows:
+            return
+        batch = pa.RecordBatch.from_pylist(rows, schema=self.schema)
+        if self.file_format == "parquet":
+            self._writer.write_batch(batch, row_group_size=len(rows))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(rows)
+
+    def write_stream(self, rows, row_group_size):
+        """Пишет итератор строк пачками по row_group_size"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                self.write_rows(batch)
+                batch = []
+        self.write_rows(batch)
+        return self.rows
+
+    def close(self):
+        self._writer.close()
+        if self.file_format == "arrow":
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def export_documents(knowledge_base_folder, path, file_format="parquet", row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Экспортирует документы: id, type, столбцы метаданных и тело
+
+    Первый проход читает только front matter, чтобы собрать столбцы
+    метаданных всех типов документов; второй потоково пишет row groups.
+    """
+    filenames = sorted(f for f in os.listdir(knowledge_base_folder) if f.endswith('.txt'))
+
+    list_keys = set()
+    metadata_keys = {}
+    for filename in filenames:
+        for key, value in read_front_matter(os.path.join(knowledge_base_folder, filename)).items():
+            metadata_keys.setdefault(key, None)
+            if isinstance(value, list):
+                list_keys.add(key)
+    # doc_id и doc_type уже есть в столбцах id и type
+    metadata_keys = [key for key in metadata_keys if key not in ('doc_id', 'doc_type')]
+
+    fields = [pa.field('id', pa.string()), pa.field('type', pa.string())]
+    for key in metadata_keys:
+        fields.append(pa.field(key, pa.list_(pa.string()) if key in list_keys else pa.string()))
+    fields.append(pa.field('body', pa.string()))
+    schema = pa.schema(fields)
+
+    def rows():
+        for filename in filenames:
+            with open(os.path.join(knowledge_base_folder, filename), 'r', encoding='utf-8') as f:
+                lines, body = split_front_matter(f.read())
+            metadata = parse_front_matter(lines)
+            row = {
+                'id': metadata.get('doc_id', filename[:-len('.txt')]),
+                'type': metadata.get('doc_type'),
+                'body': body
+            }
+            for key in metadata_keys:
+                value = metadata.get(key)
+                if key in list_keys and value is not None and not isinstance(value, list):
+                    value = [value]
+                row[key] = value
+            yield row
+
+    with ColumnarWriter(path, schema, file_format) as writer:
+        return writer.write_stream(rows(), row_group_size)
+
+def export_index(index_path, path, file_format="parquet", row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Экспортирует knowledge_base_index.json"""
+    schema = pa.schema([
+        pa.field('id', pa.string()),
+        pa.field('type', pa.string()),
+        pa.field('title', pa.string()),
+        pa.field('author', pa.string()),
+        pa.field('word_count', pa.int32())
+    ])
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    with ColumnarWriter(path, schema, file_format) as writer:
+        return writer.write_stream(index, row_group_size)
+
+QA_SCHEMA_FIELDS = [
+    ('qa_set', 'string'),
+    ('template_type', 'string'),
+    ('question', 'string'),
+    ('answer', 'string'),
+    ('source_docs', 'list'),
+    ('hard_negatives', 'list'),
+    ('difficulty', 'string'),
+    ('category', 'string'),
+    ('context_required', 'bool'),
+    ('hops', 'int'),
+    ('answer_facts', 'list'),
+    ('reasoning_steps', 'list'),
+    ('answer_spans', 'spans')
+]
+
+def qa_schema():
+    """Схема таблицы QA пар; отсутствующие в паре поля пишутся как null"""
+    types = {
+        'string': pa.string(),
+        'bool': pa.bool_(),
+        'int': pa.int32(),
+        'list': pa.list_(pa.string()),
+        'spans': pa.list_(pa.struct([
+            ('doc_id', pa.string()), ('start', pa.int32()), ('end', pa.int32()), ('text', pa.string())
+        ]))
+    }
+    return pa.schema([pa.field(name, types[kind]) for name, kind in QA_SCHEMA_FIELDS])
+
+def export_qa_pairs(generated_folder, path, file_format="parquet", row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Потоково экспортирует все QA файлы в одну таблицу со столбцом qa_set"""
+    schema = qa_schema()
+
+    def rows():
+        for qa_file in QA_FILES:
+            qa_path = os.path.join(generated_folder, qa_file)
+            if not os.path.exists(qa_path):
+                continue
+            qa_set = qa_file[:-len('.jsonl')]
+            with open(qa_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        qa = json.loads(line)
+                        qa['qa_set'] = qa_set
+                        yield qa
+
+    with ColumnarWriter(path, schema, file_format) as writer:
+        return writer.write_stream(rows(), row_group_size)
+
+def export_columnar(knowledge_base_folder="knowledge_base", generated_folder="generated", file_format="parquet",
+                    row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Экспортирует документы, индекс и QA пары в generated/columnar/"""
+    require_pyarrow()
+    folder = os.path.join(generated_folder, "columnar")
+    os.makedirs(folder, exist_ok=True)
+    extension = "parquet" if file_format == "parquet" else "arrow"
+
+    counts = {
+        'documents': export_documents(
+            knowledge_base_folder, os.path.join(folder, f"documents.{extension}"), file_format, row_group_size),
+        'knowledge_base_index': export_index(
+            os.path.join(generated_folder, "knowledge_base_index.json"),
+            os.path.join(folder, f"knowledge_base_index.{extension}"), file_format, row_group_size),
+        'qa_pairs': export_qa_pairs(
+            generated_folder, os.path.join(folder, f"qa_pairs.{extension}"), file_format, row_group_size)
+    }
+
+    summary = ", ".join(f"{name}: {rows:,}" for name, rows in counts.items())
+    print(f"✓ Columnar export saved to {folder}/ ({summary} rows)")
+    return counts
+
+def main(argv=None):
+    """Экспортирует корпус в Parquet/Arrow"""
+    parser = argparse.ArgumentParser(description="Export the generated corpus to Parquet or Arrow IPC")
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE)
+    parser.add_argument('--knowledge-base', default="knowledge_base")
+    parser.add_argument('--generated', default="generated")
+    args = parser.parse_args(argv)
+
+    return export_columnar(args.knowledge_base, args.generated, args.format, args.row_group_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# apps/world2/corpus_planner.py
+import json
+import math
+import os
+import random
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    from .text_builder import count_words, trim_to_words
+except ImportError:
+    from text_builder import count_words, trim_to_words
+
+# Допустимая относительная ошибка оценки токенов на проверочной выборке корпуса
+ESTIMATOR_TOLERANCE = 0.05
+
+# Приближение BPE без внешних зависимостей: буквы кусками до 6, цифры и знаки по одному
+REFERENCE_TOKEN_PATTERN = re.compile(r"[^\W\d_]{1,6}|\d|[^\w\s]")
+
+def reference_token_count(text):
+    """Эталонное число токенов: tiktoken (cl100k_base), если установлен, иначе регулярное приближение"""
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("cl100k_base").encode(text, disallowed_special=()))
+    return len(REFERENCE_TOKEN_PATTERN.findall(text))
+
+def sample_generator(generator):
+    """Одноразовый генератор того же мира для калибровки
+
+    Его хеши, SimHash отпечатки и выборы отделены от основного генератора;
+    из основного потока берётся только зерно (одно число).
+    """
+    return type(generator)(generator.world_data, generator.terms_map,
+                           rng=random.Random(generator.rng.getrandbits(64)))
+
+class TokenEstimator:
+    """Быстрая оценка токенов через число слов и коэффициент по типу и длине документа
+
+    Коэффициенты калибруются по документам шаблонов эталонным токенизатором,
+    после чего оценка стоит одного split() и не требует токенизатора.
+    У коротких документов больше доля front matter и ссылок, поэтому
+    коэффициент свой для каждой длины из распределения плана, а между
+    калиброванными длинами интерполируется.
+    """
+
+    # Токенов на слово до калибровки (для выбора длины образцов)
+    INITIAL_RATIO = 1.3
+
+    def __init__(self, tokens_per_word, front_matter_words=None, tokenizer=None):
+        # doc_type -> [[слов в документе, токенов на слово], ...] по возрастанию длины
+        self.tokens_per_word = {doc_type: sorted(map(tuple, points)) for doc_type, points in tokens_per_word.items()}
+        self.front_matter_words = front_matter_words or {}  # doc_type -> слов во front matter
+        self.tokenizer = tokenizer
+        ratios = [ratio for points in self.tokens_per_word.values() for _, ratio in points]
+        self.default_ratio = sum(ratios) / len(ratios) if ratios else self.INITIAL_RATIO
+
+    @classmethod
+    def calibrate(cls, generator, doc_types, lengths=(2600,), samples=3):
+        """Калибрует коэффициенты по образцам каждого типа и каждой длины (в токенах)
+
+        Образцы собираются в маленький корпус с перекрёстными ссылками, как
+        настоящие документы плана. Его создаёт одноразовый генератор того же
+        мира, поэтому в основной корпус образцы не попадают.
+        """
+        sample = sample_generator(generator)
+        # Тело документа плана короче длины в токенах на front matter и ссылки, поэтому
+        # образцы берутся и вдвое короче: настоящие документы попадают внутрь калиброванных длин
+        plan = [(doc_type, max(1, round(length * scale / cls.INITIAL_RATIO)))
+                for doc_type in doc_types for length in sorted(lengths) for scale in (0.5, 1)
+                for _ in range(samples)]
+        documents = sample.generate_document_set(plan=plan)
+
+        measured = {}
+        front_matter = {}
+        for (doc_type, words), doc in zip(plan, documents):
+            entry = measured.setdefault(doc_type, {}).setdefault(words, [0, 0])
+            entry[0] += count_words(doc['content'])
+            entry[1] += reference_token_count(doc['content'])
+            front_matter.setdefault(doc_type, []).append(count_words(doc['content']) - count_words(doc['raw_content']))
+
+        tokens_per_word = {
+            doc_type: [(words / samples, tokens / words) for words, tokens in buckets.values()]
+            for doc_type, buckets in measured.items()
+        }
+        front_matter_words = {doc_type: sum(found) / len(found) for doc_type, found in front_matter.items()}
+        tokenizer = "tiktoken:cl100k_base" if tiktoken is not None else "regex"
+        return cls(tokens_per_word, front_matter_words, tokenizer)
+
+    def ratio(self, doc_type, words=None):
+        """Токенов на слово для документа типа doc_type длиной words слов (с front matter)"""
+        points = self.tokens_per_word.get(doc_type)
+        if not points:
+            return self.default_ratio
+        if words is None:
+            return sum(ratio for _, ratio in points) / len(points)
+        if words <= points[0][0]:
+            return points[0][1]
+        for (low_words, low_ratio), (high_words, high_ratio) in zip(points, points[1:]):
+            if words <= high_words:
+                # Линейно по логарифму длины между соседними калиброванными длинами
+                share = math.log(words / low_words) / math.log(high_words / low_words)
+                return low_ratio + (high_ratio - low_ratio) * share
+        return points[-1][1]
+
+    def estimate(self, text, doc_type=None):
+        """Оценка числа токенов текста"""
+        words = count_words(text)
+        return words * self.ratio(doc_type, words)
+
+    def document_tokens(self, body_words, doc_type=None):
+        """Оценка токенов документа с телом из body_words слов (с учётом front matter)"""
+        words = body_words + self.front_matter_words.get(doc_type, 0)
+        return words * self.ratio(doc_type, words)
+
+    def words_for(self, tokens, doc_type=None):
+        """Сколько слов тела дают tokens токенов документа (с учётом front matter)"""
+        words = tokens / self.ratio(doc_type)
+        for _ in range(3):
+            # Коэффициент зависит от длины: уточняем длину по коэффициенту этой длины
+            words = tokens / self.ratio(doc_type, max(words, 1))
+        return max(1, round(words - self.front_matter_words.get(doc_type, 0)))
+
+    def to_dict(self):
+        return {
+            'tokenizer': self.tokenizer,
+            'tokens_per_word': {doc_type: [list(point) for point in points]
+                                for doc_type, points in self.tokens_per_word.items()},
+            'front_matter_words': self.front_matter_words
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['tokens_per_word'], data['front_matter_words'], data['tokenizer'])
+
+class CorpusPlanner:
+    """Раскладывает бюджет токенов корпуса на документы заданных типов и длин
+
+    План строится заранее (тип и длина в словах для каждого документа),
+    поэтому генерация не создаёт лишних документов; прирост от перекрёстных
+    ссылок резервируется заранее, а остаток снимается с самых длинных документов.
+    """
+
+    def __init__(self, estimator, type_distribution, length_distribution):
+        self.estimator = estimator
+        self.type_distribution = type_distribution  # doc_type -> вес
+        self.length_distribution = length_distribution  # длина в токенах -> вес
+
+    def plan(self, total_tokens, overhead_tokens=0):
+        """Список (doc_type, target_words) на total_tokens токенов
+
+        overhead_tokens — сколько токенов в среднем добавят документу
+        проходы перекрёстных ссылок; на столько уменьшается длина тела.
+        """
+        type_total = sum(self.type_distribution.values())
+        lengths = sorted(self.length_distribution.items())
+        length_total = sum(weight for _, weight in lengths)
+
+        plan = []
+        for doc_type, weight in self.type_distribution.items():
+            budget = total_tokens * weight / type_total
+            counts = [0] * len(lengths)
+            planned = 0
+            while budget - planned >= 1:
+                # Берём длину, которой больше всего не хватает до её доли
+                issued = sum(counts) + 1
+                bucket = max(range(len(lengths)),
+                             key=lambda i: lengths[i][1] / length_total * issued - counts[i])
+                tokens = lengths[bucket][0]
+                if budget - planned < tokens * 1.5:
+                    # Последний документ типа забирает остаток, чтобы не плодить обрывки
+                    tokens = budget - planned
+                counts[bucket] += 1
+                planned += tokens
+                plan.append((doc_type, self.estimator.words_for(max(tokens - overhead_tokens, 1), doc_type)))
+        return plan
+
+    def calibrate_overhead(self, generator, plan, sample_size=50):
+        """Средний прирост документа в токенах от перекрёстных ссылок
+
+        Измеряется на отдельном маленьком корпусе того же мира из
+        равномерной выборки плана; в основной корпус он не попадает.
+        """
+        step = max(1, len(plan) // sample_size)
+        sample_plan = plan[::step][:sample_size]
+        sample = sample_generator(generator)
+        documents = sample.generate_document_set(plan=sample_plan)
+        planned = sum(self.estimator.document_tokens(words, doc_type) for doc_type, words in sample_plan)
+        actual = sum(self.estimator.estimate(doc['content'], doc['type']) for doc in documents)
+        return max(0.0, (actual - planned) / len(documents))
+
+    def planned_tokens(self, plan):
+        """Оценка токенов документов плана до перекрёстных ссылок"""
+        return sum(self.estimator.document_tokens(words, doc_type) for doc_type, words in plan)
+
+    def corpus_tokens(self, documents):
+        return sum(self.estimator.estimate(doc['content'], doc['type']) for doc in documents)
+
+    def settle(self, generator, total_tokens):
+        """Подгоняет длину самых больших документов, чтобы оценка корпуса совпала с бюджетом
+
+        Остаточное отклонение после перекрёстных ссылок снимается с самого
+        длинного документа (дописыванием или обрезкой тела ровно по слову);
+        если его не хватает, со следующего по длине.
+        """
+        deviation = total_tokens - self.corpus_tokens(generator.documents)
+        by_length = sorted(generator.documents, key=lambda doc: len(doc['raw_content']), reverse=True)
+
+        for doc in by_length:
+            ratio = self.estimator.ratio(doc['type'], count_words(doc['content']))
+            if abs(deviation) < ratio / 2:
+                break
+            before = self.estimator.estimate(doc['content'], doc['type'])
+            body_words = max(1, count_words(doc['raw_content']) + round(deviation / ratio))
+
+            if body_words < count_words(doc['raw_content']):
+                body = trim_to_words(doc['raw_content'], body_words, exact=True)
+                # Факты обрезанного хвоста больше не в документе
+                doc['facts'] = [fact for fact in doc['facts'] if fact[4] <= len(body)]
+            else:
+                generator.content_gen.begin_document()
+                body = generator._extend_to_length(doc['type'], doc['raw_content'], body_words, exact=True)
+                body, entities, facts = generator.content_gen.end_document(body)
+                for name, category in entities.items():
+                    doc['entities'].setdefault(name, category)
+                doc['facts'].extend(facts)
+
+            generator.set_document_body(doc, body)
+            deviation -= self.estimator.estimate(doc['content'], doc['type']) - before
+
+        return round(deviation)
+
+    def report(self, documents, total_tokens, path=None, sample_size=20, tolerance=ESTIMATOR_TOLERANCE):
+        """Статистика корпуса: токены по типам, длины, точность оценки на выборке"""
+        by_type = {}
+        for doc in documents:
+            tokens = self.estimator.estimate(doc['content'], doc['type'])
+            entry = by_type.setdefault(doc['type'], {'documents': 0, 'tokens': 0.0, 'min_tokens': None, 'max_tokens': 0})
+            entry['documents'] += 1
+            entry['tokens'] += tokens
+            entry['min_tokens'] = tokens if entry['min_tokens'] is None else min(entry['min_tokens'], tokens)
+            entry['max_tokens'] = max(entry['max_tokens'], tokens)
+        for entry in by_type.values():
+            entry['tokens'] = round(entry['tokens'])
+            entry['min_tokens'] = round(entry['min_tokens'])
+            entry['max_tokens'] = round(entry['max_tokens'])
+
+        # Проверка оценщика эталонным токенизатором на равномерной выборке
+        step = max(1, len(documents) // sample_size)
+        sample = documents[::step][:sample_size]
+        estimated = sum(self.estimator.estimate(doc['content'], doc['type']) for doc in sample)
+        reference = sum(reference_token_count(doc['content']) for doc in sample)
+
+        estimated_total = round(self.corpus_tokens(documents))
+        relative_error = round((estimated - reference) / reference, 4) if reference else 0.0
+        report = {
+            'token_budget': total_tokens,
+            'estimated_tokens': estimated_total,
+            'deviation_tokens': estimated_total - total_tokens,
+            'documents': len(documents),
+            'by_type': by_type,
+            'estimator': self.estimator.to_dict(),
+            'estimator_check': {
+                'sample_documents': len(sample),
+                'estimated_tokens': round(estimated),
+                'reference_tokens': reference,
+                'relative_error': relative_error,
+                'tolerance': tolerance,
+                'within_tolerance': abs(relative_error) <= tolerance
+            }
+        }
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+def parse_length_distribution(spec):
+    """Разбирает "500:0.6,4000:0.3,20000:0.1" (длина в токенах: вес)"""
+    distribution = {}
+    for item in spec.split(','):
+        length, _, weight = item.partition(':')
+        distribution[int(length)] = float(weight or 1)
+    return distribution
+
+def generate_corpus_for_budget(generator, total_tokens, type_distribution=None, length_distribution=None,
+                               report_path=None, checkpoint=None, shard=None, tolerance=ESTIMATOR_TOLERANCE):
+    """Генерирует корпус ровно на total_tokens токенов (по калиброванной оценке)
+
+    Калибровка берёт из потока генератора зёрна одноразовых генераторов,
+    поэтому при продолжении с контрольной точки она не повторяется, а
+    берётся из точки.
+    Шард (Shard) генерирует свой диапазон общего плана и подгоняется
+    под долю бюджета, приходящуюся на этот диапазон. Коэффициенты оценки
+    калибруются на длинах распределения; если на проверочной выборке
+    ошибка оценки больше tolerance, печатается предупреждение.
+    """
+    type_distribution = type_distribution or generator.doc_distribution
+    if not length_distribution:
+        length_distribution = {1000: 1.0}
+    calibration = checkpoint.context.get('budget') if checkpoint is not None else None
+
+    if calibration is not None:
+        estimator = TokenEstimator.from_dict(calibration['estimator'])
+        planner = CorpusPlanner(estimator, type_distribution, length_distribution)
+        overhead = calibration['overhead']
+    else:
+        estimator = TokenEstimator.calibrate(generator, list(type_distribution), list(length_distribution))
+        planner = CorpusPlanner(estimator, type_distribution, length_distribution)
+        overhead = planner.calibrate_overhead(generator, planner.plan(total_tokens))
+        if checkpoint is not None:
+            checkpoint.context['budget'] = {'estimator': estimator.to_dict(), 'overhead': overhead}
+
+    plan = planner.plan(total_tokens, overhead)
+    print(f"  Planned {len(plan):,} documents for {total_tokens:,} tokens "
+          f"({overhead:.0f} tokens per document reserved for cross-references)")
+    documents = generator.generate_document_set(plan=plan, checkpoint=checkpoint, shard=shard)
+    if shard is not None:
+        start, stop = shard.range(len(plan))
+        total_tokens = round(total_tokens * planner.planned_tokens(plan[start:stop]) / planner.planned_tokens(plan))
+    planner.settle(generator, total_tokens)
+
+    report = planner.report(documents, total_tokens, report_path, tolerance=tolerance)
+    check = report['estimator_check']
+    print(f"✓ Corpus: {report['estimated_tokens']:,} estimated tokens in {report['documents']:,} documents "
+          f"(estimator error on sample: {check['relative_error']:+.1%})")
+    if not check['within_tolerance']:
+        print(f"⚠️  Token estimate is off by {check['relative_error']:+.1%} on the sample "
+              f"(tolerance {tolerance:.0%}): the corpus size in reference tokens differs from the budget")
+    return documents, report
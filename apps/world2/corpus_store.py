@@ -0,0 +1,285 @@
+# apps/world2/corpus_store.py
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+try:
+    from .bm25_index import tokenize
+    from .columnar_export import split_front_matter, parse_front_matter, QA_FILES
+except ImportError:
+    from bm25_index import tokenize
+    from columnar_export import split_front_matter, parse_front_matter, QA_FILES
+
+# Идентификаторы документов обоих миров: ENCY_001, JOURN_003, DECR_DECR_001
+DOC_ID_PATTERN = re.compile(r'\b[A-Z]+(?:_[A-Z]+)?_\d{3,}\b')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    type TEXT,
+    title TEXT,
+    author TEXT,
+    word_count INTEGER,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_type ON documents(type);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    doc_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (doc_id, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metadata_key_value ON metadata(key, value);
+
+CREATE TABLE IF NOT EXISTS cross_references (
+    source_id TEXT NOT NULL,
+    target_id TEXT NOT NULL,
+    PRIMARY KEY (source_id, target_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cross_references_target ON cross_references(target_id);
+
+CREATE TABLE IF NOT EXISTS qa_pairs (
+    id INTEGER PRIMARY KEY,
+    qa_set TEXT,
+    template_type TEXT,
+    question TEXT NOT NULL,
+    answer TEXT,
+    difficulty TEXT,
+    category TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS qa_pairs_template_type ON qa_pairs(template_type);
+
+CREATE TABLE IF NOT EXISTS qa_sources (
+    qa_id INTEGER NOT NULL,
+    doc_id TEXT NOT NULL,
+    PRIMARY KEY (qa_id, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS qa_sources_doc ON qa_sources(doc_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    body, content='documents', content_rowid='rowid'
+);
+"""
+
+class CorpusStore:
+    """Корпус в одном файле SQLite: документы, метаданные, ссылки, QA и FTS5
+
+    Запись идёт пачками через executemany в одной транзакции на вызов;
+    журнал WAL позволяет читать базу во время записи. Полнотекстовый
+    индекс FTS5 ссылается на тела документов (external content), поэтому
+    текст хранится один раз.
+    """
+
+    def __init__(self, path="generated/corpus.db"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def clear(self):
+        """Удаляет все данные (перед повторной записью корпуса)"""
+        with self.conn:
+            for table in ("qa_sources", "qa_pairs", "cross_references", "metadata", "documents"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("INSERT INTO documents_fts(documents_fts) VALUES('delete-all')")
+
+    def add_documents(self, documents):
+        """Записывает документы: словари с id, type, metadata и body
+
+        Ссылки на другие документы извлекаются из тела и сохраняются
+        в cross_references; после записи перестраивается FTS5 индекс.
+        """
+        documents = list(documents)
+        known_ids = {doc['id'] for doc in documents}
+        known_ids.update(row[0] for row in self.conn.execute("SELECT id FROM documents"))
+
+        def metadata_rows():
+            for doc in documents:
+                for key, value in doc['metadata'].items():
+                    if isinstance(value, (list, dict)):
+                        value = json.dumps(value, ensure_ascii=False)
+                    yield doc['id'], key, str(value)
+
+        def reference_rows():
+            for doc in documents:
+                for target in dict.fromkeys(DOC_ID_PATTERN.findall(doc['body'])):
+                    if target in known_ids and target != doc['id']:
+                        yield doc['id'], target
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO documents (id, type, title, author, word_count, body) VALUES (?, ?, ?, ?, ?, ?)",
+                ((doc['id'], doc['type'], doc['metadata'].get('title'), doc['metadata'].get('author'),
+                  len(doc['body'].split()), doc['body']) for doc in documents))
+            self.conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", metadata_rows())
+            self.conn.executemany("INSERT OR IGNORE INTO cross_references VALUES (?, ?)", reference_rows())
+            self.conn.execute("INSERT INTO documents_fts(documents_fts) VALUES('rebuild')")
+
+        return len(documents)
+
+    def add_qa_pairs(self, qa_pairs, qa_set="qa_pairs"):
+        """Записывает QA пары; полная пара хранится в data как JSON"""
+        count = 0
+        with self.conn:
+            cursor = self.conn.cursor()
+            next_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM qa_pairs").fetchone()[0]
+            rows = []
+            sources = []
+            for qa in qa_pairs:
+                qa_id = next_id + count
+                rows.append((qa_id, qa_set, qa.get('template_type'), qa['question'], qa.get('answer'),
+                             qa.get('difficulty'), qa.get('category'), json.dumps(qa, ensure_ascii=False)))
+                sources.extend((qa_id, doc_id) for doc_id in dict.fromkeys(qa.get('source_docs', [])))
+                count += 1
+            cursor.executemany("INSERT INTO qa_pairs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            cursor.executemany("INSERT OR IGNORE INTO qa_sources VALUES (?, ?)", sources)
+        return count
+
+    def get_document(self, doc_id):
+        """Возвращает документ с метаданными или None"""
+        row = self.conn.execute("SELECT id, type, body FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        metadata = dict(self.conn.execute("SELECT key, value FROM metadata WHERE doc_id = ?", (doc_id,)))
+        return {'id': row[0], 'type': row[1], 'metadata': metadata, 'body': row[2]}
+
+    def documents_with(self, key, value):
+        """Идентификаторы документов с заданным значением метаданных"""
+        return [row[0] for row in self.conn.execute(
+            "SELECT doc_id FROM metadata WHERE key = ? AND value = ? ORDER BY doc_id", (key, value))]
+
+    def references_from(self, doc_id):
+        return [row[0] for row in self.conn.execute(
+            "SELECT target_id FROM cross_references WHERE source_id = ? ORDER BY target_id", (doc_id,))]
+
+    def references_to(self, doc_id):
+        return [row[0] for row in self.conn.execute(
+            "SELECT source_id FROM cross_references WHERE target_id = ? ORDER BY source_id", (doc_id,))]
+
+    def search(self, query, k=10):
+        """Полнотекстовый поиск FTS5: список (doc_id, score), лучшие первыми
+
+        Запрос разбивается на токены и объединяется через OR, поэтому
+        вопросы на естественном языке не ломают синтаксис MATCH.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        rows = self.conn.execute(
+            "SELECT d.id, bm25(documents_fts) FROM documents_fts "
+            "JOIN documents d ON d.rowid = documents_fts.rowid "
+            "WHERE documents_fts MATCH ? ORDER BY bm25(documents_fts) LIMIT ?", (match, k))
+        # bm25() в SQLite отрицательный: чем меньше, тем лучше
+        return [(doc_id, -score) for doc_id, score in rows]
+
+    def search_batch(self, queries, k=10):
+        """Интерфейс ретривера для evaluate_retrieval.py"""
+        return [self.search(query, k) for query in queries]
+
+    def counts(self):
+        """Количество строк в основных таблицах"""
+        return {
+            table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("documents", "metadata", "cross_references", "qa_pairs")
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_documents_folder(docs_folder):
+    """Читает документы с front matter из папки (knowledge_base/ или documents/ мира 1)"""
+    for filename in sorted(os.listdir(docs_folder)):
+        if not filename.endswith('.txt'):
+            continue
+        with open(os.path.join(docs_folder, filename), 'r', encoding='utf-8') as f:
+            lines, body = split_front_matter(f.read())
+        metadata = parse_front_matter(lines)
+        yield {
+            'id': metadata.get('doc_id', filename[:-len('.txt')]),
+            'type': metadata.get('doc_type'),
+            'metadata': metadata,
+            'body': body
+        }
+
+def read_qa_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def ingest_folder(db_path, docs_folder, qa_paths=()):
+    """Загружает корпус с диска в SQLite (подходит для вывода обоих генераторов)"""
+    with CorpusStore(db_path) as store:
+        store.clear()
+        store.add_documents(read_documents_folder(docs_folder))
+        for qa_path in qa_paths:
+            if os.path.exists(qa_path):
+                qa_set = os.path.basename(qa_path)[:-len('.jsonl')]
+                store.add_qa_pairs(read_qa_file(qa_path), qa_set)
+        return store.counts()
+
+def save_corpus_store(documents, generated_folder="generated"):
+    """Сохраняет сгенерированный корпус мира 2 в generated/corpus.db"""
+    db_path = os.path.join(generated_folder, "corpus.db")
+    with CorpusStore(db_path) as store:
+        store.clear()
+        store.add_documents({
+            'id': doc['id'],
+            'type': doc['type'],
+            'metadata': doc['metadata'],
+            'body': doc['raw_content']
+        } for doc in documents)
+        for qa_file in QA_FILES:
+            qa_path = os.path.join(generated_folder, qa_file)
+            if os.path.exists(qa_path):
+                store.add_qa_pairs(read_qa_file(qa_path), qa_file[:-len('.jsonl')])
+        counts = store.counts()
+
+    print(f"✓ SQLite corpus store saved to {db_path} "
+          f"({counts['documents']} documents, {counts['cross_references']} references, {counts['qa_pairs']:,} QA pairs)")
+    return counts
+
+def main(argv=None):
+    """Загружает корпус с диска в SQLite базу"""
+    parser = argparse.ArgumentParser(description="Load a generated corpus into a SQLite database with FTS5")
+    parser.add_argument('--documents', default="knowledge_base", help="Folder with .txt documents")
+    parser.add_argument('--qa', nargs='*', default=None, help="QA JSONL files (default: generated/*qa_pairs.jsonl)")
+    parser.add_argument('--output', default="generated/corpus.db")
+    parser.add_argument('--world1', metavar='FOLDER', default=None,
+                        help="Load world 1 output instead (documents/ and qa_pairs.jsonl in FOLDER)")
+    parser.add_argument('--search', default=None, help="Run a full-text query after loading")
+    args = parser.parse_args(argv)
+
+    if args.world1:
+        docs_folder = os.path.join(args.world1, "documents")
+        qa_paths = args.qa if args.qa is not None else [os.path.join(args.world1, "qa_pairs.jsonl")]
+    else:
+        docs_folder = args.documents
+        qa_paths = args.qa if args.qa is not None else [os.path.join("generated", name) for name in QA_FILES]
+
+    counts = ingest_folder(args.output, docs_folder, qa_paths)
+    print(f"✓ Loaded {docs_folder}/ into {args.output}: " + ", ".join(f"{table}: {n:,}" for table, n in counts.items()))
+
+    if args.search:
+        with CorpusStore(args.output) as store:
+            for doc_id, score in store.search(args.search, k=5):
+                print(f"  {doc_id}: {score:.3f}")
+
+    return counts
+
+if __name__ == "__main__":
+    main()
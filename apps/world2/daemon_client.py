@@ -0,0 +1,132 @@
+# apps/world2/daemon_client.py
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# Только стандартная библиотека: клиент запускается за миллисекунды, вся работа — в демоне
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"world2_generation_daemon_{os.getuid()}.sock")
+
+class DaemonError(Exception):
+    """Демон недоступен или вернул ошибку на запрос"""
+
+class DaemonClient:
+    """Тонкий клиент демона генерации (generation_daemon.py)
+
+    Запрос и ответ — по одной строке JSON; соединение открывается при
+    первом запросе и используется для всех следующих. Пути отправляются
+    абсолютными: у демона своя рабочая папка.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._socket = None
+        self._reader = None
+
+    def connect(self):
+        if self._socket is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.socket_path)
+            except OSError as e:
+                connection.close()
+                raise DaemonError(f"No generation daemon on {self.socket_path}: {e}") from e
+            self._socket = connection
+            self._reader = connection.makefile('rb')
+        return self
+
+    def close(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = self._reader = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, command, **params):
+        """Отправляет команду и возвращает result ответа; ошибка демона — DaemonError"""
+        self.connect()
+        message = json.dumps({'command': command, **params}, ensure_ascii=False) + '\n'
+        try:
+            self._socket.sendall(message.encode('utf-8'))
+            line = self._reader.readline()
+        except OSError as e:
+            self.close()
+            raise DaemonError(f"Generation daemon on {self.socket_path} did not answer: {e}") from e
+        if not line:
+            self.close()
+            raise DaemonError("Generation daemon closed the connection")
+        response = json.loads(line)
+        if not response['ok']:
+            raise DaemonError(response['error'])
+        return response['result']
+
+    def ping(self):
+        return self.request('ping')
+
+    def generate(self, output_dir, seed=None, args=(), validate=True):
+        """Генерирует корпус в output_dir (аргументы — как у fictional_document_generator.py)"""
+        return self.request('generate', output_dir=os.path.abspath(output_dir), seed=seed,
+                            args=list(args), validate=validate)
+
+    def validate(self, output_dir):
+        return self.request('validate', output_dir=os.path.abspath(output_dir))
+
+    def search(self, output_dir, queries, k=10):
+        """BM25 поиск по корпусу в output_dir; индекс держится в памяти демона"""
+        return self.request('search', output_dir=os.path.abspath(output_dir), queries=list(queries), k=k)
+
+    def shutdown(self):
+        return self.request('shutdown')
+
+def main(argv=None):
+    """Отправляет одну команду демону генерации и печатает ответ в JSON"""
+    parser = argparse.ArgumentParser(description="Send a request to the warm generation daemon")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Daemon socket path")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('ping', help="Check that the daemon is up")
+    generate = commands.add_parser('generate', allow_abbrev=False,
+                                   help="Generate a corpus; other arguments go to the generator")
+    generate.add_argument('output_dir')
+    generate.add_argument('--seed', type=int, default=None)
+    generate.add_argument('--no-validate', action='store_true', help="Skip corpus validation")
+    validate = commands.add_parser('validate', help="Validate a generated corpus")
+    validate.add_argument('output_dir')
+    search = commands.add_parser('search', help="BM25 search over a generated corpus")
+    search.add_argument('output_dir')
+    search.add_argument('queries', nargs='+')
+    search.add_argument('-k', type=int, default=10)
+    commands.add_parser('shutdown', help="Stop the daemon")
+    args, generator_args = parser.parse_known_args(argv)
+    if generator_args and args.command != 'generate':
+        parser.error(f"unrecognized arguments: {' '.join(generator_args)}")
+
+    try:
+        with DaemonClient(args.socket) as client:
+            if args.command == 'generate':
+                result = client.generate(args.output_dir, args.seed, generator_args, not args.no_validate)
+            elif args.command == 'validate':
+                result = client.validate(args.output_dir)
+            elif args.command == 'search':
+                result = client.search(args.output_dir, args.queries, args.k)
+            else:
+                result = client.request(args.command)
+    except DaemonError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if isinstance(result, dict) and result.get('status') == 'failed':
+        sys.exit(1)
+    return result
+
+if __name__ == "__main__":
+    main()
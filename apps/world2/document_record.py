@@ -0,0 +1,101 @@
+# apps/world2/document_record.py
+import json
+
+def format_metadata(metadata):
+    """Форматирует метаданные без yaml"""
+    lines = []
+    for key, value in metadata.items():
+        if isinstance(value, list):
+            lines.append(f"{key}:")
+            for item in value:
+                lines.append(f"  - {item}")
+        else:
+            lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+def document_id(doc_type, index):
+    """Идентификатор index-го документа типа (нумерация с 1 внутри типа)"""
+    return f"{doc_type.upper()[:4]}_{index:03d}"
+
+def plan_document_ids(plan):
+    """Идентификаторы всех документов плана [(doc_type, target_words), ...] по порядку"""
+    type_counts = {}
+    ids = []
+    for doc_type, _ in plan:
+        type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
+        ids.append(document_id(doc_type, type_counts[doc_type]))
+    return ids
+
+class DocumentRecord:
+    """Компактная запись документа: одно тело, front matter собирается по запросу
+
+    Раньше документ был словарём, где тело хранилось дважды: в raw_content
+    и внутри content вместе с метаданными. Здесь хранится только body,
+    а content рендерится при обращении. Доступ по ключам (doc['content'],
+    doc.get('facts'), 'raw_content' in doc) сохранён для остального кода.
+    """
+
+    __slots__ = ('id', 'type', 'metadata', 'body', 'entities', 'facts')
+
+    KEYS = ('id', 'type', 'content', 'metadata', 'raw_content', 'entities', 'facts')
+
+    def __init__(self, doc_id, doc_type, metadata, body, entities=None, facts=None):
+        self.id = doc_id
+        self.type = doc_type
+        self.metadata = metadata
+        self.body = body
+        self.entities = entities if entities is not None else {}
+        self.facts = facts if facts is not None else []
+
+    @property
+    def raw_content(self):
+        return self.body
+
+    @raw_content.setter
+    def raw_content(self, body):
+        self.body = body
+
+    @property
+    def content(self):
+        """Полный текст документа с front matter"""
+        return f"---\n{format_metadata(self.metadata)}\n---\n\n{self.body}"
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key == 'content':
+            raise KeyError("content is rendered from metadata and body; set raw_content instead")
+        if key not in self.KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self):
+        return {key: self[key] for key in self.KEYS}
+
+    # Поля строки documents.jsonl: content не хранится, он собирается из метаданных и тела
+    RECORD_KEYS = ('id', 'type', 'metadata', 'raw_content', 'entities', 'facts')
+
+    def to_record(self):
+        """Строка documents.jsonl (контрольные точки и выходы шардов)"""
+        return json.dumps({key: self[key] for key in self.RECORD_KEYS}, ensure_ascii=False) + '\n'
+
+    @classmethod
+    def from_record(cls, line):
+        record = json.loads(line)
+        return cls(record['id'], record['type'], record['metadata'], record['raw_content'],
+                   record['entities'], [tuple(fact) for fact in record['facts']])
+
+    def __repr__(self):
+        return f"DocumentRecord({self.id!r}, {self.type!r}, {len(self.body)} chars)"
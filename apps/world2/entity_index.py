@@ -0,0 +1,114 @@
+# apps/world2/entity_index.py
+import json
+import os
+
+class EntityIndex:
+    """Инвертированный индекс: сущность мира -> документы и смещения упоминаний"""
+
+    def __init__(self, doc_ids=None, entities=None):
+        self.doc_ids = list(doc_ids or [])
+        # name -> {"category": str, "postings": {doc_id: [offset, ...]}}
+        self.entities = entities or {}
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Строит индекс по сущностям, которые генератор вставил в документы"""
+        index = cls([doc['id'] for doc in documents])
+
+        for doc in documents:
+            content = doc['content']
+            for name, category in doc.get('entities', {}).items():
+                offsets = find_mentions(content, name)
+                if not offsets:
+                    continue
+                entry = index.entities.setdefault(name, {'category': category, 'postings': {}})
+                entry['postings'][doc['id']] = offsets
+
+        return index
+
+    @classmethod
+    def merge(cls, indexes):
+        """Объединяет индексы непересекающихся наборов документов (шардов) по порядку"""
+        merged = cls()
+        for index in indexes:
+            merged.doc_ids.extend(index.doc_ids)
+            for name, entry in index.entities.items():
+                merged_entry = merged.entities.setdefault(name, {'category': entry['category'], 'postings': {}})
+                merged_entry['postings'].update(entry['postings'])
+        return merged
+
+    def documents_for(self, name):
+        """Возвращает документы, в которых упоминается сущность"""
+        entry = self.entities.get(name)
+        return list(entry['postings']) if entry else []
+
+    def offsets(self, name, doc_id):
+        """Возвращает смещения упоминаний сущности в документе"""
+        entry = self.entities.get(name)
+        if not entry:
+            return []
+        return entry['postings'].get(doc_id, [])
+
+    def document_count(self, name):
+        """Количество документов, упоминающих сущность"""
+        entry = self.entities.get(name)
+        return len(entry['postings']) if entry else 0
+
+    def __contains__(self, name):
+        return name in self.entities
+
+    def save(self, path="generated/entity_index.json"):
+        """Сохраняет индекс в компактном виде (документы по номерам)"""
+        position = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        data = {
+            'documents': self.doc_ids,
+            'entities': {
+                name: {
+                    'category': entry['category'],
+                    'postings': [[position[doc_id], offsets] for doc_id, offsets in entry['postings'].items()]
+                }
+                for name, entry in self.entities.items()
+            }
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+        return path
+
+    @classmethod
+    def load(cls, path="generated/entity_index.json"):
+        """Загружает индекс, сохранённый методом save()"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        doc_ids = data['documents']
+        entities = {
+            name: {
+                'category': entry['category'],
+                'postings': {doc_ids[i]: offsets for i, offsets in entry['postings']}
+            }
+            for name, entry in data['entities'].items()
+        }
+        return cls(doc_ids, entities)
+
+def find_mentions(text, name):
+    """Находит смещения вхождений имени как отдельного слова"""
+    offsets = []
+    start = text.find(name)
+    while start != -1:
+        end = start + len(name)
+        before = text[start - 1] if start > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        if not before.isalnum() and not after.isalnum():
+            offsets.append(start)
+        start = text.find(name, end)
+    return offsets
+
+def save_entity_index(documents, generated_folder="generated"):
+    """Строит и сохраняет индекс упоминаний сущностей"""
+    index = EntityIndex.from_documents(documents)
+    path = index.save(os.path.join(generated_folder, "entity_index.json"))
+    print(f"✓ Entity index saved to {path} ({len(index.entities)} entities)")
+    return index
@@ -0,0 +1,192 @@
+# apps/world2/evaluate_retrieval.py
+import argparse
+import importlib
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    from .bm25_index import BM25Index
+    from .hashing_vectorizer import HashingVectorIndex
+    from .corpus_store import CorpusStore, ingest_folder
+except ImportError:
+    from bm25_index import BM25Index
+    from hashing_vectorizer import HashingVectorIndex
+    from corpus_store import CorpusStore, ingest_folder
+
+def load_bm25(generated_folder, knowledge_base_folder):
+    """BM25 индекс из generated/bm25_index (строится, если его нет)"""
+    folder = os.path.join(generated_folder, "bm25_index")
+    if os.path.exists(os.path.join(folder, "meta.json")):
+        return BM25Index.load(folder)
+    return BM25Index.build_from_folder(knowledge_base_folder)
+
+def load_bm25_distractors(generated_folder, knowledge_base_folder):
+    """BM25 индекс базы знаний с документами-шумом (generate_distractors.py --build-index)"""
+    return BM25Index.load(os.path.join(generated_folder, "bm25_index_distractors"))
+
+def load_hashing(generated_folder, knowledge_base_folder):
+    """Векторный индекс из generated/hashing_index (строится, если его нет)"""
+    folder = os.path.join(generated_folder, "hashing_index")
+    if os.path.exists(os.path.join(folder, "meta.json")):
+        return HashingVectorIndex.load(folder)
+    return HashingVectorIndex.build_from_folder(knowledge_base_folder, folder)
+
+def load_sqlite(generated_folder, knowledge_base_folder):
+    """Полнотекстовый поиск FTS5 по generated/corpus.db (создаётся, если его нет)"""
+    path = os.path.join(generated_folder, "corpus.db")
+    if not os.path.exists(path):
+        ingest_folder(path, knowledge_base_folder)
+    return CorpusStore(path)
+
+# Встроенные ретриверы: имя -> фабрика(generated_folder, knowledge_base_folder)
+RETRIEVERS = {
+    'bm25': load_bm25,
+    'bm25_distractors': load_bm25_distractors,
+    'hashing': load_hashing,
+    'sqlite': load_sqlite
+}
+
+def load_retriever(name, generated_folder="generated", knowledge_base_folder="knowledge_base"):
+    """Создаёт ретривер по имени или пути "module:factory"
+
+    Ретривер — любой объект с методом search_batch(queries, k), который
+    возвращает для каждого запроса список doc_id или пар (doc_id, score).
+    """
+    if name in RETRIEVERS:
+        return RETRIEVERS[name](generated_folder, knowledge_base_folder)
+    if ':' not in name:
+        raise ValueError(f"Unknown retriever '{name}'. Use one of {sorted(RETRIEVERS)} or 'module:factory'")
+    module_name, factory_name = name.split(':', 1)
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    return factory(generated_folder, knowledge_base_folder)
+
+def load_qa_pairs(path):
+    """Читает QA пары из JSONL"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def score_batch(retrieved, relevant, ks):
+    """Векторно считает метрики для пачки запросов
+
+    retrieved: int массив (B, K) номеров найденных документов, -1 — пусто
+    relevant:  int массив (B, M) номеров релевантных документов, -1 — пусто
+    Возвращает словарь метрик-массивов длины B.
+    """
+    max_k = retrieved.shape[1]
+    hits = (retrieved[:, :, None] == relevant[:, None, :]).any(axis=2) & (retrieved >= 0)
+    num_relevant = (relevant >= 0).sum(axis=1)
+
+    metrics = {}
+    for k in ks:
+        metrics[f'recall@{k}'] = hits[:, :k].sum(axis=1) / num_relevant
+
+    # MRR: обратный ранг первого релевантного документа
+    has_hit = hits.any(axis=1)
+    first_rank = hits.argmax(axis=1) + 1
+    metrics['mrr'] = np.where(has_hit, 1.0 / first_rank, 0.0)
+
+    # nDCG с бинарной релевантностью
+    discounts = 1.0 / np.log2(np.arange(2, max_k + 2))
+    ideal_cumulative = np.concatenate([[0.0], np.cumsum(discounts)])
+    for k in ks:
+        dcg = (hits[:, :k] * discounts[:k]).sum(axis=1)
+        idcg = ideal_cumulative[np.minimum(num_relevant, k)]
+        metrics[f'ndcg@{k}'] = dcg / idcg
+
+    return metrics
+
+def evaluate(retriever, qa_pairs, ks=(1, 5, 10), batch_size=256):
+    """Прогоняет вопросы через ретривер пачками и усредняет метрики по типам QA"""
+    ks = sorted(ks)
+    max_k = ks[-1]
+    evaluable = [qa for qa in qa_pairs if qa.get('source_docs')]
+
+    doc_numbers = {}
+
+    def number(doc_id):
+        return doc_numbers.setdefault(doc_id, len(doc_numbers))
+
+    per_query = {}
+    template_types = []
+    started = time.perf_counter()
+
+    for batch_start in range(0, len(evaluable), batch_size):
+        batch = evaluable[batch_start:batch_start + batch_size]
+        results = retriever.search_batch([qa['question'] for qa in batch], max_k)
+
+        retrieved = np.full((len(batch), max_k), -1, dtype=np.int64)
+        max_relevant = max(len(qa['source_docs']) for qa in batch)
+        relevant = np.full((len(batch), max_relevant), -1, dtype=np.int64)
+        for row, (qa, hits) in enumerate(zip(batch, results)):
+            ids = [hit[0] if isinstance(hit, (tuple, list)) else hit for hit in hits[:max_k]]
+            retrieved[row, :len(ids)] = [number(doc_id) for doc_id in ids]
+            sources = list(dict.fromkeys(qa['source_docs']))
+            relevant[row, :len(sources)] = [number(doc_id) for doc_id in sources]
+            template_types.append(qa.get('template_type', 'unknown'))
+
+        for name, values in score_batch(retrieved, relevant, ks).items():
+            per_query.setdefault(name, []).append(values)
+
+    elapsed = time.perf_counter() - started
+    per_query = {name: np.concatenate(chunks) for name, chunks in per_query.items()}
+    template_types = np.array(template_types)
+
+    def summarize(mask):
+        return {name: round(float(values[mask].mean()), 4) for name, values in per_query.items()}
+
+    report = {
+        'total_questions': len(qa_pairs),
+        'evaluated_questions': len(evaluable),
+        'skipped_without_source_docs': len(qa_pairs) - len(evaluable),
+        'ks': ks,
+        'seconds': round(elapsed, 3),
+        'overall': summarize(np.ones(len(evaluable), dtype=bool)) if evaluable else {},
+        'by_template_type': {
+            template_type: summarize(template_types == template_type)
+            for template_type in sorted(set(template_types.tolist()))
+        }
+    }
+    return report
+
+def main(argv=None):
+    """Оценивает ретривер на QA парах и сохраняет retrieval_report.json"""
+    parser = argparse.ArgumentParser(description="Evaluate retrieval on generated QA pairs")
+    parser.add_argument('--retriever', default='bm25', help="bm25, hashing, sqlite or module:factory")
+    parser.add_argument('--qa-file', default=None, help="QA JSONL (default: generated/qa_pairs.jsonl)")
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--knowledge-base', default="knowledge_base")
+    parser.add_argument('--generated', default="generated")
+    parser.add_argument('--output', default=None, help="Report path (default: generated/retrieval_report.json)")
+    args = parser.parse_args(argv)
+
+    qa_path = args.qa_file or os.path.join(args.generated, "qa_pairs.jsonl")
+    print("📏 Evaluating retrieval")
+    print("=" * 60)
+    print(f"  Retriever: {args.retriever}")
+    print(f"  QA pairs: {qa_path}")
+
+    retriever = load_retriever(args.retriever, args.generated, args.knowledge_base)
+    report = evaluate(retriever, load_qa_pairs(qa_path), args.k, args.batch_size)
+    report['retriever'] = args.retriever
+    report['qa_file'] = qa_path
+
+    print(f"\n  Evaluated {report['evaluated_questions']} of {report['total_questions']} questions")
+    for name, value in report['overall'].items():
+        print(f"  {name:12}: {value:.4f}")
+    for template_type, metrics in report['by_template_type'].items():
+        summary = ", ".join(f"{name}={value:.3f}" for name, value in metrics.items() if not name.startswith('ndcg'))
+        print(f"  [{template_type}] {summary}")
+
+    report_path = args.output or os.path.join(args.generated, "retrieval_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✓ Retrieval report saved to {report_path}")
+
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,146 @@
 # apps/world2/fictional_document_generator.py
+import argparse
 import json
 import random
 from datetime import datetime, timedelta
 import os
 from typing import List, Dict, Any
 import hashlib
+import inspect
+import multiprocessing
 import re  # Добавляем для работы с регулярными выражениями
+from collections.abc import Mapping
 
 try:
     from .fictional_world_bible import FictionalWorldBuilder
+    from .entity_index import save_entity_index
+    from .provenance_index import (FACT_SPAN_PATTERN, ProvenanceIndex, mark_fact, mark_facts,
+                                   resolve_fact_marks, save_provenance_index, split_fact_key, strip_fact_marks)
+    from .qa_engine import generate_fact_qa_pairs, generate_multi_hop_qa_pairs
+    from .reference_graph import ReferenceGraph
+    from .bm25_index import save_bm25_index
+    from .chunk_corpus import chunk_knowledge_base
+    from .columnar_export import export_columnar
+    from .corpus_store import save_corpus_store
+    from .hard_negatives import mine_hard_negatives
+    from .text_builder import TextBuilder, count_words, trim_to_words
+    from .corpus_planner import generate_corpus_for_budget, parse_length_distribution
+    from .document_record import DocumentRecord, document_id, format_metadata, plan_document_ids
+    from .simhash_index import SimHashIndex, simhash
+    from .template_space import RankSpace, SlotSource, TemplateSpace
+    from .template_engine import default_registry
+    from .batched_random import BatchedRandom
+    from .shared_world import SharedWorld, attach_worker, worker_world
+    from .checkpoint import GenerationCheckpoint
+    from .sharding import Shard, save_shard_manifest
 except ImportError:
     from fictional_world_bible import FictionalWorldBuilder
+    from entity_index import save_entity_index
+    from provenance_index import (FACT_SPAN_PATTERN, ProvenanceIndex, mark_fact, mark_facts,
+                                  resolve_fact_marks, save_provenance_index, split_fact_key, strip_fact_marks)
+    from qa_engine import generate_fact_qa_pairs, generate_multi_hop_qa_pairs
+    from reference_graph import ReferenceGraph
+    from bm25_index import save_bm25_index
+    from chunk_corpus import chunk_knowledge_base
+    from columnar_export import export_columnar
+    from corpus_store import save_corpus_store
+    from hard_negatives import mine_hard_negatives
+    from text_builder import TextBuilder, count_words, trim_to_words
+    from corpus_planner import generate_corpus_for_budget, parse_length_distribution
+    from document_record import DocumentRecord, document_id, format_metadata, plan_document_ids
+    from simhash_index import SimHashIndex, simhash
+    from template_space import RankSpace, SlotSource, TemplateSpace
+    from template_engine import default_registry
+    from batched_random import BatchedRandom
+    from shared_world import SharedWorld, attach_worker, worker_world
+    from checkpoint import GenerationCheckpoint
+    from sharding import Shard, save_shard_manifest
+
+# Дата генерации прогона с зерном отсчитывается от этого дня, а не от дня запуска
+SEEDED_DATE_EPOCH = datetime(2024, 1, 1)
+
+def seeded_date(seed):
+    """Дата generated_date для прогона с зерном: один корпус при любом дне запуска"""
+    return (SEEDED_DATE_EPOCH + timedelta(days=seed % 366)).strftime("%Y-%m-%d")
+
+def renders_template(name):
+    """Помечает метод-генератор, который рендерит шаблон реестра с этим именем"""
+    def mark(method):
+        method.template_name = name
+        return method
+    return mark
 
 class ContentGenerator:
     """Генератор уникального контента"""
 
-    def __init__(self, world_data, terms_map):
+    def __init__(self, world_data, terms_map, near_duplicate_distance=3, enumerate_templates=False, rng=None):
         self.world_data = world_data
         self.terms_map = terms_map
+        # Источник случайных выборов (модуль random или BatchedRandom); при рендере
+        # в режиме перечисления временно подменяется источником комбинаций слотов
+        self.rng = rng if rng is not None else random
+        self.templates = default_registry()  # Скомпилированные шаблоны тел документов
+        # Режим перечисления: комбинации слотов выдаются без повторов, без хешей и перегенерации
+        self.template_spaces = {} if enumerate_templates else None
+        self.template_seed = self.rng.getrandbits(64) if enumerate_templates else None
+        self.resumed_draws = {}  # Использованные номера комбинаций из контрольной точки (до построения пространства)
+        self.space_shard = (0, 1)  # Смещение и шаг перестановки комбинаций (шард i из n берёт i, i + n, ...)
         self.generated_hashes = set()
+        # SimHash отпечатки принятых текстов; None отключает поиск почти-дубликатов
+        self.near_duplicates = SimHashIndex(near_duplicate_distance) if near_duplicate_distance is not None else None
+        self.rejected_drafts = 0
+        self.term_categories = {}  # Вымышленный термин -> категория мира
         self.fictional_terms_cache = self._load_fictional_terms()  # Кэшируем термины
+        self.document_mentions = {}  # Сущности, вставленные в текущий документ
+        self.document_facts = []  # Факты мира, отрендеренные в текущий документ
+        self.retained_slots = None  # Постоянные слоты шаблона между черновиками одного фрагмента
 
     def _load_fictional_terms(self):
         """Загружает все вымышленные термины для использования"""
         all_terms = []
 
         # Собираем термины из всех категорий
-        if 'characters' in self.terms_map:
-            all_terms.extend(list(self.terms_map['characters'].values()))
+        for category in ['characters', 'items', 'terms', 'regions', 'factions']:
+            if category in self.terms_map:
+                for term in self.terms_map[category].values():
+                    all_terms.append(term)
+                    self.term_categories.setdefault(term, category)
 
-        if 'items' in self.terms_map:
-            all_terms.extend(list(self.terms_map['items'].values()))
+        return all_terms
 
-        if 'terms' in self.terms_map:
-            all_terms.extend(list(self.terms_map['terms'].values()))
+    def begin_document(self):
+        """Начинает учёт сущностей и фактов мира для нового документа"""
+        self.document_mentions = {}
+        self.document_facts = []
 
-        # Добавляем регионы и фракции
-        if 'regions' in self.terms_map:
-            all_terms.extend(list(self.terms_map['regions'].values()))
+    def record_mention(self, name, category):
+        """Запоминает сущность мира, вставленную в текущий документ"""
+        if name:
+            self.document_mentions.setdefault(name, category)
+        return name
 
-        if 'factions' in self.terms_map:
-            all_terms.extend(list(self.terms_map['factions'].values()))
+    def record_fact(self, attribute, entity, value, text=None):
+        """Запоминает факт мира (атрибут сущности и его значение), вставленный в текущий документ
 
-        return all_terms
+        Возвращает текст факта (как он выведен, по умолчанию value) с разметкой:
+        по ней end_document находит точную позицию факта в теле документа,
+        даже если текст вокруг переписан обогащением или обрезан.
+        """
+        self.document_facts.append((attribute, strip_fact_marks(entity) if entity else entity,
+                                    strip_fact_marks(value)))
+        return mark_fact(len(self.document_facts) - 1, value if text is None else text)
+
+    def end_document(self, body=''):
+        """Снимает разметку фактов с тела документа и сбрасывает учёт
+
+        Возвращает (тело, сущности, факты); факт — кортеж
+        (атрибут, сущность, значение, start, end) с позицией в теле.
+        """
+        body, spans = resolve_fact_marks(body)
+        facts = [(*self.document_facts[number], start, end) for number, start, end in spans]
+        mentions, self.document_mentions = self.document_mentions, {}
+        self.document_facts = []
+        return body, mentions, facts
 
     def enrich_with_terms(self, text):
         """
@@ -72,20 +170,24 @@ class ContentGenerator:
             'centurion': ['shield-captain', 'blade-commander']
         }
 
-        # Применяем замены
+        # Применяем замены; тексты фактов мира не переписываются
         for generic, options in replacements.items():
             if generic in text.lower():
-                replacement = random.choice(options)
+                replacement = self.rng.choice(options)
                 # Заменяем с учётом регистра
-                text = re.sub(r'\b' + re.escape(generic) + r'\b', replacement, text, flags=re.IGNORECASE)
+                pattern = re.compile(r'\b' + re.escape(generic) + r'\b', flags=re.IGNORECASE)
+                parts = FACT_SPAN_PATTERN.split(text)
+                parts[::2] = [pattern.sub(replacement, part) for part in parts[::2]]
+                text = ''.join(parts)
 
         # Добавляем случайные термины в текст (30% вероятность для каждого предложения)
         sentences = [s.strip() for s in text.split('. ') if s.strip()]
 
         if len(sentences) > 2 and self.fictional_terms_cache:
             for i in range(len(sentences)):
-                if random.random() < 0.3:  # 30% chance to enrich this sentence
-                    term = random.choice(self.fictional_terms_cache)
+                if self.rng.random() < 0.3:  # 30% chance to enrich this sentence
+                    term = self.rng.choice(self.fictional_terms_cache)
+                    self.record_mention(term, self.term_categories.get(term))
 
                     # Разные способы вставки термина
                     insertions = [
@@ -97,38 +199,166 @@ class ContentGenerator:
                         f" {term} exemplifies this principle."
                     ]
 
-                    sentences[i] = sentences[i] + random.choice(insertions)
+                    sentences[i] = sentences[i] + self.rng.choice(insertions)
 
             text = '. '.join(sentences)
 
         return text
 
     def get_unique_content(self, template_func, *args, **kwargs):
-        """Генерирует уникальный контент"""
-        attempts = 0
-        while attempts < 5:
-            content = template_func(*args, **kwargs)
-
-            # Обогащаем терминами
-            content = self.enrich_with_terms(content)
+        """Генерирует уникальный контент, обогащённый терминами"""
+        return self._unique(template_func, args, kwargs, enrich=True)
+
+    def unique_text(self, generate, *args, **kwargs):
+        """Перегенерирует текст, пока он не перестанет быть (почти) дубликатом
+
+        Черновик отклоняется, если совпадает по MD5 с уже принятым текстом или
+        его SimHash отличается от принятого не больше чем на near_duplicate_distance
+        бит. В следующем черновике заново выбираются только слоты со случайными
+        выборами; постоянные слоты шаблона реестра (персонажи по ролям и текст
+        из них) берутся из первого черновика вместе с их упоминаниями.
+        Фрагмент без скомпилированного шаблона рендерится заново целиком;
+        метаданные и ссылки документа не меняются.
+        Сущности и факты отклонённого черновика не попадают в документ.
+        После пяти попыток берётся самый непохожий черновик.
+        В режиме перечисления шаблонов текст строится по следующей
+        неиспользованной комбинации слотов и не проверяется.
+        """
+        return self._unique(generate, args, kwargs)
 
-            content_hash = hashlib.md5(content.encode()).hexdigest()
+    def render_template(self, name, **params):
+        """Рендерит скомпилированный шаблон реестра
 
-            if content_hash not in self.generated_hashes:
-                self.generated_hashes.add(content_hash)
-                return content
+        В режиме перечисления берётся следующий неиспользованный номер
+        комбинации шаблона, иначе выборы делаются через self.rng.
+        """
+        template = self.templates.get(name)
+        if self.template_spaces is None:
+            return template.render(self, params, retained=self.retained_slots)
+        return template.render(self, params, rank=self._compiled_space(template, params).next_rank())
+
+    def render_document(self, name, **params):
+        """Тело и метаданные типа документа из реестра шаблонов"""
+        template = self.templates.get(name)
+        rank = self._compiled_space(template, params).next_rank() if self.template_spaces is not None else None
+        return template.render_document(self, params, rank)
+
+    def _compiled_space(self, template, params=None):
+        # Ёмкость скомпилированного шаблона известна по структуре и миру, трассировка не нужна;
+        # записи мира отбираются по параметрам, поэтому пространство у каждого набора параметров своё
+        params = {**template.params, **(params or {})}
+        key = (template.name, tuple(params.values()))
+        space = self.template_spaces.get(key)
+        if space is None:
+            space = self.template_spaces[key] = RankSpace(template.capacity_for(self, params),
+                                                          seed=f"{self.template_seed}:{key}")
+            space.offset, space.stride = self.space_shard
+            space.drawn = self.resumed_draws.pop(key, 0)
+        return space
+
+    def _render(self, generate, args, kwargs, source):
+        """Рендерит шаблон, беря выборы слотов из source"""
+        previous, self.rng = self.rng, source
+        try:
+            return generate(*args, **kwargs)
+        finally:
+            self.rng = previous
+
+    def template_space(self, generate, *args, **kwargs):
+        """Пространство комбинаций слотов шаблона (строится трассировкой один раз)"""
+        # Аргументы по умолчанию подставляются, чтобы f() и f(default) были одним пространством
+        bound = inspect.signature(generate).bind(*args, **kwargs)
+        bound.apply_defaults()
+        template_name = getattr(generate, 'template_name', None)
+        if template_name is not None:
+            # Аргументы генератора шаблона — параметры шаблона
+            return self._compiled_space(self.templates.get(template_name), bound.arguments)
+        key = (generate.__qualname__, tuple(bound.arguments.values()))
+        space = self.template_spaces.get(key)
+        if space is None:
+            def probe(source):
+                # Пробные рендеры не оставляют сущностей и фактов в документе
+                mentions, facts_count = dict(self.document_mentions), len(self.document_facts)
+                try:
+                    return self._render(generate, args, kwargs, source)
+                finally:
+                    self.document_mentions = mentions
+                    del self.document_facts[facts_count:]
+
+            space = self.template_spaces[key] = TemplateSpace(probe, seed=f"{self.template_seed}:{key}")
+            space.offset, space.stride = self.space_shard
+            space.drawn = self.resumed_draws.pop(key, 0)
+        return space
+
+    def template_capacities(self):
+        """Ёмкость и число использованных комбинаций каждого построенного пространства"""
+        return {
+            ' '.join([name, *map(str, args)]): {'capacity': space.capacity, 'used': space.drawn}
+            for (name, args), space in self.template_spaces.items()
+        }
 
-            attempts += 1
+    def set_shard(self, index, count):
+        """Делит пространства комбинаций между count шардами (уже построенные тоже)"""
+        self.space_shard = (index, count)
+        for space in (self.template_spaces or {}).values():
+            space.offset, space.stride = self.space_shard
 
-        # Если не удалось создать уникальный, добавляем идентификатор
-        base_content = template_func(*args, **kwargs)
-        enriched = self.enrich_with_terms(base_content)
-        return enriched + f"\n\n[Document variant {random.randint(1000, 9999)}]"
+    def _unique(self, generate, args, kwargs, enrich=False):
+        if self.template_spaces is not None:
+            if getattr(generate, 'template_name', None) is not None:
+                content = generate(*args, **kwargs)  # Номер комбинации выдаёт render_template
+            else:
+                space = self.template_space(generate, *args, **kwargs)
+                content = self._render(generate, args, kwargs, SlotSource(space.draw()))
+            return self.enrich_with_terms(content) if enrich else content
+
+        best = None
+        # Черновики шаблона реестра не пересчитывают постоянные слоты (персонажей и текст из них)
+        previous_retained = self.retained_slots
+        self.retained_slots = {} if getattr(generate, 'template_name', None) is not None else None
+        for _ in range(5):
+            mentions, facts_count = dict(self.document_mentions), len(self.document_facts)
+            content = generate(*args, **kwargs)
+            if enrich:
+                content = self.enrich_with_terms(content)
+            plain = strip_fact_marks(content)
+            content_hash = hashlib.md5(plain.encode()).hexdigest()
+            fingerprint = simhash(plain) if self.near_duplicates is not None else None
+
+            if content_hash in self.generated_hashes:
+                distance = 0
+            else:
+                match = self.near_duplicates.nearest(fingerprint) if fingerprint is not None else None
+                if match is None:
+                    break
+                distance = match[1]
+
+            self.rejected_drafts += 1
+            if best is None or distance > best[0]:
+                best = (distance, content, content_hash, fingerprint,
+                        self.document_mentions, self.document_facts[facts_count:])
+            # Откатываем учёт сущностей и фактов отклонённого черновика
+            self.document_mentions = mentions
+            del self.document_facts[facts_count:]
+        else:
+            _, content, content_hash, fingerprint, self.document_mentions, facts = best
+            self.document_facts.extend(facts)
+            if content_hash in self.generated_hashes:
+                # Точный дубликат остаётся только при исчерпании вариантов шаблона
+                content += f"\n\n[Document variant {self.rng.randint(1000, 9999)}]"
+                content_hash = hashlib.md5(strip_fact_marks(content).encode()).hexdigest()
+        self.retained_slots = previous_retained
+
+        self.generated_hashes.add(content_hash)
+        if fingerprint is not None:
+            self.near_duplicates.add(fingerprint)
+        return content
 
     def get_character(self, role, get_details=False):
         """Получает вымышленного персонажа по роли"""
         for char in self.world_data.get("characters", []):
             if char.get("type") == role:
+                self.record_mention(char.get("fictional_name"), "characters")
                 if get_details:
                     return char
                 return char.get("fictional_name", role)
@@ -140,583 +370,270 @@ class ContentGenerator:
             return self.terms_map[category].get(original_term, original_term)
 
         for cat in self.terms_map.values():
-            if isinstance(cat, dict) and original_term in cat:
+            if isinstance(cat, Mapping) and original_term in cat:
                 return cat[original_term]
 
         return original_term
 
     def format_metadata(self, metadata):
         """Форматирует метаданные без yaml"""
-        lines = []
-        for key, value in metadata.items():
-            if isinstance(value, list):
-                lines.append(f"{key}:")
-                for item in value:
-                    lines.append(f"  - {item}")
-            else:
-                lines.append(f"{key}: {value}")
-        return "\n".join(lines)
+        return format_metadata(metadata)
 
+    @renders_template('elixir_article')
     def generate_elixir_article(self):
         """Генерирует уникальную статью об эликсире"""
-        alchemist = self.get_character("alchemist")
-        strong_hero = self.get_character("strong_hero")
-        hero = self.get_character("hero")
-
-        elixir_names = [
-            "Sunstone Elixir", "Moonfall Draught", "Starlight Tonic",
-            "Dreamweaver Brew", "Crystal Essence", "Elderwood Extract"
-        ]
-        elixir_name = random.choice(elixir_names)
-
-        ingredients = [
-            "moonleaf harvested during the twin moon convergence",
-            "star-moss collected from ancient monoliths",
-            "petrified sunlight fragments found in crystal caves",
-            "whispering willow bark from the Elder Grove",
-            "crystalized dew from dream-fed plants"
-        ]
-
-        effects = [
-            "temporary enhanced vitality and endurance",
-            "accelerated reflexes and perception",
-            "short-term invulnerability to physical harm",
-            "momentary bursts of supernatural strength",
-            "enhanced cognitive processing and memory"
-        ]
-
-        lore_elements = [
-            f"According to {alchemist}'s research, the formula varies by season.",
-            f"Ancient texts mention a lost variant used during {random.choice(['The Crystal War', 'The Great Schism', 'The Moonfall'])}.",
-            f"The {random.choice(['Lorekeepers', 'Star Seers', 'Moon Sages'])} guild regulates its production.",
-            f"Counterfeit versions often contain {random.choice(['ground crystal', 'moon-dust', 'star-shards'])} instead of proper ingredients."
-        ]
-
-        template = f"""# Properties of {elixir_name}
-
-The {elixir_name} is a legendary concoction prepared exclusively by the Lorekeeper {alchemist}. 
-Its primary ingredient is {random.choice(ingredients)}, gathered using a {random.choice(['silver crescent', 'crystal blade', 'obsidian sickle'])}.
-
-## Effects and Properties
-
-Primary effects include {random.choice(effects)}. Secondary benefits may involve {random.choice(['enhanced healing', 'temporary levitation', 'elemental resistance'])} depending on the brew.
-
-Chronic exposure, as documented in the case of {strong_hero}, leads to permanent physical enhancement but requires frequent nourishment.
-
-## Historical Significance
-
-The formula originated during {random.choice(['the Age of Discovery', 'the Crystal Accord', 'the First Moonfall'])} and has been refined over {random.randint(10, 50)} generations. {random.choice(lore_elements)}
-
-## Modern Usage
-
-{hero} employs it strategically during encounters with Imperial forces. Proper dosage is critical - {random.randint(5, 15)} drops for basic enhancement, up to a full vial for combat situations.
-
-Storage requires {random.choice(['obsidian containers', 'crystal vials', 'silver-lined flasks'])} to maintain potency beyond {random.randint(30, 90)} days."""
-
-        return template
+        return self.render_template('elixir_article')
 
+    @renders_template('settlement_article')
     def generate_settlement_article(self):
         """Генерирует статью о поселении"""
-        chief = self.get_character("chief")
-        blacksmith = self.get_character("blacksmith")
-        fisher = self.get_character("fisher")
-        bard = self.get_character("bard")
-
-        settlement_names = ["Oakhaven", "Stonewatch", "Crystalbrook", "Moonhaven", "Starfall Enclave"]
-        settlement_name = random.choice(settlement_names)
-
-        regions = self.world_data.get("regions", [])
-        region = random.choice(regions) if regions else {"name": "Emerald Valley", "climate": "temperate"}
-
-        structures = [
-            "central plaza with the Chief's longhouse",
-            "alchemist's tower and laboratory",
-            "communal gathering hall",
-            "defensive watchtowers",
-            "artisan district with workshops",
-            "market square for trade"
-        ]
-
-        defenses = [
-            "natural valley topography providing choke points",
-            "strategically placed monoliths with protective enchantments",
-            "a militia trained in guerrilla tactics",
-            "hidden escape tunnels and safe houses",
-            "early warning systems using crystal resonators"
-        ]
-
-        economy = [
-            "standing stone quarrying and delivery",
-            "herbal remedies and alchemical supplies",
-            "artisan crafts including metalwork and weaving",
-            "fishing and aquatic harvesting",
-            "guidance services for travelers"
-        ]
-
-        template = f"""# Settlement Structure: {settlement_name}
-
-## Overview
-
-{settlement_name} is a {region.get('type', 'village')} settlement located in the {region.get('name', 'Emerald Valley')}, known for its {region.get('climate', 'temperate')} climate and remarkable resistance to Imperial occupation.
-
-## Physical Layout
-
-The settlement is structured around a {random.choice(structures)} at the highest elevation. Key infrastructure includes:
-
-1. **Central District**: Housing for {random.randint(50, 200)} families, centered around the plaza
-2. **Defensive Perimeter**: {random.choice(['Wooden palisade', 'Stone wall', 'Natural rock formation'])}, enhanced with {random.choice(defenses)}
-3. **Production Areas**: {random.choice(['Quarry', 'Forge', 'Fishery', 'Workshop'])} districts for essential goods
-4. **Cultural Sites**: {random.choice(['Story circle', 'Memory stones', 'Festival grounds', 'Archive'])} for community events
-
-## Social Structure
-
-The social hierarchy places Chief {chief} at the apex, followed by:
-- **Defenders**: {random.randint(10, 30)} trained combatants led by {self.get_character('hero')}
-- **Artisans**: Specialists including {blacksmith} (metalwork) and {fisher} (aquatic resources)
-- **Scholars**: Lorekeepers and healers maintaining traditional knowledge
-- **Entertainers**: Including {bard}, whose performances are {random.choice(['celebrated', 'tolerated', 'occasionally restrained'])} during gatherings
-
-## Economy and Trade
-
-Primary economic activities include {random.choice(economy)}. The settlement trades with {random.choice(['Silverport', 'Crystal City', 'Starfall Market'])} for essential imports like {random.choice(['olive oil', 'spices', 'tools', 'fabrics'])}.
-
-## Notable Features
-
-What makes {settlement_name} unique is its {random.choice([
-            'integration with natural crystal formations',
-            'ancient protective enchantments',
-            'communal decision-making process',
-            'seasonal migration patterns'
-        ])}. Recent developments include {random.choice([
-            'expansion of the northern quarry',
-            'construction of a new watchtower',
-            'establishment of a Lorekeeper academy',
-            'negotiations with nearby settlements'
-        ])}."""
-
-        return template
+        return self.render_template('settlement_article')
 
+    @renders_template('journal_entry')
     def generate_journal_entry(self, author_role="hero"):
         """Генерирует запись в журнале"""
-        author = self.get_character(author_role)
-
-        dates = [
-            f"{random.choice(['First', 'Second', 'Third'])} Moon of {random.choice(['Sunfire', 'Starfrost', 'Rain'])}",
-            f"Day {random.randint(1, 30)} of the {random.choice(['Harvest', 'Planting', 'Hunting'])} Season",
-            f"{random.choice(['Dawn', 'Dusk', 'Midday'])} on the {random.randint(1, 5)}th of {random.choice(['Crystal', 'Iron', 'Silver'])}month"
-        ]
-
-        locations = [
-            "near the Whispering Falls",
-            "at the base of Elder Mountain",
-            "within the Sunken Ruins",
-            "along the Starlight River",
-            "in the Crystalwood Grove"
-        ]
-
-        entry = f"""## Journal Entry #{random.randint(1, 100)}
-
-*Date: {random.choice(dates)}*
-*Location: {random.choice(locations)}*
-*Weather: {random.choice(['Sunny', 'Misty', 'Rainy', 'Clear'])}*
-*Mood: {random.choice(['contemplative', 'excited', 'weary', 'hopeful'])}*
-
-Today was eventful. {random.choice([
-            f'I discovered {random.choice(["ancient runes", "a hidden cave", "unusual crystals"])} while exploring.',
-            f'We had a skirmish with Imperial scouts near the border.',
-            f'{self.get_character("alchemist")} showed me a new herbal preparation.',
-            f'The community gathered for the monthly festival.'
-        ])}
-
-**Observation:** {random.choice([
-            'The seasons are changing earlier than expected.',
-            'Imperial patrols seem more frequent lately.',
-            'The crystal formations hum differently at night.',
-            'Our food stores are adequate for the coming winter.'
-        ])}
-
-**Personal note:** {self._generate_personal_note()}"""
-
-        return entry
-
-    def _generate_personal_note(self):
-        return random.choice([
-            "Must remember to check the northern watchtower tomorrow.",
-            "The new batch of moonleaf seems particularly potent.",
-            f"{self.get_character('strong_hero')} broke another tool today - need to speak with {self.get_character('blacksmith')}.",
-            "The dreams have been more vivid since visiting the crystal cave."
-        ])
+        return self.render_template('journal_entry', author_role=author_role)
 
+    @renders_template('report')
     def generate_report(self):
         """Генерирует отчёт"""
-        report_types = [
-            "Military Intelligence",
-            "Economic Assessment",
-            "Cultural Analysis",
-            "Resource Survey",
-            "Strategic Evaluation"
-        ]
-
-        report_type = random.choice(report_types)
-
-        template = f"""# {report_type} Report
-
-## Executive Summary
-
-This report details findings from recent {report_type.lower()} activities in the region. Key observations indicate {random.choice([
-            'increased Imperial activity along northern borders',
-            'stable economic conditions with minor fluctuations',
-            'cultural shifts among younger population segments',
-            'depletion of certain natural resources',
-            'emergence of new trade patterns'
-        ])}.
-
-## Methodology
-
-Data collected through {random.choice([
-            'direct observation and reconnaissance',
-            'interviews with local informants',
-            'analysis of trade records and ledgers',
-            'examination of material culture artifacts',
-            'long-term monitoring of key indicators'
-        ])} over a period of {random.randint(7, 90)} days.
-
-## Findings
-
-1. **Primary Trend**: {random.choice([
-            'Imperial forces are consolidating positions',
-            'Local economy shows resilience despite pressures',
-            'Traditional practices maintain strong adherence',
-            'Resource extraction exceeds sustainable levels',
-            'New alliances are forming among settlements'
-        ])}
-
-2. **Secondary Observations**: {random.choice([
-            'Supply lines remain vulnerable in certain sectors',
-            'Cultural exchange increasing with neighboring regions',
-            'Environmental changes affecting traditional patterns',
-            'Technological adaptation proceeding slowly',
-            'Social cohesion remains strong under pressure'
-        ])}
-
-3. **Anomalies Noted**: {random.choice([
-            'Unexpected activity near abandoned ruins',
-            'Unusual weather patterns affecting harvests',
-            'Discrepancies in reported versus observed data',
-            'Emergence of previously undocumented practices',
-            'Signs of external influence beyond expected parameters'
-        ])}
-
-## Recommendations
-
-Based on these findings, we recommend:
-1. {random.choice(['Increase surveillance in identified areas', 'Adjust resource allocation priorities', 'Initiate cultural preservation programs', 'Implement sustainable harvesting protocols', 'Strengthen diplomatic outreach'])}
-2. {random.choice(['Prepare contingency plans for potential escalation', 'Diversify economic activities to reduce vulnerability', 'Document traditional knowledge before it is lost', 'Establish monitoring systems for environmental changes', 'Facilitate inter-settlement communication networks'])}
-3. {random.choice(['Conduct follow-up investigation in three months', 'Allocate additional resources for implementation', 'Coordinate with allied factions for joint action', 'Review and update existing protocols', 'Educate population about findings and implications'])}
-
-## Conclusion
-
-The situation requires {random.choice(['continued monitoring', 'immediate action', 'strategic patience', 'diplomatic engagement', 'resource investment'])}. Further developments will be reported as they occur."""
-
-        return template
+        return self.render_template('report')
 
+    @renders_template('decree')
     def generate_decree(self):
         """Генерирует указ"""
-        authorities = [
-            "Chief", "Council of Elders", "High Commander",
-            "Lorekeeper Assembly", "Trade Guild Master"
-        ]
-
-        authority = random.choice(authorities)
-
-        decree_types = [
-            "Resource Management",
-            "Defensive Measures",
-            "Cultural Preservation",
-            "Economic Regulation",
-            "Social Conduct"
-        ]
-
-        decree_type = random.choice(decree_types)
-
-        template = f"""# Decree of {authority}
-
-## Preamble
-
-In accordance with traditional authority and for the welfare of the community, this decree is issued regarding matters of {decree_type.lower()}.
-
-## Articles
-
-### Article 1: General Provisions
-
-All members of the community shall adhere to the following regulations effective immediately.
-
-### Article 2: Specific Regulations
-
-1. {random.choice([
-            'The harvesting of moonleaf shall be limited to designated areas during specific lunar phases.',
-            'All able-bodied individuals shall participate in defensive drills twice per moon cycle.',
-            'Traditional festivals shall be observed according to ancestral calendars.',
-            'Trade with external parties requires approval from designated authorities.',
-            'Public gatherings exceeding twenty individuals require advance notification.'
-        ])}
-
-2. {random.choice([
-            'Use of standing stones for construction requires quarrymaster approval.',
-            'Reporting of Imperial movements to local defenders is mandatory.',
-            'Preservation of historical sites takes precedence over development.',
-            'Price controls on essential goods shall be maintained.',
-            'Resolution of disputes shall follow established mediation procedures.'
-        ])}
-
-3. {random.choice([
-            'Waste disposal shall conform to environmental protection standards.',
-            'Training in basic self-defense is required for all adults.',
-            'Passing down of oral histories to younger generations is encouraged.',
-            'Quality standards for exported goods shall be enforced.',
-            'Community service obligations apply to all resident families.'
-        ])}
-
-### Article 3: Enforcement
-
-Violations shall be subject to {random.choice([
-            'corrective labor assignments',
-            'temporary restrictions on privileges',
-            'mandatory education sessions',
-            'community service requirements',
-            'restitution payments'
-        ])} as determined by appropriate authorities.
-
-### Article 4: Duration
-
-This decree remains in effect until {random.choice([
-            'the next seasonal council convenes',
-            'specific conditions are met as outlined in supplementary documents',
-            'amended or revoked by subsequent decree',
-            'one full cycle of seasons has passed',
-            'emergency conditions have been resolved'
-        ])}.
-
-## Authorization
-
-Issued under the seal and authority of {authority} on this {random.randint(1, 30)}th day of {random.choice(['Sunfire', 'Starfrost', 'Rain', 'Bloom'])}month."""
-
-        return template
+        return self.render_template('decree')
 
+    @renders_template('myth')
     def generate_myth(self):
         """Генерирует миф"""
-        myth_themes = [
-            "Origin of the First Settlement",
-            "Why the Mountains Hold Memory",
-            "The Gift of the Twin Moons",
-            "The Great Beast of the Depths",
-            "How Laughter Saved the World"
-        ]
-
-        theme = random.choice(myth_themes)
+        return self.render_template('myth')
 
-        characters = [
-            self.get_character("hero"),
-            self.get_character("alchemist"),
-            self.get_character("chief"),
-            "The First Walker",
-            "The Stone Speaker",
-            "The Dream Weaver"
+    @renders_template('letter')
+    def generate_letter(self):
+        """Генерирует письмо"""
+        return self.render_template('letter')
+
+    def _distractor_vocabulary(self):
+        """Имена мира для документов-шума (без свойств сущностей)"""
+        if not hasattr(self, '_distractor_names'):
+            world = self.world_data
+            self._distractor_names = {
+                'characters': [c['fictional_name'] for c in world.get('characters', [])] or ['a traveler'],
+                'regions': [r['name'] for r in world.get('regions', [])] or ['the valley'],
+                'factions': [f['name'] for f in world.get('factions', [])] or ['the guild'],
+                'items': [i['fictional'] for i in world.get('magic_items', [])] or ['sealed goods'],
+                'events': [e['fictional'] for e in world.get('historical_events', [])] or ['the old festival']
+            }
+        return self._distractor_names
+
+    def generate_distractor(self, doc_type):
+        """Генерирует документ-шум: словарь мира без фактов, на которые есть QA пары
+
+        Сущности упоминаются только в бытовом контексте (дороги, погода,
+        счета, расписания), их свойства не называются. Возвращает (текст, заголовок).
+        """
+        names = self._distractor_vocabulary()
+        person = self.rng.choice(names['characters'])
+        other = self.rng.choice(names['characters'])
+        region = self.rng.choice(names['regions'])
+        destination = self.rng.choice(names['regions'])
+        faction = self.rng.choice(names['factions'])
+        item = self.rng.choice(names['items'])
+        event = self.rng.choice(names['events'])
+
+        goods = ['barley', 'salted fish', 'lamp oil', 'rope', 'wool bales', 'clay jars', 'firewood', 'candles']
+        chores = [
+            'the mill wheel needs new paddles',
+            'the east road is muddy after the rains',
+            'two carts were repaired at the crossing',
+            'the well rope was replaced',
+            'the granary roof leaks in the north corner',
+            'the ferry keeps to its usual hours'
         ]
+        weather = ['overcast', 'windy', 'drizzling', 'bright but cold', 'foggy until noon']
 
-        character = random.choice(characters)
+        if doc_type == 'report':
+            title = f"Supply Ledger: {region}"
+            rows = "\n".join(
+                f"{n}. **{good.title()}**: {self.rng.randint(3, 400)} units received, {self.rng.randint(0, 120)} issued"
+                for n, good in enumerate(self.rng.sample(goods, 4), 1))
+            content = f"""# {title}
 
-        template = f"""# The Legend of {theme}
+## Summary
 
-## As told by the Elders
+Clerks of {faction} recorded routine deliveries between {region} and {destination}. Weather during the period was {self.rng.choice(weather)}.
 
-In the time before counting, when the world was still learning its shape, there occurred the events that explain {theme.lower()}.
+## Stores
 
-It began when {character} {random.choice([
-            'discovered a cave that whispered secrets',
-            'followed a path of falling stars',
-            'sought answers from the sleeping earth',
-            'challenged the boundaries of the known world',
-            'listened to the dreams of stones'
-        ])}.
+{rows}
 
-## The Journey
-
-{character} traveled through {random.choice([
-            'forests that remembered every footstep',
-            'mountains that tested resolve with each ascent',
-            'rivers that carried memories instead of water',
-            'valleys where time flowed differently',
-            'plains where the wind told forgotten stories'
-        ])}, facing trials that included {random.choice([
-            'riddles posed by ancient guardians',
-            'temptations of false promises',
-            'illusions that mirrored deepest fears',
-            'silence that threatened to become permanent',
-            'choices with consequences beyond understanding'
-        ])}.
+## Notes
 
-## The Revelation
+{self.rng.choice(chores).capitalize()}. A crate marked "{item}" was logged at the storehouse and left unopened pending inventory. Next count is scheduled after {self.rng.randint(2, 14)} days."""
 
-At the moment of greatest challenge, {character} realized that {random.choice([
-            'true strength comes from community, not isolation',
-            'the land remembers those who listen',
-            'balance requires both giving and receiving',
-            'some truths can only be carried, not owned',
-            'the smallest actions create the largest echoes'
-        ])}.
+        elif doc_type == 'decree':
+            title = "Public Notice"
+            content = f"""# Public Notice of {faction}
 
-## The Outcome
+## Market Days
 
-From this revelation came {random.choice([
-            'the founding principles of our settlement',
-            'the understanding that guides our relationship with nature',
-            'the traditions that bind our community',
-            'the wisdom that protects us from folly',
-            'the hope that sustains us in difficult times'
-        ])}.
+Market stalls in {region} open on the {self.rng.randint(1, 6)}th and {self.rng.randint(10, 28)}th day of each month. Traders from {destination} must register with the gate clerk.
 
-## The Moral
+## Road Works
 
-This story teaches us that {random.choice([
-            'every ending contains a new beginning',
-            'the greatest treasures are often overlooked',
-            'true power lies in understanding, not controlling',
-            'our choices shape the world for generations',
-            'the simplest truths are the most enduring'
-        ])}.
+{self.rng.choice(chores).capitalize()}. Travelers should expect delays of {self.rng.randint(1, 5)} hours near the crossing.
 
-## Transmission
+## Observances
 
-Remember this tale when {random.choice([
-            'facing decisions that affect the community',
-            'the seasons change and the world renews itself',
-            'teaching the young about their heritage',
-            'seeking guidance in times of uncertainty',
-            'celebrating the bonds that connect us all'
-        ])}."""
+The anniversary of {event} will be marked with a shared meal. Bring {self.rng.choice(goods)} if able."""
 
-        return template
+        elif doc_type == 'letter':
+            title = f"Letter to {other}"
+            content = f"""Dear {other},
 
-    def generate_letter(self):
-        """Генерирует письмо"""
-        senders = [
-            self.get_character("hero"),
-            self.get_character("alchemist"),
-            self.get_character("chief"),
-            "A Distant Relative",
-            "A Traveling Merchant",
-            "An Anonymous Informant"
-        ]
+The journey from {region} to {destination} took {self.rng.randint(2, 9)} days; the weather was {self.rng.choice(weather)} most of the way. {self.rng.choice(chores).capitalize()}, so we rested longer than planned.
 
-        receivers = [
-            "Trusted Friend",
-            "Family Member",
-            "Council Representative",
-            "Business Associate",
-            "Fellow Scholar"
-        ]
+Please tell {person} that the {self.rng.choice(goods)} arrived and the account is settled. The parcel with the {item} label is still at the inn.
 
-        sender = random.choice(senders)
-        receiver = random.choice(receivers)
+Yours,
+{person}"""
 
-        template = f"""To {receiver},
+        elif doc_type == 'journal':
+            title = f"Travel Notes of {person}"
+            content = f"""## Travel Notes
 
-I hope this message finds you in good health and spirits. The seasons turn as always, though not without their peculiarities.
+*Route: {region} to {destination}*
+*Weather: {self.rng.choice(weather).capitalize()}*
 
-Since we last corresponded, {random.choice([
-            'much has changed in our corner of the world',
-            'matters have proceeded with expected regularity',
-            'unexpected developments have required attention',
-            'tranquility has settled over our daily routines',
-            'challenges have tested our resilience once more'
-        ])}.
+Spent the morning trading {self.rng.choice(goods)} for {self.rng.choice(goods)}. Met {other}, who asked about the toll at the bridge. {self.rng.choice(chores).capitalize()}.
 
-Specifically, {random.choice([
-            f'work on the {random.choice(["northern watchtower", "communal granary", "healing springs"])} progresses steadily',
-            f'relations with the {random.choice(["neighboring settlement", "traveling merchants", "mountain clans"])} remain cordial',
-            f'harvest of {random.choice(["moonleaf", "crystal shards", "medicinal herbs"])} has been particularly bountiful',
-            f'concerns about {random.choice(["Imperial movements", "resource depletion", "strange occurrences"])} have arisen',
-            f'preparations for the {random.choice(["annual festival", "coming winter", "leadership transition"])} are underway'
-        ])}.
+Heard talk of {event} at the inn, mostly songs and old jokes. Paid {self.rng.randint(2, 30)} coins for lodging."""
 
-I must share that {random.choice([
-            'a discovery of some significance has come to light',
-            'certain observations have given me cause for reflection',
-            'traditional methods have proven their worth once again',
-            'new approaches are showing promising results',
-            'unanswered questions continue to occupy my thoughts'
-        ])}. This relates to {random.choice([
-            'ancient practices that may have modern applications',
-            'patterns that suggest deeper connections',
-            'resources whose full potential remains untapped',
-            'relationships that shape our collective future',
-            'knowledge that bridges generations'
-        ])}.
+        else:
+            title = f"Gazetteer: Roads of {region}"
+            content = f"""# {title}
 
-On a more personal note, {random.choice([
-            'the quiet moments continue to bring clarity',
-            'each day reaffirms the value of community',
-            'the balance between tradition and adaptation requires constant attention',
-            'small victories accumulate into meaningful progress',
-            'the landscape itself seems to hold lessons for those who observe closely'
-        ])}.
+## Routes
 
-I would value your perspective on these matters when opportunity permits. Please convey my regards to {random.choice(['mutual acquaintances', 'your family', 'the community elders', 'fellow seekers of knowledge'])}.
+The road from {region} to {destination} runs {self.rng.randint(5, 80)} leagues with {self.rng.randint(1, 6)} waystations. Members of {faction} maintain the milestones.
 
-With sincerity and anticipation of your reply,
+## Services
 
-{sender}
+{self.rng.choice(chores).capitalize()}. Inns along the route sell {self.rng.choice(goods)} and {self.rng.choice(goods)} at fair prices.
 
-P.S. {random.choice([
-            'Do not trouble yourself with immediate response - these matters can wait.',
-            'I include a small token that may be of interest to your studies.',
-            'Burn this after reading, as precautions remain necessary.',
-            'The next caravan should reach your area within two moon cycles.',
-            'Remember what we discussed under the twin moons last season.'
-        ])}"""
+## Local Customs
 
-        return template
+Travelers often time their visits to the gatherings held on the anniversary of {event}."""
+
+        return content, title
 
 class FictionalDocumentGenerator:
-    def __init__(self):
-        builder = FictionalWorldBuilder()
-        self.world_data, _ = builder.build_world()
-        self.terms_map = builder.categories
-        self.content_gen = ContentGenerator(self.world_data, self.terms_map)
+    # Распределение типов документов в стандартном наборе
+    DOC_DISTRIBUTION = {
+        'encyclopedia': 15,
+        'journal': 12,
+        'report': 10,
+        'decree': 5,
+        'myth': 5,
+        'letter': 3
+    }
+
+    def __init__(self, world_data=None, terms_map=None, near_duplicate_distance=3, enumerate_templates=False,
+                 rng=None, generated_date=None):
+        if world_data is None:
+            builder = FictionalWorldBuilder()
+            world_data, _ = builder.build_world()
+            terms_map = builder.categories
+        # Готовый мир передаётся, чтобы дописать документы к уже сгенерированному корпусу
+        self.world_data = world_data
+        self.terms_map = terms_map or {}
+        self.content_gen = ContentGenerator(self.world_data, self.terms_map, near_duplicate_distance,
+                                            enumerate_templates, rng)
+        self.rng = self.content_gen.rng  # Выборы метаданных, ссылок и типов документов
+        # generated_date в метаданных документов (сохраняется в контрольной точке)
+        self.generated_date = generated_date or datetime.now().strftime("%Y-%m-%d")
+        # Встроенные типы и типы документов, описанные в templates/*.json
+        self.doc_distribution = {**self.DOC_DISTRIBUTION, **self.content_gen.templates.document_types()}
 
         self.documents = []
         self.doc_ids = []
-
-    def generate_document_set(self, num_docs=50):
-        """Генерирует полный набор уникальных документов"""
-
-        doc_distribution = {
-            'encyclopedia': 15,
-            'journal': 12,
-            'report': 10,
-            'decree': 5,
-            'myth': 5,
-            'letter': 3
-        }
+        self.plan = []  # План последнего generate_document_set: [(doc_type, target_words), ...]
+
+    def generate_document_set(self, num_docs=50, target_words=None, plan=None, checkpoint=None, shard=None):
+        """Генерирует полный набор уникальных документов
+
+        target_words задаёт длину каждого документа в словах (режим
+        для long-context и chunking тестов); без него длина определяется шаблоном.
+        plan — готовый список (doc_type, target_words) от CorpusPlanner.
+        checkpoint (GenerationCheckpoint) периодически сохраняет прогресс;
+        если он загружен с диска, генерация продолжается с его позиции.
+        shard (Shard) ограничивает генерацию своим диапазоном плана: документы
+        получают глобальные идентификаторы, а перекрёстные ссылки выбираются
+        среди всех документов плана, включая документы других шардов.
+        """
 
         print("Generating unique documents...")
 
-        for doc_type, count in doc_distribution.items():
-            print(f"  Creating {count} {doc_type} documents...")
-            for i in range(count):
-                doc = self._generate_document(doc_type, i+1)
-                self.documents.append(doc)
-                self.doc_ids.append(doc['id'])
+        # Документы плана подгоняются под длину ровно по слову
+        exact = plan is not None
+        if plan is None:
+            plan = [
+                (doc_type, target_words)
+                for doc_type, count in self.doc_distribution.items()
+                for _ in range(count)
+            ]
 
+        start = 0
+        if shard is not None:
+            shard.seed_generator(self)
+        if checkpoint is not None and checkpoint.state is not None:
+            plan, start = checkpoint.restore(self)
+            print(f"  Resuming after {start:,} of {len(plan):,} documents from {checkpoint.folder}/")
+
+        first, stop = shard.range(len(plan)) if shard is not None else (0, len(plan))
+        start = max(start, first)
+        if shard is not None:
+            print(f"  Shard {shard.index}/{shard.count}: plan positions {first:,}-{stop:,} of {len(plan):,}")
+
+        self.plan = plan
+        if shard is not None:
+            # Ссылки при генерации — на документы плана до текущей позиции, как без шардов
+            plan_ids = plan_document_ids(plan)
+            self.doc_ids = plan_ids[:start]
+
+        type_counts = {}
+        for doc_type, _ in plan[:start]:
+            type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
+        for position in range(start, stop):
+            doc_type, words = plan[position]
+            if doc_type not in type_counts:
+                print(f"  Creating {sum(1 for t, _ in plan[first:stop] if t == doc_type)} {doc_type} documents...")
+            type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
+            doc = self._generate_document(doc_type, type_counts[doc_type], words, exact)
+            self.documents.append(doc)
+            self.doc_ids.append(doc['id'])
+            if checkpoint is not None and checkpoint.due(position + 1) and position + 1 < stop:
+                checkpoint.save(self, plan, position + 1)
+
+        if checkpoint is not None:
+            # Точка после генерации: сбой на следующих шагах не требует генерировать заново
+            checkpoint.save(self, plan, stop)
+
+        if self.content_gen.rejected_drafts:
+            print(f"  Re-rolled {self.content_gen.rejected_drafts} near-duplicate drafts")
+
+        if shard is not None:
+            self.doc_ids = plan_ids
         self._add_cross_references()
         self._add_explicit_references()  # Добавляем явные ссылки
         return self.documents
 
-    def _generate_document(self, doc_type, index):
+    def _generate_document(self, doc_type, index, target_words=None, exact=False):
         """Генерирует один уникальный документ"""
 
-        doc_id = f"{doc_type.upper()[:4]}_{index:03d}"
+        doc_id = document_id(doc_type, index)
+        self.content_gen.begin_document()
 
         # Словарь методов генерации
         template_methods = {
@@ -728,27 +645,178 @@ class FictionalDocumentGenerator:
             'letter': self._letter_template
         }
 
-        content, metadata = template_methods[doc_type](doc_id)
+        if doc_type in template_methods:
+            content, metadata = template_methods[doc_type](doc_id)
+        else:
+            content, metadata = self.content_gen.render_document(doc_type)
+        if target_words:
+            content = self._extend_to_length(doc_type, content, target_words, exact)
+        content, entities, facts = self.content_gen.end_document(content)
 
         metadata.update({
             'doc_id': doc_id,
             'doc_type': doc_type,
             'universe': self.world_data['fictional_universe'],
-            'generated_date': datetime.now().strftime("%Y-%m-%d"),
+            'generated_date': self.generated_date,
             'contains_fictional_terms': True,
             'content_hash': hashlib.md5(content.encode()).hexdigest()[:8]
         })
 
-        full_doc = f"---\n{self.content_gen.format_metadata(metadata)}\n---\n\n{content}"
+        return DocumentRecord(doc_id, doc_type, metadata, content, entities, facts)
+
+    def _extend_to_length(self, doc_type, content, target_words, exact=False):
+        """Дописывает к документу разделы того же типа, пока не наберётся target_words слов
+
+        Разделы копятся в TextBuilder и склеиваются один раз, поэтому время
+        линейно по длине результата; последний раздел обрезается по границе
+        предложения (или ровно по слову при exact=True).
+        """
+        sections = self._section_generators(doc_type)
+
+        builder = TextBuilder(content)
+        if builder.words > target_words:
+            return trim_to_words(content, target_words, exact)
+
+        section_number = 0
+        while builder.words < target_words:
+            section = self.content_gen.get_unique_content(sections[section_number % len(sections)])
+            section_number += 1
+            remaining = target_words - builder.words
+            if count_words(section) > remaining:
+                section = trim_to_words(section, remaining, exact)
+                if not section:
+                    break
+            builder.append("\n\n")
+            builder.append(section)
+
+        return builder.build()
+
+    def _section_generators(self, doc_type):
+        """Генераторы тела документа данного типа (разделы длинных документов)"""
+        if doc_type not in self.DOC_DISTRIBUTION:
+            return [renders_template(doc_type)(lambda: self.content_gen.render_template(doc_type))]
+        return {
+            'encyclopedia': [self.content_gen.generate_elixir_article, self.content_gen.generate_settlement_article],
+            'journal': [self.content_gen.generate_journal_entry],
+            'report': [self.content_gen.generate_report],
+            'decree': [self.content_gen.generate_decree],
+            'myth': [self.content_gen.generate_myth],
+            'letter': [self.content_gen.generate_letter]
+        }[doc_type]
+
+    def template_capacity(self):
+        """Число уникальных тел документов каждого типа в режиме перечисления шаблонов
+
+        Ёмкость типа — сумма ёмкостей его генераторов; для энциклопедии учтены
+        статьи об эликсирах и поселениях, общие статьи добавляются по темам.
+        """
+        if self.content_gen.template_spaces is None:
+            raise ValueError("Template capacity is only defined with enumerate_templates=True")
+        capacity = {}
+        for doc_type in self.doc_distribution:
+            spaces = [self.content_gen.template_space(generate) for generate in self._section_generators(doc_type)]
+            capacity[doc_type] = sum(space.capacity for space in spaces)
+        return capacity
+
+    def set_document_body(self, doc, body):
+        """Заменяет тело документа и обновляет content_hash в метаданных"""
+        doc['raw_content'] = body
+        doc['metadata']['content_hash'] = hashlib.md5(body.encode()).hexdigest()[:8]
+
+    def answer_fact_pattern(self, provenance=None):
+        """Регулярное выражение по текстам фактов, на которые опираются QA пары
+
+        Берутся факты из сгенерированных документов и индекса происхождения,
+        а также многословные описания сущностей мира.
+        """
+        phrases = {fact[2] for doc in self.documents for fact in doc.get('facts', [])}
+        if provenance is not None:
+            phrases.update(span['text'] for spans in provenance.facts.values() for span in spans)
+        for values in self.world_data.values():
+            if not isinstance(values, (str, Mapping)):
+                for entry in values:
+                    if isinstance(entry, Mapping):
+                        phrases.update(entry.get(key) for key in ('description', 'unique_feature') if entry.get(key))
+        phrases = sorted((p for p in phrases if len(p.split()) > 1), key=len, reverse=True)
+        return re.compile('|'.join(map(re.escape, phrases))) if phrases else None
+
+    def _generate_distractor(self, doc_type, index, answer_pattern=None, generated_date=None):
+        """Генерирует один документ-шум с идентификатором DIST_"""
+        doc_id = f"DIST_{index:07d}"
+        for _ in range(10):
+            content, title = self.content_gen.generate_distractor(doc_type)
+            if answer_pattern is None or not answer_pattern.search(content):
+                break
+        else:
+            raise ValueError(f"Could not generate distractor {doc_id} without answer facts")
+
+        metadata = {
+            'title': title,
+            'doc_id': doc_id,
+            'doc_type': doc_type,
+            'universe': self.world_data['fictional_universe'],
+            'generated_date': generated_date or self.generated_date,
+            'contains_fictional_terms': True,
+            'distractor': True,
+            'content_hash': hashlib.md5(content.encode()).hexdigest()[:8]
+        }
 
         return {
             'id': doc_id,
             'type': doc_type,
-            'content': full_doc,
-            'metadata': metadata,
-            'raw_content': content
+            'content': f"---\n{self.content_gen.format_metadata(metadata)}\n---\n\n{content}",
+            'metadata': metadata
         }
 
+    def generate_distractors(self, count, output_folder="distractors", shard_size=10000, start_index=1,
+                             provenance=None, workers=1):
+        """Потоково пишет count документов-шума в JSONL шарды по shard_size
+
+        Документы не хранятся в памяти и не ссылаются на другие документы;
+        каждый проверяется на отсутствие текстов фактов из QA пар.
+        При workers > 1 шарды пишутся параллельно процессами, которые читают
+        мир из разделяемой памяти (SharedWorld) вместо собственных копий.
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        answer_pattern = self.answer_fact_pattern(provenance)
+        generated_date = self.generated_date
+
+        tasks = [(number, start_index + first, min(shard_size, count - first))
+                 for number, first in enumerate(range(0, count, shard_size))]
+        if workers > 1 and len(tasks) > 1:
+            # Зёрна шардов тянутся заранее: результат не зависит от порядка работы воркеров
+            tasks = [(*task, self.rng.getrandbits(64)) for task in tasks]
+            with SharedWorld.create(self.world_data, self.terms_map) as shared:
+                with multiprocessing.Pool(min(workers, len(tasks)), initializer=attach_worker,
+                                          initargs=(shared.name,)) as pool:
+                    shards = pool.starmap(_write_distractor_shard,
+                                          [(task, output_folder, answer_pattern, generated_date) for task in tasks])
+        else:
+            shards = [self.write_distractor_shard(task, output_folder, answer_pattern, generated_date)
+                      for task in tasks]
+
+        manifest = {'documents': count, 'shard_size': shard_size, 'start_index': start_index, 'shards': shards}
+        with open(os.path.join(output_folder, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+        print(f"✓ Saved {count:,} distractor documents to {output_folder}/ ({len(shards)} shards)")
+        return manifest
+
+    def write_distractor_shard(self, task, output_folder, answer_pattern=None, generated_date=None):
+        """Пишет один шард документов-шума: task = (номер шарда, первый индекс, число документов)"""
+        shard_number, first_index, documents = task[:3]
+        doc_types = ['encyclopedia', 'journal', 'report', 'decree', 'letter']
+        weights = [15, 12, 10, 5, 3]
+
+        shard_path = os.path.join(output_folder, f"distractors_{shard_number:05d}.jsonl")
+        with open(shard_path, 'w', encoding='utf-8') as shard:
+            for index in range(first_index, first_index + documents):
+                doc_type = self.rng.choices(doc_types, weights)[0]
+                doc = self._generate_distractor(doc_type, index, answer_pattern, generated_date)
+                shard.write(json.dumps(doc, ensure_ascii=False) + '\n')
+
+        return {'file': os.path.basename(shard_path), 'first_id': f"DIST_{first_index:07d}", 'documents': documents}
+
     def _encyclopedia_template(self, doc_id):
         """Шаблон для энциклопедической статьи"""
 
@@ -765,17 +833,17 @@ class FictionalDocumentGenerator:
             ("Architectural ", "styles")
         ]
 
-        prefix, topic_type = random.choice(topics)
+        prefix, topic_type = self.rng.choice(topics)
 
         # Генерируем уникальное название
         if topic_type == "elixir":
             elixirs = ["Sunstone Elixir", "Moonfall Draught", "Starlight Tonic", "Dreamweaver Brew"]
-            topic_name = random.choice(elixirs)
+            topic_name = self.rng.choice(elixirs)
         elif topic_type == "settlement":
             settlements = ["Oakhaven", "Stonewatch", "Crystalbrook", "Moonhaven"]
-            topic_name = random.choice(settlements) + " Settlement"
+            topic_name = self.rng.choice(settlements) + " Settlement"
         else:
-            topic_name = prefix + random.choice([
+            topic_name = prefix + self.rng.choice([
                 "Military Organization", "Herbal Practices", "Stone Classifications",
                 "Trade Routes", "Festival Calendar", "Defensive Strategies"
             ])
@@ -784,33 +852,33 @@ class FictionalDocumentGenerator:
 
         metadata = {
             'title': f"Encyclopedia: {full_topic}",
-            'author': random.choice(["Emerald Valley Scholars", "Lorekeeper Archives", "Imperial Geographers", "Traveler's Compendium"]),
-            'publication_date': f"{random.randint(45, 50)} {self.world_data.get('era_suffix', 'AM')}",
+            'author': self.rng.choice(["Emerald Valley Scholars", "Lorekeeper Archives", "Imperial Geographers", "Traveler's Compendium"]),
+            'publication_date': f"{self.rng.randint(45, 50)} {self.world_data.get('era_suffix', 'AM')}",
             'keywords': [self.world_data.get('country_name', 'Veridia'), "fictional", topic_type]
         }
 
         # Генерируем уникальный контент
         if topic_type == "elixir":
-            content = self.content_gen.generate_elixir_article()
+            content = self.content_gen.unique_text(self.content_gen.generate_elixir_article)
         elif topic_type == "settlement":
-            content = self.content_gen.generate_settlement_article()
+            content = self.content_gen.unique_text(self.content_gen.generate_settlement_article)
         else:
             content = self.content_gen.get_unique_content(
                 self._generate_general_article, full_topic, topic_type
             )
 
         # Добавляем БОЛЬШЕ ссылок
-        content += "\n\n## Related Documents\n"
+        parts = [content, "\n\n## Related Documents\n"]
         if len(self.doc_ids) > 5:
-            related = random.sample([d for d in self.doc_ids if d != doc_id], min(5, len(self.doc_ids) - 1))
+            related = self.rng.sample([d for d in self.doc_ids if d != doc_id], min(5, len(self.doc_ids) - 1))
             for doc in related:
-                content += f"- {doc}\n"
+                parts.append(f"- {doc}\n")
                 # Добавляем краткое описание
-                content += f"  *Covers related aspects of {full_topic.lower()}*\n"
+                parts.append(f"  *Covers related aspects of {full_topic.lower()}*\n")
         else:
-            content += "- No related documents yet\n"
+            parts.append("- No related documents yet\n")
 
-        return content, metadata
+        return "".join(parts), metadata
 
     def _generate_general_article(self, topic, topic_type):
         """Генерирует общую статью"""
@@ -822,14 +890,14 @@ This article covers the {topic_type} aspects of {topic} within the context of {s
 
 ## Key Features
 
-1. **Primary Characteristics**: {random.choice(['Unique properties distinct from other regions', 'Standard features common across similar entities', 'Evolving nature adapting to environmental factors'])}
-2. **Historical Development**: Evolved over {random.randint(5, 50)} generations since {random.choice(['the Great Accord', 'the Moonfall', 'the Crystal War'])}
-3. **Current Status**: {random.choice(['Stable and well-documented', 'Undergoing significant changes', 'Subject to ongoing research and debate'])}
-4. **Future Prospects**: {random.choice(['Expected to remain consistent', 'Likely to evolve with new discoveries', 'Facing challenges from external factors'])}
+1. **Primary Characteristics**: {self.content_gen.rng.choice(['Unique properties distinct from other regions', 'Standard features common across similar entities', 'Evolving nature adapting to environmental factors'])}
+2. **Historical Development**: Evolved over {self.content_gen.rng.randint(5, 50)} generations since {self.content_gen.rng.choice(['the Great Accord', 'the Moonfall', 'the Crystal War'])}
+3. **Current Status**: {self.content_gen.rng.choice(['Stable and well-documented', 'Undergoing significant changes', 'Subject to ongoing research and debate'])}
+4. **Future Prospects**: {self.content_gen.rng.choice(['Expected to remain consistent', 'Likely to evolve with new discoveries', 'Facing challenges from external factors'])}
 
 ## Significance
 
-The study of {topic} provides insights into {random.choice([
+The study of {topic} provides insights into {self.content_gen.rng.choice([
             'broader cultural patterns',
             'technological advancements',
             'environmental adaptations',
@@ -838,36 +906,36 @@ The study of {topic} provides insights into {random.choice([
 
 ## Research Notes
 
-Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial survey teams', 'Independent scholars'])} have revealed {random.choice([
+Recent investigations by {self.content_gen.rng.choice(['Lorekeeper expeditions', 'Imperial survey teams', 'Independent scholars'])} have revealed {self.content_gen.rng.choice([
             'previously undocumented variations',
             'connections to ancient practices',
             'practical applications for daily life',
             'potential risks requiring mitigation'
         ])}.
 
-**Further reading**: Consult related documents on {random.choice(['regional histories', 'technical manuals', 'cultural studies', 'economic analyses'])} for comprehensive understanding."""
+**Further reading**: Consult related documents on {self.content_gen.rng.choice(['regional histories', 'technical manuals', 'cultural studies', 'economic analyses'])} for comprehensive understanding."""
 
     def _journal_template(self, doc_id):
         """Шаблон для журнальной записи"""
         author_roles = ['hero', 'alchemist', 'chief', 'strong_hero']
-        author_role = random.choice(author_roles)
+        author_role = self.rng.choice(author_roles)
 
         metadata = {
             'title': f"Personal Journal of {self.content_gen.get_character(author_role)}",
             'author': self.content_gen.get_character(author_role),
-            'journal_type': random.choice(['Field Notes', 'Personal Reflections', 'Daily Log', 'Observational Record']),
-            'period': random.choice(['Current Cycle', 'Recent Months', 'Seasonal Record', 'Ongoing Documentation'])
+            'journal_type': self.rng.choice(['Field Notes', 'Personal Reflections', 'Daily Log', 'Observational Record']),
+            'period': self.rng.choice(['Current Cycle', 'Recent Months', 'Seasonal Record', 'Ongoing Documentation'])
         }
 
-        content = self.content_gen.generate_journal_entry(author_role)
+        content = self.content_gen.unique_text(self.content_gen.generate_journal_entry, author_role)
 
         # Добавляем БОЛЬШЕ ссылок
         if len(self.doc_ids) > 3:
-            related = random.sample([d for d in self.doc_ids if d != doc_id], min(3, len(self.doc_ids) - 1))
-            content += f"\n\n**Related entries:** {', '.join(related)}"
+            related = self.rng.sample([d for d in self.doc_ids if d != doc_id], min(3, len(self.doc_ids) - 1))
+            parts = [content, f"\n\n**Related entries:** {', '.join(related)}"]
             # Добавляем явные ссылки
-            for ref_doc in related[:2]:
-                content += f"\n- See {ref_doc} for additional context on today's events"
+            parts.extend(f"\n- See {ref_doc} for additional context on today's events" for ref_doc in related[:2])
+            content = "".join(parts)
 
         return content, metadata
 
@@ -875,23 +943,23 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
         """Шаблон для отчёта"""
         metadata = {
             'title': "Field Report",
-            'author': random.choice(["Imperial Scout", "Lorekeeper Observer", "Trade Guild Agent", "Independent Researcher"]),
-            'classification': random.choice(["CONFIDENTIAL", "INTERNAL USE", "PUBLIC DOMAIN", "RESTRICTED ACCESS"]),
-            'subject_area': random.choice(["Military", "Economics", "Culture", "Resources", "Infrastructure"])
+            'author': self.rng.choice(["Imperial Scout", "Lorekeeper Observer", "Trade Guild Agent", "Independent Researcher"]),
+            'classification': self.rng.choice(["CONFIDENTIAL", "INTERNAL USE", "PUBLIC DOMAIN", "RESTRICTED ACCESS"]),
+            'subject_area': self.rng.choice(["Military", "Economics", "Culture", "Resources", "Infrastructure"])
         }
 
-        content = self.content_gen.generate_report()
+        content = self.content_gen.unique_text(self.content_gen.generate_report)
 
         # Добавляем БОЛЬШЕ ссылок
         if len(self.doc_ids) > 3:
-            related = random.sample([d for d in self.doc_ids if d != doc_id and ('REP' in d or 'ENCY' in d or 'JOUR' in d)],
+            related = self.rng.sample([d for d in self.doc_ids if d != doc_id and ('REP' in d or 'ENCY' in d or 'JOUR' in d)],
                                     min(3, len(self.doc_ids) - 1))
             if related:
-                content += f"\n\n**Reference documents:** {', '.join(related)}"
+                parts = [content, f"\n\n**Reference documents:** {', '.join(related)}"]
                 # Добавляем пояснения
-                content += "\n\n**Cross-references:**"
-                for ref_doc in related:
-                    content += f"\n- {ref_doc}: Provides supporting data for findings"
+                parts.append("\n\n**Cross-references:**")
+                parts.extend(f"\n- {ref_doc}: Provides supporting data for findings" for ref_doc in related)
+                content = "".join(parts)
 
         return content, metadata
 
@@ -899,19 +967,22 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
         """Шаблон для указа"""
         metadata = {
             'title': "Official Decree",
-            'authority': random.choice(["Chief's Council", "Lorekeeper Assembly", "Defense Command", "Trade Directorate"]),
-            'jurisdiction': random.choice(["Oakhaven Settlement", "Emerald Valley Region", "Allied Territories", "Trade Network"]),
-            'effective_date': f"{random.choice(['Immediately', 'Next Moon Cycle', 'Beginning of Season'])}"
+            'authority': self.rng.choice(["Chief's Council", "Lorekeeper Assembly", "Defense Command", "Trade Directorate"]),
+            'jurisdiction': self.rng.choice(["Oakhaven Settlement", "Emerald Valley Region", "Allied Territories", "Trade Network"]),
+            'effective_date': f"{self.rng.choice(['Immediately', 'Next Moon Cycle', 'Beginning of Season'])}"
         }
 
-        content = self.content_gen.generate_decree()
+        content = self.content_gen.unique_text(self.content_gen.generate_decree)
 
         # Добавляем БОЛЬШЕ ссылок
         if len(self.doc_ids) > 2:
             related = [d for d in self.doc_ids if d != doc_id and ('DECR' in d or 'ENCY' in d)]
             if related:
-                content += f"\n\n**Related decrees and laws:** {', '.join(related[:3])}"
-                content += f"\n**See also:** Legal precedents and historical regulations"
+                content = "".join([
+                    content,
+                    f"\n\n**Related decrees and laws:** {', '.join(related[:3])}",
+                    "\n**See also:** Legal precedents and historical regulations"
+                ])
 
         return content, metadata
 
@@ -919,19 +990,22 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
         """Шаблон для мифа"""
         metadata = {
             'title': "Ancient Legend",
-            'storyteller': random.choice(["Elder Chronicler", "Memory Keeper", "Dream Interpreter", "Star Reader"]),
-            'origin_culture': random.choice(["Valley Folk", "Mountain Tribes", "River People", "Forest Dwellers"]),
-            'estimated_age': f"{random.randint(100, 1000)} years"
+            'storyteller': self.rng.choice(["Elder Chronicler", "Memory Keeper", "Dream Interpreter", "Star Reader"]),
+            'origin_culture': self.rng.choice(["Valley Folk", "Mountain Tribes", "River People", "Forest Dwellers"]),
+            'estimated_age': f"{self.rng.randint(100, 1000)} years"
         }
 
-        content = self.content_gen.generate_myth()
+        content = self.content_gen.unique_text(self.content_gen.generate_myth)
 
         # Добавляем БОЛЬШЕ ссылок
         if len(self.doc_ids) > 2:
             related = [d for d in self.doc_ids if d != doc_id and ('MYTH' in d or 'ENCY' in d)]
             if related:
-                content += f"\n\n**Related legends and lore:** {', '.join(related[:3])}"
-                content += f"\n**Cultural context:** Additional myths provide complementary perspectives"
+                content = "".join([
+                    content,
+                    f"\n\n**Related legends and lore:** {', '.join(related[:3])}",
+                    "\n**Cultural context:** Additional myths provide complementary perspectives"
+                ])
 
         return content, metadata
 
@@ -939,12 +1013,12 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
         """Шаблон для письма"""
         metadata = {
             'title': "Personal Correspondence",
-            'correspondence_type': random.choice(["Private Letter", "Official Communication", "Informal Note", "Diplomatic Message"]),
-            'delivery_method': random.choice(["Carrier Bird", "Trusted Messenger", "Trade Caravan", "Hidden Compartment"]),
-            'security_level': random.choice(["Unsecured", "Coded", "Encrypted", "Self-destructing"])
+            'correspondence_type': self.rng.choice(["Private Letter", "Official Communication", "Informal Note", "Diplomatic Message"]),
+            'delivery_method': self.rng.choice(["Carrier Bird", "Trusted Messenger", "Trade Caravan", "Hidden Compartment"]),
+            'security_level': self.rng.choice(["Unsecured", "Coded", "Encrypted", "Self-destructing"])
         }
 
-        content = self.content_gen.generate_letter()
+        content = self.content_gen.unique_text(self.content_gen.generate_letter)
 
         return content, metadata
 
@@ -964,16 +1038,17 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
         ]
 
         for doc in self.documents:
-            content = doc['raw_content']
+            # Ссылки вставляются внутрь текста: факты размечаются, чтобы пересчитать их позиции
+            content = mark_facts(doc['raw_content'], doc['facts'])
             sentences = [s.strip() for s in content.split('. ') if s.strip()]
 
             if len(sentences) > 3 and len(self.doc_ids) > 3:
                 # УВЕЛИЧИВАЕМ: было 1-2, теперь 3-6 ссылок
-                refs_to_add = random.randint(3, 6)
+                refs_to_add = self.rng.randint(3, 6)
                 available_refs = [d for d in self.doc_ids if d != doc['id']]
 
                 if available_refs:
-                    selected_refs = random.sample(
+                    selected_refs = self.rng.sample(
                         available_refs,
                         min(refs_to_add, len(available_refs))
                     )
@@ -981,16 +1056,14 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
                     added_refs = 0
                     for ref_doc in selected_refs:
                         if len(sentences) > 4 and added_refs < 4:  # Максимум 4 ссылки на документ
-                            insert_idx = random.randint(1, len(sentences) - 2)
-                            phrase = random.choice(reference_phrases).replace("{DOC}", ref_doc)
+                            insert_idx = self.rng.randint(1, len(sentences) - 2)
+                            phrase = self.rng.choice(reference_phrases).replace("{DOC}", ref_doc)
                             sentences[insert_idx] = sentences[insert_idx] + phrase
                             added_refs += 1
 
-                    doc['raw_content'] = '. '.join(sentences)
-
-                    # Обновляем контент
-                    metadata_str = self.content_gen.format_metadata(doc['metadata'])
-                    doc['content'] = f"---\n{metadata_str}\n---\n\n{doc['raw_content']}"
+                    body, spans = resolve_fact_marks('. '.join(sentences))
+                    doc['raw_content'] = body
+                    doc['facts'] = [(*doc['facts'][number][:3], start, end) for number, start, end in spans]
 
     def _add_explicit_references(self):
         """Добавляет явные ссылки между тематически связанными документами"""
@@ -1030,17 +1103,13 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
                     other_docs = [d for d in docs if d['id'] != doc['id']]
                     if other_docs:
                         # Выбираем 1-2 документа для ссылки
-                        ref_docs = random.sample(other_docs, min(2, len(other_docs)))
+                        ref_docs = self.rng.sample(other_docs, min(2, len(other_docs)))
 
                         for ref_doc in ref_docs:
                             ref_text = f"\n\n**Related to {topic}:** See {ref_doc['id']} for complementary information."
                             doc['raw_content'] += ref_text
                             references_added += 1
 
-                            # Обновляем полный контент
-                            metadata_str = self.content_gen.format_metadata(doc['metadata'])
-                            doc['content'] = f"---\n{metadata_str}\n---\n\n{doc['raw_content']}"
-
         print(f"  Added {references_added} explicit cross-references")
 
     def save_documents(self, knowledge_base_folder="knowledge_base", generated_folder="generated"):
@@ -1076,169 +1145,220 @@ Recent investigations by {random.choice(['Lorekeeper expeditions', 'Imperial sur
 
         return len(self.documents)
 
-def generate_qa_pairs(documents, world_data, terms_map, generated_folder="generated"):
-    """Генерирует QA пары двух типов: Few-Shot и Chain-of-Thought"""
+def generate_qa_pairs(documents, world_data, terms_map, generated_folder="generated", provenance=None,
+                      pairs_per_type=5):
+    """Генерирует QA пары двух типов: Few-Shot и Chain-of-Thought
 
-    print("\nGenerating QA pairs...")
+    Вопрос и ответ строятся из значения конкретного факта корпуса
+    (атрибут, сущность, значение) из индекса происхождения: ответ опирается
+    на все answer_spans этого факта, source_docs — документы с ними. Берётся
+    значение, подтверждённое наибольшим числом документов; факты нескольких
+    атрибутов одной пары берутся об одной сущности, если так задано.
 
-    # Собираем информацию из документов
-    doc_by_type = {}
-    for doc in documents:
-        doc_type = doc['type']
-        if doc_type not in doc_by_type:
-            doc_by_type[doc_type] = []
-        doc_by_type[doc_type].append(doc['id'])
+    Шаблонов пар больше, чем pairs_per_type: берутся первые, чьи факты
+    отрендерены в корпусе. Если их не хватает, пары не пишутся — ValueError.
+    """
+
+    print("\nGenerating QA pairs...")
+    if provenance is None:
+        provenance = ProvenanceIndex.from_documents(documents)
 
     # Получаем вымышленные термины
     hero = terms_map.get("characters", {}).get("Hero", "Veridix")
-    strong_hero = terms_map.get("characters", {}).get("Strong Hero", "Megalix")
-    alchemist = terms_map.get("characters", {}).get("Alchemist", "Alchemix")
     chief = terms_map.get("characters", {}).get("Chief", "Stentorix")
     bard = terms_map.get("characters", {}).get("Bard", "Melodix")
 
-    magic_potion = terms_map.get("items", {}).get("Magic Potion", "Sunstone Elixir")
-    village = terms_map.get("terms", {}).get("village", "Oakhaven")
-
-    # Генерируем QA пары
-    qa_pairs = []
+    def fact(attribute, entity=None):
+        """Самый подтверждённый факт атрибута: {'key', 'entity', 'value'} или None"""
+        keys = provenance.keys(attribute, entity)
+        if not keys:
+            return None
+        _, entity, value = split_fact_key(keys[0])
+        return {'key': keys[0], 'entity': entity, 'value': value}
+
+    def entity_facts(*attributes):
+        """Факты всех атрибутов об одной сущности (первой по подтверждённости, у которой есть все)"""
+        for key in provenance.keys(attributes[0]):
+            facts = [fact(attribute, split_fact_key(key)[1]) for attribute in attributes]
+            if all(facts):
+                return facts
+        return [None]
+
+    def event_faction():
+        """Событие мифа и символ одной из его фракций из указа (факты разных документов)"""
+        symbols = [fact('factions.symbol', split_fact_key(key)[1]) for key in provenance.keys('factions.symbol')]
+        for key in provenance.keys('historical_events.factions_involved'):
+            event = fact('historical_events.factions_involved', split_fact_key(key)[1])
+            for symbol in symbols:
+                if symbol['entity'] in event['value']:
+                    return [event, symbol]
+        return [None]
+
+    def qa_pair(template_type, facts, texts, difficulty, category, reasoning_steps=lambda *facts: []):
+        if not all(facts):
+            return None
+        question, answer = texts(*facts)
+        spans = [span for f in facts for span in provenance.spans_for(f['key'])]
+        return {
+            "template_type": template_type,
+            "question": question,
+            "answer": answer,
+            "source_docs": list(dict.fromkeys(span['doc_id'] for span in spans)),
+            "difficulty": difficulty,
+            "category": category,
+            "answer_facts": [f['key'] for f in facts],
+            "context_required": True,
+            "reasoning_steps": reasoning_steps(*facts),
+            "answer_spans": spans
+        }
 
     # 1. Few-Shot Template QA pairs
     few_shot_qa = [
-        {
-            "template_type": "few_shot",
-            "question": f"What are the main ingredients of {magic_potion}?",
-            "answer": f"The primary ingredient of {magic_potion} is moonleaf harvested during specific celestial alignments, along with secondary components like star-moss and crystalized dew.",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_001', 'ENCY_010'])[:2],
-            "difficulty": "easy",
-            "category": "magic_items",
-            "context_required": True,
-            "reasoning_steps": []
-        },
-        {
-            "template_type": "few_shot",
-            "question": f"Why is {strong_hero} permanently strong?",
-            "answer": f"{strong_hero} gained permanent strength from accidental exposure to {magic_potion} as an infant, unlike others who need to consume it regularly for temporary effects.",
-            "source_docs": doc_by_type.get('myth', ['MYTH_001']) + doc_by_type.get('encyclopedia', ['ENCY_005'])[:1],
-            "difficulty": "medium",
-            "category": "characters",
-            "context_required": True,
-            "reasoning_steps": []
-        },
-        {
-            "template_type": "few_shot",
-            "question": f"What are the defenses of {village}?",
-            "answer": f"{village} uses natural terrain advantages, strategic monolith placements, trained militia, and early warning systems for defense against Imperial forces.",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_002'])[:1] + doc_by_type.get('report', ['REP_005'])[:1],
-            "difficulty": "medium",
-            "category": "defense",
-            "context_required": True,
-            "reasoning_steps": []
-        },
-        {
-            "template_type": "few_shot",
-            "question": f"What is {alchemist}'s primary responsibility?",
-            "answer": f"{alchemist} is responsible for brewing the {magic_potion}, studying medicinal herbs, preserving ancient knowledge, and serving as a healer for the community.",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_004'])[:1] + doc_by_type.get('journal', ['JOURN_003'])[:1],
-            "difficulty": "easy",
-            "category": "roles",
-            "context_required": True,
-            "reasoning_steps": []
-        },
-        {
-            "template_type": "few_shot",
-            "question": "How are standing stones classified?",
-            "answer": "Standing stones are classified into three sizes: Standard (2 meters), Grande (3 meters), and Colossal (4+ meters), each with different uses and significance.",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_005'])[:1] + doc_by_type.get('report', ['REP_007'])[:1],
-            "difficulty": "easy",
-            "category": "artifacts",
-            "context_required": True,
-            "reasoning_steps": []
-        }
+        qa_pair("few_shot", [fact('elixir_ingredient')], lambda f: (
+            f"What is the primary ingredient of {f['entity']}?",
+            f"The primary ingredient of {f['entity']} is {f['value']}."
+        ), "easy", "magic_items"),
+        qa_pair("few_shot", [fact('strong_hero_exposure')], lambda f: (
+            f"Why is {f['entity']} permanently strong?",
+            f"{f['value']}."
+        ), "medium", "characters"),
+        qa_pair("few_shot", [fact('settlement_defense')], lambda f: (
+            f"What enhances the defensive perimeter of {f['entity']}?",
+            f"The defensive perimeter of {f['entity']} is enhanced with {f['value']}."
+        ), "medium", "defense"),
+        qa_pair("few_shot", [fact('alchemist_role')], lambda f: (
+            f"Who prepares the {f['entity']}?",
+            f"The {f['entity']} is a legendary concoction {f['value']}."
+        ), "easy", "roles"),
+        qa_pair("few_shot", [fact('elixir_effect')], lambda f: (
+            f"What are the primary effects of {f['entity']}?",
+            f"Primary effects of {f['entity']} include {f['value']}."
+        ), "easy", "magic_items"),
+        # Факты записей мира из журналов, мифов, указов и статей об эликсирах
+        qa_pair("few_shot", [fact('characters.unique_feature')], lambda f: (
+            f"What distinguishes {f['entity']} from others?",
+            f"{f['entity']} {f['value']}."
+        ), "easy", "characters"),
+        qa_pair("few_shot", [fact('characters.skills')], lambda f: (
+            f"What is {f['entity']} skilled in?",
+            f"{f['entity']} is skilled in {f['value']}."
+        ), "easy", "characters"),
+        qa_pair("few_shot", [fact('magic_items.effects')], lambda f: (
+            f"What does the {f['entity']} grant?",
+            f"The {f['entity']} grants {f['value']}."
+        ), "easy", "magic_items"),
+        qa_pair("few_shot", [fact('historical_events.year')], lambda f: (
+            f"When did {f['entity']} take place?",
+            f"{f['entity']} took place in {f['value']}."
+        ), "easy", "history"),
+        qa_pair("few_shot", [fact('factions.symbol')], lambda f: (
+            f"What is the symbol of the {f['entity']}?",
+            f"The symbol of the {f['entity']} is the {f['value']}."
+        ), "easy", "factions")
     ]
 
     # 2. Chain-of-Thought QA pairs
     chain_of_thought_qa = [
-        {
-            "template_type": "chain_of_thought",
-            "question": f"Based on the documents, explain how {hero} typically approaches conflicts with Imperial forces and why this strategy is effective.",
-            "answer": f"""{hero}'s strategy involves three key elements: 1) Strategic use of {magic_potion} for enhanced capabilities during critical moments, 2) Utilization of terrain knowledge to control engagement locations, and 3) Coordinated actions with {strong_hero} and other defenders. This approach is effective because it maximizes limited resources, exploits Imperial reliance on conventional tactics, and leverages local knowledge advantages.""",
-            "source_docs": doc_by_type.get('journal', ['JOURN_001', 'JOURN_003'])[:2] + doc_by_type.get('report', ['REP_002'])[:1],
-            "difficulty": "hard",
-            "category": "strategy",
-            "context_required": True,
-            "reasoning_steps": [
-                "First, identify {hero}'s resources and limitations from settlement documents",
-                "Second, analyze Imperial tactical patterns from military reports",
-                "Third, examine specific conflict accounts in journal entries",
-                "Fourth, synthesize how {hero}'s approach counters Imperial weaknesses",
-                "Finally, evaluate effectiveness based on documented outcomes"
-            ]
-        },
-        {
-            "template_type": "chain_of_thought",
-            "question": f"Trace the economic relationship between {village} and nearby settlements, explaining both dependencies and points of friction.",
-            "answer": f"""The economic relationship involves: 1) {village} exports standing stones and herbal remedies, 2) Imports essential goods like olive oil and tools from trading ports, 3) Experiences friction over trade route control and resource access rights, 4) Maintains delicate balance between self-sufficiency and interdependence. Key friction points include disputes over quarrying rights and competition for limited trading partnerships.""",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_005'])[:1] + doc_by_type.get('report', ['REP_003', 'REP_007'])[:2] + doc_by_type.get('letter', ['LETTER_001'])[:1],
-            "difficulty": "hard",
-            "category": "economics",
-            "context_required": True,
-            "reasoning_steps": [
-                "Identify {village}'s primary exports from economic documents",
-                "List imported goods and their sources from trade records",
-                "Analyze conflict documentation for friction points",
-                "Examine negotiation records for relationship dynamics",
-                "Synthesize into comprehensive economic relationship analysis"
-            ]
-        },
-        {
-            "template_type": "chain_of_thought",
-            "question": f"Compare and contrast the leadership styles of {chief} and the Imperial commander, analyzing their effectiveness in their respective contexts.",
-            "answer": f"""{chief} employs consensual, tradition-based leadership emphasizing community cohesion and adaptive defense. The Imperial commander uses hierarchical, discipline-focused command prioritizing expansion and control. {chief}'s style excels in maintaining morale and leveraging local knowledge but struggles with rapid large-scale coordination. The Imperial approach enables efficient large-force management but fails against unconventional resistance and alienates local populations. Effectiveness depends entirely on context: Imperial methods work for territorial control, while {chief}'s approach succeeds in community defense.""",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_002'])[:1] + doc_by_type.get('report', ['REP_001', 'REP_004'])[:2] + doc_by_type.get('journal', ['JOURN_005'])[:1],
-            "difficulty": "hard",
-            "category": "leadership",
-            "context_required": True,
-            "reasoning_steps": [
-                "Extract leadership principles from {chief}'s documented decisions",
-                "Analyze Imperial command structure from military documents",
-                "Compare outcomes in specific documented conflicts",
-                "Evaluate adaptability to different situations",
-                "Assess long-term effectiveness in respective goals"
-            ]
-        },
-        {
-            "template_type": "chain_of_thought",
-            "question": f"Analyze the role of {bard} in the community, explaining both the cultural significance and the practical challenges this role presents.",
-            "answer": f"""{bard} serves as cultural preserver, entertainer, and historical chronicler. Cultural significance includes: 1) Transmission of oral history and traditions, 2) Reinforcement of community identity through performance, 3) Mediation of social tensions through satire. Practical challenges include: 1) Balancing artistic expression with community standards, 2) Economic dependence on community support, 3) Preservation of accuracy in historical accounts, 4) Navigation of political sensitivities in content.""",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_006'])[:1] + doc_by_type.get('journal', ['JOURN_004', 'JOURN_007'])[:2] + doc_by_type.get('decree', ['DECR_002'])[:1],
-            "difficulty": "medium",
-            "category": "culture",
-            "context_required": True,
-            "reasoning_steps": [
-                "Identify documented performances and their reception",
-                "Analyze community regulations affecting {bard}'s role",
-                "Examine historical accounts preserved by {bard}",
-                "Evaluate economic and social support systems",
-                "Synthesize into comprehensive role analysis"
-            ]
-        },
-        {
-            "template_type": "chain_of_thought",
-            "question": "Explain the ecological adaptation strategies of the settlement and how they reflect the community's relationship with the environment.",
-            "answer": """Ecological adaptation strategies include: 1) Seasonal migration patterns following resource availability, 2) Sustainable harvesting techniques preserving regeneration capacity, 3) Integration of settlement design with natural topography, 4) Use of native materials in construction. These strategies reflect a symbiotic relationship where the community views itself as part of the ecosystem rather than separate from it, prioritizing long-term sustainability over short-term exploitation.""",
-            "source_docs": doc_by_type.get('encyclopedia', ['ENCY_007', 'ENCY_009'])[:2] + doc_by_type.get('report', ['REP_006'])[:1] + doc_by_type.get('journal', ['JOURN_008'])[:1],
-            "difficulty": "hard",
-            "category": "ecology",
-            "context_required": True,
-            "reasoning_steps": [
-                "Document resource management practices",
-                "Analyze settlement design in relation to environment",
-                "Examine seasonal patterns and adaptations",
-                "Identify philosophical principles in community documents",
-                "Synthesize into ecological relationship analysis"
-            ]
-        }
+        qa_pair("chain_of_thought", [fact('hero_strategy'), fact('hero_defenders')], lambda strategy, defenders: (
+            f"Based on the documents, explain how {hero} confronts Imperial forces and who fights alongside {hero}.",
+            f"According to the article on the {strategy['entity']}, {strategy['value']}. "
+            f"In {defenders['entity']}, the defenders are {defenders['value']}."
+        ), "hard", "strategy", lambda strategy, defenders: [
+            f"Find how {hero} uses the {strategy['entity']} in the article about it",
+            f"Find who the defenders of {defenders['entity']} are in the settlement article",
+            f"Combine both into {hero}'s approach to Imperial forces"
+        ]),
+        qa_pair("chain_of_thought", entity_facts('settlement_economy', 'settlement_trade'), lambda economy, trade: (
+            f"Describe the economy of {economy['entity']}: its primary activities and its trade.",
+            f"Primary economic activities of {economy['entity']} include {economy['value']}. "
+            f"The settlement {trade['value']}."
+        ), "hard", "economics", lambda economy, trade: [
+            f"Find the settlement article about {economy['entity']}",
+            "Identify its primary economic activities",
+            "Identify its trade partners and imported goods",
+            "Combine both into a description of the economy"
+        ]),
+        qa_pair("chain_of_thought", [fact('chief_authority')], lambda f: (
+            f"Describe the social structure of {f['entity']} and the place of {chief} in it.",
+            f"{f['value']} of {f['entity']}, followed by defenders, artisans, scholars and entertainers."
+        ), "hard", "leadership", lambda f: [
+            f"Find the settlement article about {f['entity']}",
+            f"Locate {chief} in its social hierarchy",
+            "List the groups that follow in the hierarchy"
+        ]),
+        qa_pair("chain_of_thought", [fact('bard_performance')], lambda f: (
+            f"What role does {bard} play in {f['entity']}, and how are the performances received?",
+            f"Among the entertainers of {f['entity']} — {f['value'][:1].lower()}{f['value'][1:]}."
+        ), "medium", "culture", lambda f: [
+            f"Find the settlement article about {f['entity']}",
+            f"Find {bard} in its social structure",
+            "Read how the performances are received during gatherings"
+        ]),
+        qa_pair("chain_of_thought", [fact('settlement_feature')], lambda f: (
+            f"What makes {f['entity']} unique among the settlements?",
+            f"What makes {f['entity']} unique is its {f['value']}."
+        ), "medium", "settlements", lambda f: [
+            f"Find the settlement article about {f['entity']}",
+            "Read its notable features"
+        ]),
+        qa_pair("chain_of_thought", entity_facts('characters.skills', 'characters.unique_feature'), lambda skills, feature: (
+            f"Describe {skills['entity']}: what is {skills['entity']} skilled in, and what sets {skills['entity']} apart?",
+            f"{skills['entity']} is skilled in {skills['value']}, and {feature['value']}."
+        ), "medium", "characters", lambda skills, feature: [
+            f"Find a journal entry by {skills['entity']}",
+            "Read the skills listed about the author",
+            "Read the feature that sets the author apart"
+        ]),
+        qa_pair("chain_of_thought", entity_facts('historical_events.factions_involved', 'historical_events.impact'),
+                lambda factions, impact: (
+            f"Which factions were involved in {factions['entity']}, and how great was its impact on the realm?",
+            f"{factions['entity']} involved {factions['value']} and had a {impact['value']} impact on the realm."
+        ), "medium", "history", lambda factions, impact: [
+            f"Find the myth that links its outcome to {factions['entity']}",
+            "Identify the factions involved",
+            "Identify the impact of the event on the realm"
+        ]),
+        qa_pair("chain_of_thought", entity_facts('magic_items.type', 'magic_items.effects'), lambda kind, effects: (
+            f"What kind of item is the {kind['entity']}, and what does it grant?",
+            f"The {kind['entity']} is a {kind['value']} that grants {effects['value']}."
+        ), "medium", "magic_items", lambda kind, effects: [
+            f"Find the elixir article that compares an elixir with the {kind['entity']}",
+            "Identify the type of the item",
+            "Identify what the item grants"
+        ]),
+        qa_pair("chain_of_thought", entity_facts('factions.type', 'factions.symbol'), lambda kind, symbol: (
+            f"What kind of faction is the {kind['entity']}, and what is its symbol?",
+            f"The {kind['entity']} is a {kind['value']} faction whose symbol is the {symbol['value']}."
+        ), "medium", "factions", lambda kind, symbol: [
+            f"Find the decree issued with the support of the {kind['entity']}",
+            "Identify the type of the faction",
+            "Identify its symbol"
+        ]),
+        qa_pair("chain_of_thought", entity_facts('elixir_ingredient', 'elixir_effect'), lambda ingredient, effect: (
+            f"What goes into {ingredient['entity']}, and what does drinking it do?",
+            f"The primary ingredient of {ingredient['entity']} is {ingredient['value']}; "
+            f"its primary effects include {effect['value']}."
+        ), "medium", "magic_items", lambda ingredient, effect: [
+            f"Find the encyclopedia article about {ingredient['entity']}",
+            "Identify its primary ingredient",
+            "Identify its primary effects"
+        ]),
+        qa_pair("chain_of_thought", event_faction(), lambda event, symbol: (
+            f"Which factions were involved in {event['entity']}, and what is the symbol of the {symbol['entity']}?",
+            f"{event['entity']} involved {event['value']}. The symbol of the {symbol['entity']} is the {symbol['value']}."
+        ), "hard", "history", lambda event, symbol: [
+            f"Find the myth that links its outcome to {event['entity']}",
+            f"Identify the factions involved, among them the {symbol['entity']}",
+            f"Find the decree issued with the support of the {symbol['entity']}",
+            "Read the symbol of the faction"
+        ])
     ]
+    few_shot_qa = [qa for qa in few_shot_qa if qa is not None][:pairs_per_type]
+    chain_of_thought_qa = [qa for qa in chain_of_thought_qa if qa is not None][:pairs_per_type]
+    for name, pairs in (("Few-Shot", few_shot_qa), ("Chain-of-Thought", chain_of_thought_qa)):
+        if len(pairs) < pairs_per_type:
+            raise ValueError(f"Corpus renders facts for only {len(pairs)} of {pairs_per_type} {name} QA pairs; "
+                             f"generate more documents")
 
     # Объединяем оба типа
     qa_pairs = few_shot_qa + chain_of_thought_qa
@@ -1266,6 +1386,21 @@ def generate_qa_pairs(documents, world_data, terms_map, generated_folder="genera
 
     return qa_pairs
 
+def _write_distractor_shard(task, output_folder, answer_pattern, generated_date):
+    """Шард документов-шума в процессе-воркере: мир читается из разделяемой памяти"""
+    shared = worker_world()
+    generator = FictionalDocumentGenerator(shared.world_data, shared.terms_map, rng=random.Random(task[3]))
+    return generator.write_distractor_shard(task, output_folder, answer_pattern, generated_date)
+
+def iter_distractor_documents(folder="distractors"):
+    """Читает шарды документов-шума: пары (doc_id, content) для построения индексов"""
+    for filename in sorted(os.listdir(folder)):
+        if filename.startswith('distractors_') and filename.endswith('.jsonl'):
+            with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
+                for line in f:
+                    doc = json.loads(line)
+                    yield doc['id'], doc['content']
+
 def save_world_data(world_data, terms_map, generated_folder="generated"):
     """Сохраняет данные мира в generated папке"""
 
@@ -1282,6 +1417,28 @@ def save_world_data(world_data, terms_map, generated_folder="generated"):
     print(f"✓ World data saved to {generated_folder}/")
     return world_data_path, terms_map_path
 
+def load_world_data(generated_folder="generated"):
+    """Мир, сохранённый save_world_data: (world_data, terms_map)"""
+    with open(f"{generated_folder}/fictional_world.json", 'r', encoding='utf-8') as f:
+        world_data = json.load(f)
+    with open(f"{generated_folder}/terms_map.json", 'r', encoding='utf-8') as f:
+        terms_map = json.load(f)
+    return world_data, terms_map
+
+def save_document_records(documents, generated_folder="generated"):
+    """Сохраняет записи документов в generated/documents.jsonl для следующих шагов"""
+    documents_path = f"{generated_folder}/documents.jsonl"
+    with open(documents_path, 'w', encoding='utf-8') as f:
+        for doc in documents:
+            f.write(doc.to_record())
+    print(f"✓ Saved {len(documents)} document records to {documents_path}")
+    return documents_path
+
+def load_document_records(generated_folder="generated"):
+    """Документы из generated/documents.jsonl"""
+    with open(f"{generated_folder}/documents.jsonl", 'r', encoding='utf-8') as f:
+        return [DocumentRecord.from_record(line) for line in f]
+
 def save_generation_stats(documents, world_data, generated_folder="generated"):
     """Сохраняет статистику генерации"""
 
@@ -1324,32 +1481,191 @@ def save_generation_stats(documents, world_data, generated_folder="generated"):
     print(f"✓ Generation stats saved to {stats_path}")
     return stats
 
-def main():
-    """Основная функция"""
+def save_shard_outputs(generator, shard, generated_folder="generated", checkpoint=None):
+    """Выходы шарда для merge_shards.py: записи документов, индексы по документам, QA, статистика"""
+    documents = generator.documents
+    save_document_records(documents, generated_folder)
+    save_world_data(generator.world_data, generator.terms_map, generated_folder)
+    save_entity_index(documents, generated_folder)
+    provenance = save_provenance_index(documents, generated_folder)
+    generate_qa_pairs(documents, generator.world_data, generator.terms_map, generated_folder, provenance)
+    save_generation_stats(documents, generator.world_data, generated_folder)
+
+    manifest = shard.manifest(generator.plan, generator.world_data, generator.terms_map)
+    save_shard_manifest(manifest, generated_folder)
+    if checkpoint is not None:
+        checkpoint.clear()
+
+    print(f"\n✅ Shard {shard.index}/{shard.count} complete: {len(documents)} documents "
+          f"(plan positions {manifest['start']:,}-{manifest['stop']:,})")
+    print(f"  Combine all {shard.count} shards with: python merge_shards.py <shard folders...>")
+
+def build_seeded_world(seed):
+    """Мир для --seed и состояние random сразу после его построения
+
+    Результат передаётся в main(world=...) вместо повторного построения:
+    генерация продолжается с того же места потока random, что и при
+    построении мира внутри main, поэтому корпус не меняется.
+    """
+    random.seed(seed)
+    builder = FictionalWorldBuilder()
+    world_data, _ = builder.build_world()
+    return world_data, builder.categories, random.getstate()
+
+def main(argv=None, world=None):
+    """Основная функция
+
+    world — результат build_seeded_world с тем же --seed (демон генерации
+    кэширует миры по зерну); игнорируется при --resume и --world-dir.
+    """
+    parser = argparse.ArgumentParser(description="Generate the fictional universe corpus")
+    parser.add_argument('--target-words', type=int, default=None,
+                        help="Length of every document in words (default: natural template length)")
+    parser.add_argument('--token-budget', type=int, default=None,
+                        help="Generate a corpus of exactly this many estimated tokens instead of 50 documents")
+    parser.add_argument('--lengths', default=None,
+                        help='Document length mixture for --token-budget in tokens, e.g. "500:0.6,4000:0.3,20000:0.1"')
+    parser.add_argument('--near-duplicate-distance', type=int, default=3,
+                        help="Reject drafts within this many SimHash bits of earlier text (-1 disables)")
+    parser.add_argument('--enumerate-templates', action='store_true',
+                        help="Draw unique slot combinations of each template instead of random retries")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for a reproducible corpus (world, documents and QA pairs)")
+    parser.add_argument('--batched-rng', action='store_true',
+                        help="Pre-draw document choices in NumPy blocks instead of per-call Python RNG")
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help="Save generation checkpoints to this folder (removed after a successful run)")
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+                        help="Documents between checkpoints")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue from the last checkpoint in --checkpoint-dir")
+    parser.add_argument('--shard', default=None, metavar='I/N',
+                        help='Generate only shard I of N (e.g. "0/4"); requires --seed, combine with merge_shards.py')
+    parser.add_argument('--output-dir', default=None,
+                        help="Folder for knowledge_base/ and generated/ (default: current directory)")
+    parser.add_argument('--world-dir', default=None,
+                        help="Use the world saved in this folder (fictional_world.json, terms_map.json) "
+                             "instead of building a new one")
+    parser.add_argument('--sqlite-store', action='store_true',
+                        help="Also save the corpus to generated/corpus.db (SQLite with FTS5)")
+    parser.add_argument('--fact-qa-limit', type=int, default=None,
+                        help="Write at most this many fact QA pairs (their number grows with the corpus)")
+    parser.add_argument('--documents-only', action='store_true',
+                        help="Stop after saving documents and generated/documents.jsonl "
+                             "(indexes and QA pairs are built by separate pipeline stages)")
+    args = parser.parse_args(argv)
+
     print("=" * 60)
     print("Generating Fictional Universe Documents")
     print("=" * 60)
 
-    # 1. Создаём генератор
-    generator = FictionalDocumentGenerator()
+    # 1. Создаём генератор (при продолжении — для мира из контрольной точки)
+    if args.seed is not None:
+        random.seed(args.seed)
+    checkpoint = None
+    world_data = terms_map = None
+    if args.checkpoint_dir:
+        checkpoint = GenerationCheckpoint(args.checkpoint_dir, args.checkpoint_every)
+        if args.resume and checkpoint.exists():
+            state = checkpoint.load()
+            world_data, terms_map = state['world_data'], state['terms_map']
+        elif args.resume:
+            print(f"⚠️  No checkpoint in {args.checkpoint_dir}/, starting from scratch")
+    elif args.resume:
+        parser.error("--resume requires --checkpoint-dir")
+    if world_data is None and args.world_dir:
+        world_data, terms_map = load_world_data(args.world_dir)
+    elif world_data is None and world is not None:
+        world_data, terms_map, random_state = world
+        random.setstate(random_state)
+    shard = None
+    if args.shard:
+        if args.seed is None:
+            parser.error("--shard requires --seed: all shards must build the same world and plan")
+        shard = Shard.parse(args.shard, args.seed)
+    rng = BatchedRandom(args.seed) if args.batched_rng else None
+    near_duplicate_distance = args.near_duplicate_distance if args.near_duplicate_distance >= 0 else None
+    generated_date = seeded_date(args.seed) if args.seed is not None else None
+    generator = FictionalDocumentGenerator(world_data, terms_map, near_duplicate_distance=near_duplicate_distance,
+                                           enumerate_templates=args.enumerate_templates, rng=rng,
+                                           generated_date=generated_date)
+    if args.enumerate_templates:
+        print("Template space capacity (unique document bodies per type):")
+        for doc_type, capacity in generator.template_capacity().items():
+            print(f"  {doc_type}: {capacity:,}")
 
     # 2. Генерируем документы
-    documents = generator.generate_document_set(50)
+    knowledge_base_folder = os.path.join(args.output_dir or "", "knowledge_base")
+    generated_folder = os.path.join(args.output_dir or "", "generated")
+
+    if args.token_budget:
+        lengths = parse_length_distribution(args.lengths) if args.lengths else None
+        documents, _ = generate_corpus_for_budget(generator, args.token_budget, length_distribution=lengths,
+                                                  report_path=f"{generated_folder}/corpus_plan_report.json",
+                                                  checkpoint=checkpoint, shard=shard)
+    else:
+        documents = generator.generate_document_set(50, target_words=args.target_words, checkpoint=checkpoint,
+                                                    shard=shard)
 
     # 3. Сохраняем документы базы знаний
-    knowledge_base_folder = "knowledge_base"
-    generated_folder = "generated"
 
     count = generator.save_documents(knowledge_base_folder, generated_folder)
 
-    # 4. Сохраняем данные мира
+    if shard is not None:
+        # Шард сохраняет свои документы и индексы; общие индексы строит merge_shards.py
+        save_shard_outputs(generator, shard, generated_folder, checkpoint)
+        return
+
+    if args.documents_only:
+        save_document_records(documents, generated_folder)
+        if not args.world_dir:
+            save_world_data(generator.world_data, generator.terms_map, generated_folder)
+        if checkpoint is not None:
+            checkpoint.clear()
+        return
+
+    # 4. Разбиваем документы на фрагменты с байтовыми смещениями
+    chunk_count = chunk_knowledge_base(knowledge_base_folder, f"{generated_folder}/chunks.jsonl")
+
+    # 5. Сохраняем данные мира
     save_world_data(generator.world_data, generator.terms_map, generated_folder)
 
-    # 5. Генерируем QA пары
-    qa_pairs = generate_qa_pairs(documents, generator.world_data, generator.terms_map, generated_folder)
+    # 6. Сохраняем индекс упоминаний сущностей
+    entity_index = save_entity_index(documents, generated_folder)
+
+    # 7. Сохраняем индекс происхождения фактов
+    provenance = save_provenance_index(documents, generated_folder)
+
+    # 8. Генерируем QA пары
+    qa_pairs = generate_qa_pairs(documents, generator.world_data, generator.terms_map, generated_folder, provenance)
+    fact_qa_count = generate_fact_qa_pairs(generator.world_data, provenance, generated_folder, args.fact_qa_limit)
+
+    # 9. Строим граф ссылок и многоходовые QA пары
+    graph = ReferenceGraph.from_documents(documents)
+    graph.save(f"{generated_folder}/reference_graph.json")
+    multi_hop_count = generate_multi_hop_qa_pairs(graph, documents, generated_folder)
+
+    # 10. Строим BM25 индекс базы знаний как базовый ретривер
+    bm25_index = save_bm25_index(knowledge_base_folder, generated_folder)
+
+    # 11. Подбираем hard negatives для всех QA пар
+    mine_hard_negatives(generator.world_data, knowledge_base_folder, generated_folder, bm25_index, entity_index,
+                        provenance=provenance)
+
+    # 12. Колоночный экспорт для потоковой загрузки (нужен pyarrow)
+    try:
+        export_columnar(knowledge_base_folder, generated_folder)
+    except ImportError as e:
+        print(f"⚠️  Skipping columnar export: {e}")
+
+    # 13. Сохраняем корпус в SQLite с полнотекстовым индексом (по запросу)
+    if args.sqlite_store:
+        save_corpus_store(documents, generated_folder)
 
-    # 6. Сохраняем статистику
+    # 14. Сохраняем статистику
     stats = save_generation_stats(documents, generator.world_data, generated_folder)
+    if checkpoint is not None:
+        checkpoint.clear()
 
     print("\n" + "=" * 60)
     print("GENERATION COMPLETE!")
@@ -1358,6 +1674,9 @@ def main():
     print(f"\n📊 Statistics:")
     print(f"  Documents in knowledge base: {count}")
     print(f"  QA pairs generated: {len(qa_pairs)}")
+    print(f"  Fact-based QA pairs generated: {fact_qa_count:,}")
+    print(f"  Multi-hop QA pairs generated: {multi_hop_count:,}")
+    print(f"  Chunks exported: {chunk_count:,}")
     print(f"  Universe: {generator.world_data['fictional_universe']}")
 
     print(f"\n📁 Folder Structure:")
@@ -1369,11 +1688,23 @@ def main():
         "fictional_world.json",
         "terms_map.json",
         "knowledge_base_index.json",
+        "chunks.jsonl",
+        "entity_index.json",
+        "provenance_index.json",
         "generation_stats.json",
         "qa_pairs.jsonl",
         "few_shot_qa_pairs.jsonl",
-        "chain_of_thought_qa_pairs.jsonl"
+        "chain_of_thought_qa_pairs.jsonl",
+        "fact_qa_pairs.jsonl",
+        "reference_graph.json",
+        "multi_hop_qa_pairs.jsonl",
+        "bm25_index/",
+        "columnar/"
     ]
+    if args.sqlite_store:
+        generated_files.append("corpus.db")
+    if args.token_budget:
+        generated_files.append("corpus_plan_report.json")
 
     for file in generated_files:
         print(f"  - {file}")
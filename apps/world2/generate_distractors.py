@@ -0,0 +1,70 @@
+# apps/world2/generate_distractors.py
+import argparse
+import json
+import os
+import time
+
+try:
+    from .fictional_document_generator import FictionalDocumentGenerator, iter_distractor_documents
+    from .provenance_index import ProvenanceIndex
+    from .bm25_index import BM25Index
+except ImportError:
+    from fictional_document_generator import FictionalDocumentGenerator, iter_distractor_documents
+    from provenance_index import ProvenanceIndex
+    from bm25_index import BM25Index
+
+def load_generator(generated_folder="generated"):
+    """Генератор для мира, уже сохранённого в generated/"""
+    with open(os.path.join(generated_folder, "fictional_world.json"), 'r', encoding='utf-8') as f:
+        world_data = json.load(f)
+    with open(os.path.join(generated_folder, "terms_map.json"), 'r', encoding='utf-8') as f:
+        terms_map = json.load(f)
+    return FictionalDocumentGenerator(world_data, terms_map)
+
+def iter_corpus_with_distractors(knowledge_base_folder, distractors_folder):
+    """Документы базы знаний и затем документы-шум: пары (doc_id, text)"""
+    for filename in sorted(os.listdir(knowledge_base_folder)):
+        if filename.endswith('.txt'):
+            with open(os.path.join(knowledge_base_folder, filename), 'r', encoding='utf-8') as f:
+                yield filename[:-len('.txt')], f.read()
+    yield from iter_distractor_documents(distractors_folder)
+
+def build_index_with_distractors(knowledge_base_folder="knowledge_base", distractors_folder="distractors",
+                                 generated_folder="generated"):
+    """BM25 индекс по базе знаний вместе с документами-шумом"""
+    index = BM25Index.build(iter_corpus_with_distractors(knowledge_base_folder, distractors_folder))
+    folder = index.save(os.path.join(generated_folder, "bm25_index_distractors"))
+    print(f"✓ BM25 index with distractors saved to {folder}/ ({len(index.doc_ids):,} documents)")
+    return index
+
+def main(argv=None):
+    """Дописывает документы-шум к сгенерированному корпусу"""
+    parser = argparse.ArgumentParser(description="Generate distractor documents for retrieval stress tests")
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--shard-size', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Write shards in this many processes sharing the world via shared memory")
+    parser.add_argument('--output', default="distractors")
+    parser.add_argument('--knowledge-base', default="knowledge_base")
+    parser.add_argument('--generated', default="generated")
+    parser.add_argument('--build-index', action='store_true',
+                        help="Also build generated/bm25_index_distractors (evaluate with --retriever bm25_distractors)")
+    args = parser.parse_args(argv)
+
+    generator = load_generator(args.generated)
+    provenance_path = os.path.join(args.generated, "provenance_index.json")
+    provenance = ProvenanceIndex.load(provenance_path) if os.path.exists(provenance_path) else None
+
+    started = time.perf_counter()
+    manifest = generator.generate_distractors(args.count, args.output, args.shard_size, provenance=provenance,
+                                              workers=args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"  {args.count / elapsed:,.0f} documents/s")
+
+    if args.build_index:
+        build_index_with_distractors(args.knowledge_base, args.output, args.generated)
+
+    return manifest
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# apps/world2/generation_daemon.py
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+from array import array
+
+try:
+    from .batch_worlds import build_world, validate_world
+    from .bm25_index import BM25Index
+    from .fictional_document_generator import build_seeded_world
+    from .template_engine import default_registry
+    from .daemon_client import DEFAULT_SOCKET, DaemonClient, DaemonError
+except ImportError:
+    from batch_worlds import build_world, validate_world
+    from bm25_index import BM25Index
+    from fictional_document_generator import build_seeded_world
+    from template_engine import default_registry
+    from daemon_client import DEFAULT_SOCKET, DaemonClient, DaemonError
+
+INDEX_FILES = ("meta.json", "postings_docs.bin", "postings_tfs.bin", "doc_lengths.bin")
+REQUEST_LIMIT = 1 << 24  # Длина строки запроса (пачка поисковых запросов)
+WORLD_CACHE_SIZE = 32  # Построенных миров в памяти демона
+
+def _resident(values):
+    """Копия массива uint32 в памяти (вместо mmap файла индекса)"""
+    copy = array('I')
+    copy.frombytes(memoryview(values).cast('B'))
+    return copy
+
+def _validate_corpus(output_folder):
+    if not os.path.isdir(os.path.join(output_folder, "knowledge_base")):
+        raise ValueError(f"No knowledge_base/ in {output_folder}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        return validate_world(output_folder)
+
+def _run_job(job, args, connection):
+    """Тело ответвлённого процесса: выполняет задачу и отправляет результат демону"""
+    # Сигналы демона (Ctrl+C, остановка) не должны будить его цикл событий из задачи
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        connection.send((True, job(*args)))
+    except Exception as e:
+        traceback.print_exc()  # Трассировка — в вывод демона, запрос получает исключение
+        connection.send((False, e))
+    finally:
+        connection.close()
+
+def _required(request, key):
+    if key not in request:
+        raise ValueError(f"Request {request.get('command')!r} needs {key!r}")
+    return request[key]
+
+class GenerationDaemon:
+    """Долгоживущий процесс генерации с запросами через Unix сокет
+
+    Модули генератора, скомпилированные шаблоны, построенные миры (по
+    зерну) и BM25 индексы корпусов остаются в памяти демона, так что
+    запрос не платит за запуск интерпретатора, импорты, построение мира
+    и загрузку. Генерация и валидация выполняются
+    в процессе, ответвлённом (fork) от демона: он получает прогретое
+    состояние без копирования, а глобальный random, вывод и сбои задачи не
+    затрагивают ни демон, ни соседние задачи. Одновременно выполняется не
+    больше workers задач. Протокол — по строке JSON на запрос и на ответ.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=None):
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context('fork')
+        self.slots = asyncio.Semaphore(self.workers)
+        self.stopped = asyncio.Event()
+        self.stopping = False
+        self.indexes = {}  # папка bm25_index -> (mtime файлов, BM25Index)
+        self.worlds = {}  # зерно -> (world_data, terms_map, состояние random после построения мира)
+        self.started = time.time()
+        self.requests = 0
+        self.commands = {
+            'ping': self.ping,
+            'generate': self.generate,
+            'validate': self.validate,
+            'search': self.search,
+            'shutdown': self.shutdown
+        }
+
+    def warm_up(self):
+        """Компилирует шаблоны до первого fork, чтобы задачи получали их готовыми"""
+        registry = default_registry()
+        print(f"✓ Compiled {len(registry.templates)} templates")
+
+    def remove_stale_socket(self):
+        """Удаляет сокет упавшего демона; если демон на сокете отвечает — ошибка"""
+        if not os.path.exists(self.socket_path):
+            return
+        try:
+            with DaemonClient(self.socket_path, timeout=1) as client:
+                client.ping()
+        except DaemonError:
+            os.remove(self.socket_path)
+            return
+        raise ValueError(f"A generation daemon is already running on {self.socket_path}")
+
+    async def serve(self):
+        self.warm_up()
+        server = await asyncio.start_unix_server(self.handle_connection, path=self.socket_path,
+                                                 limit=REQUEST_LIMIT)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stopped.set)
+        print(f"✓ Generation daemon listening on {self.socket_path} ({self.workers} workers, pid {os.getpid()})")
+        try:
+            await self.stopped.wait()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        print(f"✓ Generation daemon stopped after {self.requests} requests")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while not self.stopping:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # строка длиннее REQUEST_LIMIT
+                    response = {'ok': False, 'error': f"Request is longer than {REQUEST_LIMIT} bytes"}
+                    writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                    break
+                if not line:
+                    break
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            if self.stopping:
+                self.stopped.set()
+
+    async def handle_request(self, line):
+        """Ответ на одну строку запроса; ошибка запроса не останавливает демон"""
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            command = self.commands.get(request.get('command'))
+            if command is None:
+                raise ValueError(f"Unknown command {request.get('command')!r}, expected one of {sorted(self.commands)}")
+            return {'ok': True, 'result': await command(request)}
+        except Exception as e:
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+    async def run_job(self, job, *args):
+        """Выполняет задачу в процессе, ответвлённом от прогретого демона"""
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            receiver, sender = self.context.Pipe(duplex=False)
+            # Не daemon: генератор сам запускает пулы процессов
+            process = self.context.Process(target=_run_job, args=(job, args, sender))
+            process.start()
+            sender.close()
+            try:
+                ok, value = await loop.run_in_executor(None, receiver.recv)
+            except EOFError:
+                ok, value = False, None
+            finally:
+                receiver.close()
+            await loop.run_in_executor(None, process.join)
+        if not ok:
+            raise value or RuntimeError(f"Job process exited with code {process.exitcode}")
+        return value
+
+    def world(self, seed, args):
+        """Мир зерна из кэша; строится в демоне до fork, задача получает его готовым"""
+        if seed is None or {'--world-dir', '--resume'} & {arg.split('=')[0] for arg in args}:
+            return None  # Мир без зерна случаен, а эти режимы берут мир из папки или контрольной точки
+        if seed not in self.worlds:
+            if len(self.worlds) >= WORLD_CACHE_SIZE:
+                del self.worlds[next(iter(self.worlds))]
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.worlds[seed] = build_seeded_world(seed)
+        return self.worlds[seed]
+
+    def index(self, output_dir):
+        """BM25 индекс корпуса из памяти; перечитывается, если файлы индекса изменились"""
+        folder = os.path.join(output_dir, "generated", "bm25_index")
+        if not os.path.isdir(folder):
+            raise ValueError(f"No BM25 index in {folder}, generate the corpus first")
+        signature = [os.stat(os.path.join(folder, name)).st_mtime_ns for name in INDEX_FILES]
+        cached = self.indexes.get(folder)
+        if cached is None or cached[0] != signature:
+            loaded = BM25Index.load(folder)
+            # Копия в памяти, а не mmap: новая генерация в ту же папку перезаписывает файлы индекса
+            index = BM25Index(loaded.doc_ids, loaded.vocabulary, _resident(loaded.postings_docs),
+                              _resident(loaded.postings_tfs), _resident(loaded.doc_lengths), loaded.k1, loaded.b)
+            self.indexes[folder] = (signature, index)
+        return self.indexes[folder][1]
+
+    async def ping(self, request):
+        return {
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'requests': self.requests,
+            'workers': self.workers,
+            'worlds': sorted(self.worlds),
+            'indexes': sorted(self.indexes)
+        }
+
+    async def generate(self, request):
+        """Корпус в output_dir; args — аргументы fictional_document_generator.py"""
+        args = tuple(str(arg) for arg in request.get('args', ()))
+        seed = request.get('seed')
+        seed = int(seed) if seed is not None else None
+        return await self.run_job(build_world, seed, _required(request, 'output_dir'), args,
+                                  request.get('validate', True), self.world(seed, args))
+
+    async def validate(self, request):
+        output_dir = _required(request, 'output_dir')
+        return {'folder': output_dir, 'validation': await self.run_job(_validate_corpus, output_dir)}
+
+    async def search(self, request):
+        index = self.index(_required(request, 'output_dir'))
+        queries = _required(request, 'queries')
+        results = await asyncio.get_running_loop().run_in_executor(None, index.search_batch, queries,
+                                                                   int(request.get('k', 10)))
+        return [[{'id': doc_id, 'score': round(score, 4)} for doc_id, score in hits] for hits in results]
+
+    async def shutdown(self, request):
+        # Ответ ещё отправляется; демон останавливается, когда соединение закроется
+        self.stopping = True
+        return {'requests': self.requests}
+
+def main(argv=None):
+    """Запускает демон генерации; запросы отправляет daemon_client.py"""
+    parser = argparse.ArgumentParser(description="Serve corpus generation requests from a warm process")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument('--workers', type=int, default=None, help="Concurrent jobs (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    daemon = GenerationDaemon(args.socket, args.workers)
+    try:
+        daemon.remove_stale_socket()
+    except ValueError as e:
+        parser.error(str(e))
+    asyncio.run(daemon.serve())
+
+if __name__ == "__main__":
+    main()
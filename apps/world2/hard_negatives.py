@@ -0,0 +1,184 @@
+# apps/world2/hard_negatives.py
+import argparse
+import json
+import os
+
+try:
+    from .bm25_index import BM25Index
+    from .entity_index import EntityIndex, find_mentions
+    from .provenance_index import ProvenanceIndex, split_fact_key
+except ImportError:
+    from bm25_index import BM25Index
+    from entity_index import EntityIndex, find_mentions
+    from provenance_index import ProvenanceIndex, split_fact_key
+
+def world_entity_names(world_data, entity_index=None):
+    """Имена сущностей мира: персонажи, регионы, фракции, предметы, события и термины индекса"""
+    names = set(entity_index.entities) if entity_index else set()
+    for values in world_data.values():
+        if not isinstance(values, list):
+            continue
+        for entry in values:
+            if isinstance(entry, dict):
+                name = entry.get('fictional_name') or entry.get('name') or entry.get('fictional')
+                if name:
+                    names.add(name)
+    return names
+
+def answer_entities(qa, entity_names):
+    """Сущности, которые называет ответ, но не вопрос
+
+    Сущности из вопроса есть и в хороших негативах (документ про того же
+    персонажа без нужного факта); документы с сущностями ответа могут
+    сами содержать ответ и негативами не считаются.
+    """
+    answer = qa.get('answer', '')
+    question = qa.get('question', '')
+    return [name for name in entity_names if find_mentions(answer, name) and not find_mentions(question, name)]
+
+class HardNegativeMiner:
+    """Подбирает hard negatives для QA пар по BM25 индексу корпуса
+
+    Негативом не может быть документ, содержащий ответ: источники пары,
+    документы с её answer_facts по индексу происхождения, а для пар по
+    фактам мира — все документы об их сущностях.
+    """
+
+    def __init__(self, index, entity_names, entity_index=None, knowledge_base_folder=None,
+                 num_negatives=5, candidate_factor=4, provenance=None):
+        self.index = index
+        self.entity_names = entity_names
+        self.entity_index = entity_index
+        self.provenance = provenance
+        self.knowledge_base_folder = knowledge_base_folder
+        self.num_negatives = num_negatives
+        self.candidate_factor = candidate_factor
+        self._texts = {}
+
+    def _document_text(self, doc_id):
+        if doc_id not in self._texts:
+            path = os.path.join(self.knowledge_base_folder, f"{doc_id}.txt")
+            with open(path, 'r', encoding='utf-8') as f:
+                self._texts[doc_id] = f.read()
+        return self._texts[doc_id]
+
+    def _mentions(self, doc_id, name):
+        """Упоминает ли документ сущность: по индексу сущностей, иначе по тексту"""
+        if self.entity_index is not None and name in self.entity_index:
+            return doc_id in self.entity_index.entities[name]['postings']
+        if self.knowledge_base_folder is None:
+            return False
+        return bool(find_mentions(self._document_text(doc_id), name))
+
+    def _excluded(self, qa):
+        """Документы, которые могут содержать ответ пары, и сущности, упоминание которых исключает документ"""
+        excluded = set(qa.get('source_docs', []))
+        entities = answer_entities(qa, self.entity_names)
+        for fact in qa.get('answer_facts', []):
+            if self.provenance is not None:
+                excluded.update(self.provenance.documents_for(fact))
+            if qa.get('template_type', '').startswith('fact'):
+                # Пара по факту мира: любой документ о её сущности может назвать свойство
+                subject = split_fact_key(fact)[1]
+                if self.entity_index is not None and subject in self.entity_index:
+                    excluded.update(self.entity_index.documents_for(subject))
+                elif subject:
+                    entities.append(subject)
+        return excluded, entities
+
+    def mine_batch(self, qa_pairs):
+        """Возвращает список hard negatives (doc_id) для каждой QA пары пачки"""
+        k = self.num_negatives * self.candidate_factor
+        exclusions = [self._excluded(qa) for qa in qa_pairs]
+        results = self.index.search_batch(
+            [qa['question'] for qa in qa_pairs],
+            k + max((len(excluded) for excluded, _ in exclusions), default=0))
+
+        negatives = []
+        for (excluded, entities), hits in zip(exclusions, results):
+            chosen = []
+            for doc_id, _ in hits:
+                if doc_id in excluded or any(self._mentions(doc_id, name) for name in entities):
+                    continue
+                chosen.append(doc_id)
+                if len(chosen) == self.num_negatives:
+                    break
+            negatives.append(chosen)
+        return negatives
+
+    def annotate_file(self, path, batch_size=512):
+        """Дописывает hard_negatives в QA файл потоково, пачками по batch_size"""
+        temp_path = path + ".tmp"
+        count = 0
+        with open(path, 'r', encoding='utf-8') as src, open(temp_path, 'w', encoding='utf-8') as dst:
+            batch = []
+            for line in src:
+                if not line.strip():
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    count += self._write_batch(batch, dst)
+                    batch = []
+            count += self._write_batch(batch, dst)
+        os.replace(temp_path, path)
+        return count
+
+    def _write_batch(self, batch, dst):
+        if not batch:
+            return 0
+        for qa, negatives in zip(batch, self.mine_batch(batch)):
+            qa['hard_negatives'] = negatives
+            dst.write(json.dumps(qa, ensure_ascii=False) + '\n')
+        return len(batch)
+
+def qa_files(generated_folder):
+    """Все QA файлы в папке generated"""
+    return sorted(
+        os.path.join(generated_folder, name) for name in os.listdir(generated_folder)
+        if name.endswith('qa_pairs.jsonl')
+    )
+
+def mine_hard_negatives(world_data, knowledge_base_folder="knowledge_base", generated_folder="generated",
+                        index=None, entity_index=None, num_negatives=5, batch_size=512, provenance=None):
+    """Добавляет hard_negatives во все QA файлы generated/"""
+    if index is None:
+        index_folder = os.path.join(generated_folder, "bm25_index")
+        if os.path.exists(os.path.join(index_folder, "meta.json")):
+            index = BM25Index.load(index_folder)
+        else:
+            index = BM25Index.build_from_folder(knowledge_base_folder)
+    if entity_index is None:
+        entity_path = os.path.join(generated_folder, "entity_index.json")
+        if os.path.exists(entity_path):
+            entity_index = EntityIndex.load(entity_path)
+    if provenance is None:
+        provenance_path = os.path.join(generated_folder, "provenance_index.json")
+        if os.path.exists(provenance_path):
+            provenance = ProvenanceIndex.load(provenance_path)
+
+    miner = HardNegativeMiner(index, world_entity_names(world_data, entity_index), entity_index,
+                              knowledge_base_folder, num_negatives, provenance=provenance)
+    counts = {}
+    for path in qa_files(generated_folder):
+        counts[os.path.basename(path)] = miner.annotate_file(path, batch_size)
+
+    total = sum(counts.values())
+    print(f"✓ Mined hard negatives for {total:,} QA pairs in {len(counts)} files")
+    return counts
+
+def main(argv=None):
+    """Добавляет hard negatives в QA пары уже сгенерированного корпуса"""
+    parser = argparse.ArgumentParser(description="Mine BM25 hard negatives for generated QA pairs")
+    parser.add_argument('--num-negatives', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--knowledge-base', default="knowledge_base")
+    parser.add_argument('--generated', default="generated")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.generated, "fictional_world.json"), 'r', encoding='utf-8') as f:
+        world_data = json.load(f)
+    return mine_hard_negatives(world_data, args.knowledge_base, args.generated,
+                               num_negatives=args.num_negatives, batch_size=args.batch_size)
+
+if __name__ == "__main__":
+    main()
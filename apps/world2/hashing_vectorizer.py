@@ -0,0 +1,171 @@
+# apps/world2/hashing_vectorizer.py
+import json
+import os
+import sys
+import zlib
+
+import numpy as np
+
+try:
+    from .bm25_index import tokenize
+except ImportError:
+    from bm25_index import tokenize
+
+class HashingVectorizer:
+    """TF-IDF через хеширование признаков: без словаря, фиксированная размерность"""
+
+    def __init__(self, n_features=1024):
+        self.n_features = n_features
+        self._token_cache = {}
+
+    def hash_tokens(self, tokens):
+        """Номера признаков и знаки для токенов (знак гасит коллизии)"""
+        indices = np.empty(len(tokens), dtype=np.int64)
+        signs = np.empty(len(tokens), dtype=np.float32)
+        cache = self._token_cache
+        for i, token in enumerate(tokens):
+            hashed = cache.get(token)
+            if hashed is None:
+                h = zlib.crc32(token.encode('utf-8'))
+                hashed = cache[token] = (h % self.n_features, 1.0 if h & 0x80000000 else -1.0)
+            indices[i], signs[i] = hashed
+        return indices, signs
+
+    def term_frequencies(self, text):
+        """Вектор частот признаков документа"""
+        indices, signs = self.hash_tokens(tokenize(text))
+        return np.bincount(indices, weights=signs, minlength=self.n_features).astype(np.float32)
+
+    def present_features(self, text):
+        """Признаки, встречающиеся в документе (для подсчёта df)"""
+        indices, _ = self.hash_tokens(tokenize(text))
+        return np.unique(indices)
+
+def l2_normalize(matrix):
+    """Нормирует строки матрицы на единичную длину"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class HashingVectorIndex:
+    """Плотная матрица TF-IDF (float32, L2) в memory-mapped .npy и поиск по косинусу
+
+    Матрица никогда не загружается целиком: построение пишет строки в
+    отображённый файл, поиск умножает её блоками по block_size строк.
+    """
+
+    def __init__(self, doc_ids, matrix, idf, vectorizer):
+        self.doc_ids = list(doc_ids)
+        self.matrix = matrix
+        self.idf = idf
+        self.vectorizer = vectorizer
+
+    @classmethod
+    def build(cls, read_documents, folder="generated/hashing_index", n_features=1024):
+        """Строит индекс за два прохода по read_documents() -> [(doc_id, text)]
+
+        Первый проход считает df признаков, второй пишет нормированные
+        строки прямо в memory-mapped матрицу.
+        """
+        vectorizer = HashingVectorizer(n_features)
+        df = np.zeros(n_features, dtype=np.int64)
+        doc_ids = []
+        for doc_id, text in read_documents():
+            doc_ids.append(doc_id)
+            df[vectorizer.present_features(text)] += 1
+
+        n_docs = len(doc_ids)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+
+        os.makedirs(folder, exist_ok=True)
+        matrix = np.lib.format.open_memmap(
+            os.path.join(folder, "matrix.npy"), mode='w+', dtype=np.float32, shape=(n_docs, n_features))
+        for row, (_, text) in enumerate(read_documents()):
+            matrix[row] = l2_normalize(vectorizer.term_frequencies(text) * idf)
+        matrix.flush()
+
+        np.save(os.path.join(folder, "idf.npy"), idf)
+        with open(os.path.join(folder, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({'doc_ids': doc_ids, 'n_features': n_features}, f, ensure_ascii=False)
+
+        return cls(doc_ids, matrix, idf, vectorizer)
+
+    @classmethod
+    def build_from_folder(cls, knowledge_base_folder="knowledge_base", folder="generated/hashing_index", n_features=1024):
+        """Строит индекс по .txt файлам базы знаний"""
+        filenames = sorted(f for f in os.listdir(knowledge_base_folder) if f.endswith('.txt'))
+
+        def read_documents():
+            for filename in filenames:
+                with open(os.path.join(knowledge_base_folder, filename), 'r', encoding='utf-8') as f:
+                    yield filename[:-len('.txt')], f.read()
+
+        return cls.build(read_documents, folder, n_features)
+
+    @classmethod
+    def load(cls, folder="generated/hashing_index"):
+        """Открывает индекс; матрица отображается в память только для чтения"""
+        with open(os.path.join(folder, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        matrix = np.load(os.path.join(folder, "matrix.npy"), mmap_mode='r')
+        idf = np.load(os.path.join(folder, "idf.npy"))
+        return cls(meta['doc_ids'], matrix, idf, HashingVectorizer(meta['n_features']))
+
+    def encode_queries(self, queries):
+        """Векторизует запросы тем же хешированием и IDF"""
+        vectors = np.stack([self.vectorizer.term_frequencies(query) for query in queries]) * self.idf
+        return l2_normalize(vectors).astype(np.float32)
+
+    def search_batch(self, queries, k=10, block_size=65536):
+        """Top-k по косинусу блочным умножением матрицы на пачку запросов"""
+        if not queries:
+            return []
+        q = self.encode_queries(queries)
+        n_queries = len(queries)
+        k = min(k, len(self.doc_ids))
+
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        for start in range(0, len(self.doc_ids), block_size):
+            block = np.asarray(self.matrix[start:start + block_size])
+            scores = q @ block.T  # (запросы, документы блока)
+
+            # Объединяем лучшие из блока с лучшими из предыдущих блоков
+            block_k = min(k, scores.shape[1])
+            top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            candidate_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            candidate_rows = np.concatenate([best_rows, top + start], axis=1)
+
+            keep = np.argsort(-candidate_scores, axis=1)[:, :k]
+            best_scores = np.take_along_axis(candidate_scores, keep, axis=1)
+            best_rows = np.take_along_axis(candidate_rows, keep, axis=1)
+
+        return [
+            [(self.doc_ids[row], float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def search(self, query, k=10):
+        """Ищет один запрос"""
+        return self.search_batch([query], k)[0]
+
+def save_hashing_index(knowledge_base_folder="knowledge_base", generated_folder="generated", n_features=1024):
+    """Строит и сохраняет векторный индекс базы знаний"""
+    folder = os.path.join(generated_folder, "hashing_index")
+    index = HashingVectorIndex.build_from_folder(knowledge_base_folder, folder, n_features)
+    print(f"✓ Hashing vector index saved to {folder}/ ({len(index.doc_ids)} x {n_features} float32)")
+    return index
+
+def main():
+    """Строит векторный индекс по knowledge_base/ и выполняет пробные запросы"""
+    save_hashing_index("knowledge_base", "generated")
+    index = HashingVectorIndex.load(os.path.join("generated", "hashing_index"))
+
+    queries = sys.argv[1:] or ["elixir ingredients", "settlement defenses", "imperial patrols"]
+    for query, hits in zip(queries, index.search_batch(queries, k=5)):
+        print(f"\n🔎 {query}")
+        for doc_id, score in hits:
+            print(f"  {doc_id}: {score:.3f}")
+
+if __name__ == "__main__":
+    main()
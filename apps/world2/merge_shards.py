@@ -0,0 +1,249 @@
+# apps/world2/merge_shards.py
+import argparse
+import json
+import os
+import random
+import shutil
+from datetime import datetime
+
+try:
+    from .fictional_document_generator import generate_qa_pairs, load_document_records, load_world_data, save_world_data
+    from .entity_index import EntityIndex
+    from .provenance_index import ProvenanceIndex
+    from .qa_engine import generate_fact_qa_pairs, generate_multi_hop_qa_pairs
+    from .reference_graph import DOC_ID_PATTERN, ReferenceGraph
+    from .bm25_index import save_bm25_index
+    from .chunk_corpus import chunk_knowledge_base
+    from .columnar_export import export_columnar
+    from .corpus_store import save_corpus_store
+    from .hard_negatives import mine_hard_negatives
+    from .sharding import MANIFEST_FILE
+except ImportError:
+    from fictional_document_generator import generate_qa_pairs, load_document_records, load_world_data, save_world_data
+    from entity_index import EntityIndex
+    from provenance_index import ProvenanceIndex
+    from qa_engine import generate_fact_qa_pairs, generate_multi_hop_qa_pairs
+    from reference_graph import DOC_ID_PATTERN, ReferenceGraph
+    from bm25_index import save_bm25_index
+    from chunk_corpus import chunk_knowledge_base
+    from columnar_export import export_columnar
+    from corpus_store import save_corpus_store
+    from hard_negatives import mine_hard_negatives
+    from sharding import MANIFEST_FILE
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_shard_manifests(shard_folders):
+    """Манифесты шардов по порядку; проверяет, что шарды образуют один полный корпус"""
+    shards = []
+    for folder in shard_folders:
+        path = os.path.join(folder, "generated", MANIFEST_FILE)
+        if not os.path.exists(path):
+            raise ValueError(f"{folder} is not a shard output: missing generated/{MANIFEST_FILE}")
+        shards.append((read_json(path), folder))
+    shards.sort(key=lambda item: item[0]['shard'])
+
+    first = shards[0][0]
+    for manifest, folder in shards:
+        for key in ('shards', 'seed', 'plan_documents', 'world_fingerprint'):
+            if manifest[key] != first[key]:
+                raise ValueError(f"Shard {folder} has {key}={manifest[key]!r}, expected {first[key]!r}")
+
+    indices = [manifest['shard'] for manifest, _ in shards]
+    if indices != list(range(first['shards'])):
+        missing = sorted(set(range(first['shards'])) - set(indices))
+        raise ValueError(f"Expected shards 0..{first['shards'] - 1} exactly once, "
+                         f"got {indices} (missing: {missing})")
+
+    position = 0
+    for manifest, folder in shards:
+        if manifest['start'] != position:
+            raise ValueError(f"Shard {folder} starts at plan position {manifest['start']}, expected {position}")
+        position = manifest['stop']
+    if position != first['plan_documents']:
+        raise ValueError(f"Shards cover {position} of {first['plan_documents']} planned documents")
+    return shards
+
+def merge_generation_stats(stats_list):
+    """Суммирует generation_stats.json шардов"""
+    merged = dict(stats_list[0])
+    merged['generation_date'] = datetime.now().isoformat()
+    merged['total_documents'] = sum(stats['total_documents'] for stats in stats_list)
+    merged['document_types'] = {}
+    merged['word_counts'] = {}
+    for stats in stats_list:
+        for doc_type, count in stats['document_types'].items():
+            merged['document_types'][doc_type] = merged['document_types'].get(doc_type, 0) + count
+        for doc_type, counts in stats['word_counts'].items():
+            entry = merged['word_counts'].setdefault(doc_type, {'total': 0, 'count': 0, 'average': 0})
+            entry['total'] += counts['total']
+            entry['count'] += counts['count']
+    for entry in merged['word_counts'].values():
+        if entry['count'] > 0:
+            entry['average'] = entry['total'] / entry['count']
+    return merged
+
+def resolve_references(documents, shard_of):
+    """Разрешает ссылки документов на идентификаторы по всему корпусу
+
+    Шард ссылается на документы других шардов по глобальным
+    идентификаторам плана; после слияния каждая ссылка должна
+    указывать на существующий документ.
+    """
+    references = cross_shard = 0
+    unresolved = {}
+    for doc in documents:
+        for ref in DOC_ID_PATTERN.findall(doc['raw_content']):
+            if ref == doc['id']:
+                continue
+            references += 1
+            if ref not in shard_of:
+                unresolved.setdefault(ref, []).append(doc['id'])
+            elif shard_of[ref] != shard_of[doc['id']]:
+                cross_shard += 1
+    return {
+        'references': references,
+        'cross_shard': cross_shard,
+        'unresolved': sum(len(sources) for sources in unresolved.values()),
+        'unresolved_ids': unresolved
+    }
+
+def duplicate_bodies(documents):
+    """Документы с совпадающим content_hash тела (повторы между шардами)"""
+    by_hash = {}
+    for doc in documents:
+        by_hash.setdefault(doc['metadata'].get('content_hash'), []).append(doc['id'])
+    return {content_hash: ids for content_hash, ids in by_hash.items() if len(ids) > 1}
+
+def merge_shards(shard_folders, output_dir=None, fact_qa_limit=None, sqlite_store=False):
+    """Объединяет выходы шардов в один корпус
+
+    Индексы по документам (индекс базы знаний, упоминания сущностей,
+    происхождение фактов, статистика) склеиваются в порядке шардов —
+    результат тот же, что у индекса всего корпуса. QA пары пересобираются
+    по объединённому индексу происхождения, а индексы, зависящие от всего
+    корпуса (граф ссылок, BM25, фрагменты, hard negatives, колоночный
+    экспорт, SQLite при sqlite_store), строятся заново по объединённым документам.
+    """
+    shards = load_shard_manifests(shard_folders)
+    manifest = shards[0][0]
+    knowledge_base_folder = os.path.join(output_dir or "", "knowledge_base")
+    generated_folder = os.path.join(output_dir or "", "generated")
+    os.makedirs(knowledge_base_folder, exist_ok=True)
+    os.makedirs(generated_folder, exist_ok=True)
+    print(f"Merging {len(shards)} shards of {manifest['plan_documents']:,} planned documents "
+          f"(seed {manifest['seed']})")
+
+    # 1. Документы и файлы базы знаний
+    documents = []
+    shard_of = {}
+    index = []
+    for shard_manifest, folder in shards:
+        shard_documents = load_document_records(os.path.join(folder, "generated"))
+        for doc in shard_documents:
+            if doc.id in shard_of:
+                raise ValueError(f"Document {doc.id} appears in shards {shard_of[doc.id]} and {shard_manifest['shard']}")
+            shard_of[doc.id] = shard_manifest['shard']
+            shutil.copyfile(os.path.join(folder, "knowledge_base", f"{doc.id}.txt"),
+                            os.path.join(knowledge_base_folder, f"{doc.id}.txt"))
+        documents.extend(shard_documents)
+        index.extend(read_json(os.path.join(folder, "generated", "knowledge_base_index.json")))
+        print(f"  Shard {shard_manifest['shard']}: {len(shard_documents):,} documents from {folder}/")
+
+    index_path = f"{generated_folder}/knowledge_base_index.json"
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    print(f"✓ Merged {len(documents):,} documents into {knowledge_base_folder}/ and {index_path}")
+
+    # 2. Мир (одинаковый во всех шардах, проверено по отпечатку)
+    world_data, terms_map = load_world_data(os.path.join(shards[0][1], "generated"))
+    save_world_data(world_data, terms_map, generated_folder)
+
+    # 3. Индексы по документам склеиваются
+    entity_index = EntityIndex.merge(EntityIndex.load(os.path.join(folder, "generated", "entity_index.json"))
+                                     for _, folder in shards)
+    entity_index.save(f"{generated_folder}/entity_index.json")
+    provenance = ProvenanceIndex.merge(ProvenanceIndex.load(os.path.join(folder, "generated", "provenance_index.json"))
+                                       for _, folder in shards)
+    provenance.save(f"{generated_folder}/provenance_index.json")
+    print(f"✓ Merged entity index ({len(entity_index.entities)} entities) "
+          f"and provenance index ({len(provenance.facts)} facts)")
+
+    # 4. Ссылки между шардами
+    references = resolve_references(documents, shard_of)
+    duplicates = duplicate_bodies(documents)
+    print(f"✓ References: {references['references']:,} total, {references['cross_shard']:,} across shards, "
+          f"{references['unresolved']:,} unresolved")
+    if references['unresolved']:
+        print(f"⚠️  Unresolved references to {len(references['unresolved_ids'])} missing documents")
+    if duplicates:
+        print(f"⚠️  {len(duplicates)} document bodies repeat across the corpus")
+
+    # 5. QA пары и индексы всего корпуса (выборка многоходовых путей — от общего зерна)
+    random.seed(manifest['seed'])
+    qa_pairs = generate_qa_pairs(documents, world_data, terms_map, generated_folder, provenance)
+    fact_qa_count = generate_fact_qa_pairs(world_data, provenance, generated_folder, fact_qa_limit)
+    graph = ReferenceGraph.from_documents(documents)
+    graph.save(f"{generated_folder}/reference_graph.json")
+    multi_hop_count = generate_multi_hop_qa_pairs(graph, documents, generated_folder)
+    chunk_count = chunk_knowledge_base(knowledge_base_folder, f"{generated_folder}/chunks.jsonl")
+    bm25_index = save_bm25_index(knowledge_base_folder, generated_folder)
+    mine_hard_negatives(world_data, knowledge_base_folder, generated_folder, bm25_index, entity_index,
+                        provenance=provenance)
+    try:
+        export_columnar(knowledge_base_folder, generated_folder)
+    except ImportError as e:
+        print(f"⚠️  Skipping columnar export: {e}")
+    if sqlite_store:
+        save_corpus_store(documents, generated_folder)
+
+    # 6. Статистика и отчёт слияния
+    stats = merge_generation_stats([read_json(os.path.join(folder, "generated", "generation_stats.json"))
+                                    for _, folder in shards])
+    stats_path = f"{generated_folder}/generation_stats.json"
+    with open(stats_path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
+
+    report = {
+        'seed': manifest['seed'],
+        'shards': [{'shard': shard_manifest['shard'], 'folder': folder,
+                    'start': shard_manifest['start'], 'stop': shard_manifest['stop']}
+                   for shard_manifest, folder in shards],
+        'documents': len(documents),
+        'references': references,
+        'duplicate_bodies': duplicates,
+        'qa_pairs': len(qa_pairs),
+        'fact_qa_pairs': fact_qa_count,
+        'multi_hop_qa_pairs': multi_hop_count,
+        'chunks': chunk_count
+    }
+    report_path = f"{generated_folder}/shard_merge_report.json"
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✓ Merge report saved to {report_path}")
+    return report
+
+def main(argv=None):
+    """Объединяет шарды, сгенерированные fictional_document_generator.py --shard I/N"""
+    parser = argparse.ArgumentParser(description="Merge sharded fictional corpus outputs into one corpus")
+    parser.add_argument('shards', nargs='+', help="Shard output folders (the --output-dir of each shard run)")
+    parser.add_argument('--output-dir', default=None,
+                        help="Folder for the merged knowledge_base/ and generated/ (default: current directory)")
+    parser.add_argument('--fact-qa-limit', type=int, default=None,
+                        help="Write at most this many fact QA pairs (their number grows with the corpus)")
+    parser.add_argument('--sqlite-store', action='store_true',
+                        help="Also save the merged corpus to generated/corpus.db (SQLite with FTS5)")
+    args = parser.parse_args(argv)
+
+    try:
+        report = merge_shards(args.shards, args.output_dir, args.fact_qa_limit, args.sqlite_store)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"\n✅ Merged {report['documents']:,} documents from {len(report['shards'])} shards")
+    return report
+
+if __name__ == "__main__":
+    main()
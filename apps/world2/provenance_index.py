@@ -0,0 +1,149 @@
+# apps/world2/provenance_index.py
+import json
+import os
+import re
+
+def fact_key(attribute, entity, value):
+    """Ключ конкретного факта: атрибут|сущность|значение"""
+    return f"{attribute}|{entity or ''}|{value}"
+
+def split_fact_key(key):
+    """(атрибут, сущность, значение) из ключа fact_key"""
+    attribute, entity, value = key.split('|', 2)
+    return attribute, entity, value
+
+# Разметка факта в тексте на время рендеринга: OPEN номер SEP текст CLOSE.
+# Символы из области частного использования не встречаются в шаблонах, не считаются
+# буквами (\w) и не разрывают слова, поэтому подсчёт слов и обрезка текста их не замечают
+FACT_OPEN, FACT_SEP, FACT_CLOSE = '\ue000', '\ue001', '\ue002'
+FACT_DIGITS = '\ue010\ue011\ue012\ue013\ue014\ue015\ue016\ue017\ue018\ue019'
+FACT_MARK_PATTERN = re.compile(f'{FACT_OPEN}([{FACT_DIGITS}]+){FACT_SEP}|{FACT_CLOSE}')
+FACT_NUMBER = str.maketrans(FACT_DIGITS, '0123456789')
+# Размеченный факт целиком (для re.split: нечётные части — факты)
+FACT_SPAN_PATTERN = re.compile(f'({FACT_OPEN}[{FACT_DIGITS}]+{FACT_SEP}[^{FACT_CLOSE}]*{FACT_CLOSE})')
+
+def _fact_open(number):
+    return FACT_OPEN + str(number).translate(str.maketrans('0123456789', FACT_DIGITS)) + FACT_SEP
+
+def mark_fact(number, text):
+    """Текст факта с разметкой: number — номер факта в списке фактов документа"""
+    return f"{_fact_open(number)}{text}{FACT_CLOSE}"
+
+def strip_fact_marks(text):
+    """Текст без разметки фактов"""
+    return FACT_MARK_PATTERN.sub('', text) if FACT_OPEN in text else text
+
+def resolve_fact_marks(text):
+    """Снимает разметку: (текст, [(номер факта, start, end), ...] в порядке начала)
+
+    Факт, чья закрывающая метка отрезана (обрезка по длине), в список не попадает.
+    """
+    if FACT_OPEN not in text:
+        return text, []
+    out, spans, open_marks = [], [], []
+    position = length = 0
+    for match in FACT_MARK_PATTERN.finditer(text):
+        out.append(text[position:match.start()])
+        length += match.start() - position
+        position = match.end()
+        if match.group(1) is not None:
+            open_marks.append((int(match.group(1).translate(FACT_NUMBER)), length))
+        elif open_marks:
+            number, start = open_marks.pop()
+            spans.append((number, start, length))
+    out.append(text[position:])
+    return ''.join(out), sorted(spans, key=lambda span: span[1])
+
+def mark_facts(text, facts):
+    """Размечает в тексте факты документа (атрибут, сущность, значение, start, end)
+
+    Нужна, чтобы переписать тело документа, не теряя позиций фактов:
+    разметить, изменить текст и снова снять разметку resolve_fact_marks.
+    """
+    marks = []
+    for number, (_, _, _, start, end) in enumerate(facts):
+        # На одной позиции закрытия идут раньше открытий, внешний факт открывается первым
+        marks.append(((start, 1, -end), _fact_open(number)))
+        marks.append(((end, 0, -start), FACT_CLOSE))
+    out, position = [], 0
+    for (offset, _, _), mark in sorted(marks, key=lambda item: item[0]):
+        out.append(text[position:offset])
+        out.append(mark)
+        position = offset
+    out.append(text[position:])
+    return ''.join(out)
+
+class ProvenanceIndex:
+    """Индекс происхождения: факт мира -> документы и точные позиции текста
+
+    Факт — тройка (атрибут, сущность, значение), например ингредиент
+    конкретного эликсира, поэтому позиции одного ключа всегда
+    подтверждают одно и то же утверждение.
+    """
+
+    def __init__(self, facts=None):
+        # fact_key -> [{"doc_id": str, "start": int, "end": int, "text": str}, ...]
+        self.facts = facts or {}
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Индекс по позициям фактов, записанным генератором при рендеринге"""
+        index = cls()
+
+        for doc in documents:
+            content = doc['content']
+            # Позиции фактов записаны в теле документа, тело идёт после front matter
+            body_start = len(content) - len(doc['raw_content'])
+            for attribute, entity, value, start, end in doc.get('facts', []):
+                index.facts.setdefault(fact_key(attribute, entity, value), []).append({
+                    'doc_id': doc['id'],
+                    'start': body_start + start,
+                    'end': body_start + end,
+                    'text': content[body_start + start:body_start + end]
+                })
+
+        return index
+
+    @classmethod
+    def merge(cls, indexes):
+        """Объединяет индексы непересекающихся наборов документов (шардов) по порядку"""
+        merged = cls()
+        for index in indexes:
+            for fact, spans in index.facts.items():
+                merged.facts.setdefault(fact, []).extend(spans)
+        return merged
+
+    def spans_for(self, fact):
+        """Возвращает все позиции факта в документах"""
+        return list(self.facts.get(fact, []))
+
+    def documents_for(self, fact):
+        """Возвращает документы, содержащие факт"""
+        return list(dict.fromkeys(span['doc_id'] for span in self.facts.get(fact, [])))
+
+    def keys(self, attribute, entity=None):
+        """Ключи фактов атрибута (и сущности): сначала подтверждённые большим числом документов"""
+        found = [key for key in self.facts
+                 if split_fact_key(key)[0] == attribute and (entity is None or split_fact_key(key)[1] == entity)]
+        return sorted(found, key=lambda key: -len(self.documents_for(key)))
+
+    def save(self, path="generated/provenance_index.json"):
+        """Сохраняет индекс происхождения фактов"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.facts, f, ensure_ascii=False, separators=(',', ':'))
+        return path
+
+    @classmethod
+    def load(cls, path="generated/provenance_index.json"):
+        """Загружает индекс, сохранённый методом save()"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+def save_provenance_index(documents, generated_folder="generated"):
+    """Строит и сохраняет индекс происхождения фактов"""
+    index = ProvenanceIndex.from_documents(documents)
+    path = index.save(os.path.join(generated_folder, "provenance_index.json"))
+    total = sum(len(spans) for spans in index.facts.values())
+    print(f"✓ Provenance index saved to {path} ({len(index.facts)} facts, {total} spans)")
+    return index
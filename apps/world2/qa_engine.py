@@ -0,0 +1,339 @@
+# apps/world2/qa_engine.py
+import json
+import os
+import random
+from itertools import permutations
+
+try:
+    from .provenance_index import fact_key
+    from .template_engine import entity_name, field_text, join_values
+except ImportError:
+    from provenance_index import fact_key
+    from template_engine import entity_name, field_text, join_values
+
+# Шаблоны вопросов по видам фактов: (вопрос, ответ)
+FACT_TEMPLATES = {
+    'character_traits': [
+        ("What personality traits characterize {subject}?", "{subject} is {traits}."),
+        ("How would you describe the temperament of {subject}?", "{subject} is known for being {traits}."),
+        ("Which qualities is {subject} known for?", "{subject} is described as {traits}.")
+    ],
+    'character_skills': [
+        ("What skills does {subject} possess?", "{subject} is skilled in {skills}."),
+        ("In which areas is {subject} an expert?", "{subject} specializes in {skills}.")
+    ],
+    'character_trait': [
+        ("Is {subject} {value}?", "Yes, {subject} is {value}.")
+    ],
+    'character_skill': [
+        ("Is {subject} skilled in {value}?", "Yes, {subject} is skilled in {value}.")
+    ],
+    'character_feature': [
+        ("What is distinctive about {subject}?", "{subject} {value}.")
+    ],
+    'item_effects': [
+        ("What effects does the {subject} have?", "The {subject} grants {effects}."),
+        ("What is the {subject} used for?", "The {subject} is used for {effects}.")
+    ],
+    'item_effect': [
+        ("Does the {subject} provide {value}?", "Yes, {value} is one of the effects of the {subject}.")
+    ],
+    'item_rarity': [
+        ("How rare is the {subject}?", "The {subject} is {value}."),
+        ("What is the rarity of the {subject}?", "The rarity of the {subject} is {value}.")
+    ],
+    'item_type': [
+        ("What kind of object is the {subject}?", "The {subject} is a {value}.")
+    ],
+    'event_year': [
+        ("When did {subject} take place?", "{subject} took place in {value}."),
+        ("In which year did {subject} happen?", "{subject} happened in {value}.")
+    ],
+    'event_factions': [
+        ("Which factions were involved in {subject}?", "{subject} involved {factions}."),
+        ("Who took part in {subject}?", "The participants of {subject} were {factions}.")
+    ],
+    'event_impact': [
+        ("How significant was the impact of {subject}?", "{subject} had a {value} impact.")
+    ],
+    'region_climate': [
+        ("What is the climate of {subject}?", "{subject} has a {value} climate."),
+        ("What weather can travelers expect in {subject}?", "Travelers to {subject} find a {value} climate.")
+    ],
+    'region_type': [
+        ("What kind of region is {subject}?", "{subject} is a {value}.")
+    ],
+    'faction_type': [
+        ("What kind of faction are the {subject}?", "The {subject} are a {value} faction.")
+    ],
+    'faction_symbol': [
+        ("What is the symbol of the {subject}?", "The symbol of the {subject} is the {value}.")
+    ]
+}
+
+# Шаблоны сравнительных вопросов по парам сущностей
+COMPARISON_TEMPLATES = {
+    'character_skill': [
+        ("Which of {subject} and {other} is skilled in {value}?", "{subject} is skilled in {value}, while {other} is not.")
+    ],
+    'character_trait': [
+        ("Who is {value}: {subject} or {other}?", "{subject} is {value}; {other} is not.")
+    ],
+    'item_effect': [
+        ("Which provides {value}: the {subject} or the {other}?", "The {subject} provides {value}; the {other} does not.")
+    ]
+}
+
+# Шаблоны вопросов с отрицательным ответом
+NEGATIVE_TEMPLATES = {
+    'character_trait': [
+        ("Is {subject} {value}?", "No, {subject} is not known for being {value}.")
+    ],
+    'character_skill': [
+        ("Is {subject} skilled in {value}?", "No, {value} is not among the skills of {subject}.")
+    ],
+    'item_effect': [
+        ("Does the {subject} provide {value}?", "No, {value} is not an effect of the {subject}.")
+    ]
+}
+
+def character_label(character):
+    """Имя персонажа с ролью (имена в мире могут совпадать)"""
+    return f"{character['fictional_name']} the {character['type'].replace('_', ' ')}"
+
+def world_fact_key(category, entry, field):
+    """Ключ факта в индексе происхождения для поля записи мира (как его записывает шаблон)"""
+    return fact_key(f"{category}.{field}", entity_name(category, entry), field_text(entry[field]))
+
+def iter_world_facts(world_data):
+    """Перечисляет факты мира: (вид факта, имя сущности, подпись, поля, ключ факта)"""
+    for character in world_data.get('characters', []):
+        name, label = character['fictional_name'], character_label(character)
+        traits = world_fact_key('characters', character, 'traits')
+        skills = world_fact_key('characters', character, 'skills')
+        yield 'character_traits', name, label, {'traits': join_values(character['traits'])}, traits
+        yield 'character_skills', name, label, {'skills': join_values(character['skills'])}, skills
+        for trait in character['traits']:
+            yield 'character_trait', name, label, {'value': trait}, traits
+        for skill in character['skills']:
+            yield 'character_skill', name, label, {'value': skill}, skills
+        yield ('character_feature', name, label, {'value': character['unique_feature']},
+               world_fact_key('characters', character, 'unique_feature'))
+
+    for item in world_data.get('magic_items', []):
+        name = item['fictional']
+        effects = world_fact_key('magic_items', item, 'effects')
+        yield 'item_effects', name, name, {'effects': join_values(item['effects'])}, effects
+        for effect in item['effects']:
+            yield 'item_effect', name, name, {'value': effect}, effects
+        yield 'item_rarity', name, name, {'value': item['rarity']}, world_fact_key('magic_items', item, 'rarity')
+        yield 'item_type', name, name, {'value': item['type']}, world_fact_key('magic_items', item, 'type')
+
+    for event in world_data.get('historical_events', []):
+        name = event['fictional']
+        yield 'event_year', name, name, {'value': event['year']}, world_fact_key('historical_events', event, 'year')
+        yield ('event_factions', name, name, {'factions': join_values(event['factions_involved'])},
+               world_fact_key('historical_events', event, 'factions_involved'))
+        yield 'event_impact', name, name, {'value': event['impact']}, world_fact_key('historical_events', event, 'impact')
+
+    for region in world_data.get('regions', []):
+        name = region['name']
+        yield 'region_climate', name, name, {'value': region['climate']}, world_fact_key('regions', region, 'climate')
+        yield 'region_type', name, name, {'value': region['type']}, world_fact_key('regions', region, 'type')
+
+    for faction in world_data.get('factions', []):
+        name = faction['name']
+        yield 'faction_type', name, name, {'value': faction['type']}, world_fact_key('factions', faction, 'type')
+        yield 'faction_symbol', name, name, {'value': faction['symbol']}, world_fact_key('factions', faction, 'symbol')
+
+def iter_comparison_facts(world_data):
+    """Перечисляет сравнительные факты: (вид, подпись, вторая подпись, значение, ключи фактов обеих сущностей)"""
+    characters = world_data.get('characters', [])
+    for first, second in permutations(characters, 2):
+        for field, kind in (('skills', 'character_skill'), ('traits', 'character_trait')):
+            keys = [world_fact_key('characters', first, field), world_fact_key('characters', second, field)]
+            for value in first[field]:
+                if value not in second[field]:
+                    yield kind, character_label(first), character_label(second), value, keys
+
+    items = world_data.get('magic_items', [])
+    for first, second in permutations(items, 2):
+        keys = [world_fact_key('magic_items', first, 'effects'), world_fact_key('magic_items', second, 'effects')]
+        for effect in first['effects']:
+            if effect not in second['effects']:
+                yield 'item_effect', first['fictional'], second['fictional'], effect, keys
+
+def iter_negative_facts(world_data):
+    """Перечисляет свойства, которыми сущность не обладает (из общего словаря мира)
+
+    Отрицательный ответ опирается на полный список свойств сущности
+    (ключ факта), а не на отсутствие упоминания.
+    """
+    characters = world_data.get('characters', [])
+    all_traits = sorted({trait for c in characters for trait in c['traits']})
+    all_skills = sorted({skill for c in characters for skill in c['skills']})
+    for character in characters:
+        label = character_label(character)
+        traits = world_fact_key('characters', character, 'traits')
+        skills = world_fact_key('characters', character, 'skills')
+        for trait in all_traits:
+            if trait not in character['traits']:
+                yield 'character_trait', label, trait, traits
+        for skill in all_skills:
+            if skill not in character['skills']:
+                yield 'character_skill', label, skill, skills
+
+    items = world_data.get('magic_items', [])
+    all_effects = sorted({effect for i in items for effect in i['effects']})
+    for item in items:
+        effects = world_fact_key('magic_items', item, 'effects')
+        for effect in all_effects:
+            if effect not in item['effects']:
+                yield 'item_effect', item['fictional'], effect, effects
+
+def iter_fact_qa_pairs(world_data, provenance):
+    """Лениво генерирует QA пары по фактам мира, отрендеренным в документы
+
+    Пары не накапливаются в памяти: каждая создаётся по запросу. Факт,
+    которого нет в индексе происхождения, не попал ни в один документ и
+    пары не даёт; source_docs — документы, где записан ответ (answer_facts).
+    После пар по миру идут те же вопросы в контексте каждого документа,
+    где записан факт, поэтому объём растёт с корпусом, а реальную границу
+    задаёт limit у write_qa_stream.
+    """
+    def source_docs(keys):
+        docs = [provenance.documents_for(key) for key in keys]
+        if not all(docs):
+            return None
+        return list(dict.fromkeys(doc_id for found in docs for doc_id in found))
+
+    def grounded_facts():
+        # (вид, подпись, поля шаблона, ключ факта, шаблоны): утвердительные и отрицательные
+        for kind, _, label, fields, key in iter_world_facts(world_data):
+            yield kind, label, fields, key, FACT_TEMPLATES[kind]
+        for kind, label, value, key in iter_negative_facts(world_data):
+            yield kind, label, {'value': value}, key, NEGATIVE_TEMPLATES[kind]
+
+    for kind, label, fields, key, templates in grounded_facts():
+        docs = source_docs([key])
+        if docs is None:
+            continue
+        for question, answer in templates:
+            yield {
+                "template_type": "fact",
+                "question": question.format(subject=label, **fields),
+                "answer": answer.format(subject=label, **fields),
+                "source_docs": docs,
+                "difficulty": "easy",
+                "category": kind,
+                "answer_facts": [key],
+                "context_required": True,
+                "reasoning_steps": []
+            }
+
+    for kind, label, other, value, keys in iter_comparison_facts(world_data):
+        docs = source_docs(keys)
+        if docs is None:
+            continue
+        for question, answer in COMPARISON_TEMPLATES[kind]:
+            yield {
+                "template_type": "fact_comparison",
+                "question": question.format(subject=label, other=other, value=value),
+                "answer": answer.format(subject=label, other=other, value=value),
+                "source_docs": docs,
+                "difficulty": "medium",
+                "category": kind,
+                "answer_facts": keys,
+                "context_required": True,
+                "reasoning_steps": [
+                    f"Find the facts about {label}",
+                    f"Find the facts about {other}",
+                    "Compare both entities on the asked property"
+                ]
+            }
+
+    # Вопрос о факте в конкретном документе: по паре на шаблон и документ с фактом
+    for kind, label, fields, key, templates in grounded_facts():
+        spans = provenance.spans_for(key)
+        for doc_id in dict.fromkeys(span['doc_id'] for span in spans):
+            for question, answer in templates:
+                text = question.format(subject=label, **fields)
+                yield {
+                    "template_type": "fact_document",
+                    "question": f"According to {doc_id}, {text[:1].lower()}{text[1:]}",
+                    "answer": answer.format(subject=label, **fields),
+                    "source_docs": [doc_id],
+                    "difficulty": "easy",
+                    "category": kind,
+                    "answer_facts": [key],
+                    "context_required": True,
+                    "reasoning_steps": [],
+                    "answer_spans": [span for span in spans if span['doc_id'] == doc_id]
+                }
+
+def iter_multi_hop_qa_pairs(graph, documents, min_hops=2, max_hops=4, per_hops=None, rng=random):
+    """Генерирует многоходовые QA пары по цепочкам перекрёстных ссылок
+
+    На каждом шаге переход идёт к документу, тип которого единственный
+    среди ссылок текущего документа, поэтому цепочка восстанавливается
+    однозначно, но только последовательным чтением всех документов пути.
+    """
+    docs = {doc['id']: doc for doc in documents}
+    doc_types = [docs[doc_id]['type'] for doc_id in graph.doc_ids]
+    per_hops = per_hops or len(graph.doc_ids)
+
+    def unique_type_neighbors(path, candidates):
+        neighbor_types = [doc_types[n] for n in graph.neighbors(path[-1])]
+        return [n for n in candidates if neighbor_types.count(doc_types[n]) == 1]
+
+    for hops in range(min_hops, max_hops + 1):
+        for path in graph.sample_paths(hops, per_hops, rng, unique_type_neighbors):
+            start, final = docs[path[0]], docs[path[-1]]
+            steps = " and then ".join(f"the {docs[doc_id]['type']} document it references" for doc_id in path[1:])
+            title = final['metadata'].get('title', 'Untitled')
+            author = final['metadata'].get('author')
+
+            answer = f"The chain ends at {final['id']}, titled \"{title}\""
+            answer += f" by {author}." if author else "."
+
+            yield {
+                "template_type": "multi_hop",
+                "question": f"Starting from \"{start['metadata'].get('title', 'Untitled')}\" ({start['id']}), "
+                            f"follow {steps}. Which document is reached at the end of this chain?",
+                "answer": answer,
+                "source_docs": path,
+                "difficulty": "medium" if hops == 2 else "hard",
+                "category": "multi_hop",
+                "context_required": True,
+                "hops": hops,
+                "reasoning_steps": [
+                    f"Read {source} and find its reference to a {docs[target]['type']} document: {target}"
+                    for source, target in zip(path, path[1:])
+                ]
+            }
+
+def write_qa_stream(qa_pairs, path, limit=None):
+    """Пишет QA пары в JSONL по одной строке, не держа их в памяти"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for qa in qa_pairs:
+            if limit is not None and count >= limit:
+                break
+            f.write(json.dumps(qa, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def generate_multi_hop_qa_pairs(graph, documents, generated_folder="generated", limit=None):
+    """Генерирует многоходовые QA пары в generated/multi_hop_qa_pairs.jsonl"""
+    path = os.path.join(generated_folder, "multi_hop_qa_pairs.jsonl")
+    count = write_qa_stream(iter_multi_hop_qa_pairs(graph, documents), path, limit)
+    print(f"✓ Generated {count:,} multi-hop QA pairs to {path} (graph: {graph.edge_count:,} edges)")
+    return count
+
+def generate_fact_qa_pairs(world_data, provenance, generated_folder="generated", limit=None):
+    """Генерирует QA пары по фактам мира в generated/fact_qa_pairs.jsonl"""
+    path = os.path.join(generated_folder, "fact_qa_pairs.jsonl")
+    count = write_qa_stream(iter_fact_qa_pairs(world_data, provenance), path, limit)
+    print(f"✓ Generated {count:,} fact-based QA pairs to {path}")
+    return count
@@ -0,0 +1,126 @@
+# apps/world2/reference_graph.py
+import json
+import os
+import random
+import re
+from array import array
+from collections import deque
+
+# Любое упоминание идентификатора документа: (see document: X), **Related to ...:** See X, списки ссылок
+DOC_ID_PATTERN = re.compile(r'\b[A-Z]{4}_\d{3,}\b')
+
+class ReferenceGraph:
+    """Граф перекрёстных ссылок между документами в формате CSR
+
+    Соседи документа i лежат в indices[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, doc_ids, indptr, indices):
+        self.doc_ids = list(doc_ids)
+        self.position = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Строит граф за один проход по документам: O(документы + ссылки)"""
+        doc_ids = [doc['id'] for doc in documents]
+        position = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+        indptr = array('i', [0])
+        indices = array('i')
+        for i, doc in enumerate(documents):
+            targets = dict.fromkeys(
+                position[ref] for ref in DOC_ID_PATTERN.findall(document_body(doc))
+                if ref in position and position[ref] != i
+            )
+            indices.extend(targets)
+            indptr.append(len(indices))
+
+        return cls(doc_ids, indptr, indices)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def neighbors(self, node):
+        """Возвращает номера документов, на которые ссылается документ"""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def distance(self, source, target, max_depth):
+        """Длина кратчайшего пути (BFS) или None, если путь длиннее max_depth"""
+        if source == target:
+            return 0
+        depths = {source: 0}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if depths[node] >= max_depth:
+                continue
+            for neighbor in self.neighbors(node):
+                if neighbor in depths:
+                    continue
+                if neighbor == target:
+                    return depths[node] + 1
+                depths[neighbor] = depths[node] + 1
+                queue.append(neighbor)
+        return None
+
+    def random_walk(self, start, hops, rng=random, choose=None):
+        """Случайное блуждание без повторов; choose(path, candidates) сужает выбор"""
+        path = [start]
+        for _ in range(hops):
+            candidates = [n for n in self.neighbors(path[-1]) if n not in path]
+            if choose is not None:
+                candidates = choose(path, candidates)
+            if not candidates:
+                return None
+            path.append(rng.choice(candidates))
+        return path
+
+    def sample_paths(self, hops, count, rng=random, choose=None, max_attempts=None):
+        """Сэмплирует пути ровно из hops переходов без более коротких обходов"""
+        if not self.doc_ids:
+            return
+        max_attempts = max_attempts or count * 20
+        seen = set()
+        attempts = 0
+        while len(seen) < count and attempts < max_attempts:
+            attempts += 1
+            path = self.random_walk(rng.randrange(len(self.doc_ids)), hops, rng, choose)
+            if path is None or tuple(path) in seen:
+                continue
+            # Ответ должен требовать всю цепочку, а не более короткий путь
+            if self.distance(path[0], path[-1], hops) != hops:
+                continue
+            seen.add(tuple(path))
+            yield [self.doc_ids[node] for node in path]
+
+    def save(self, path="generated/reference_graph.json"):
+        """Сохраняет CSR массивы графа"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'documents': self.doc_ids,
+                'indptr': self.indptr.tolist(),
+                'indices': self.indices.tolist()
+            }, f, separators=(',', ':'))
+        return path
+
+    @classmethod
+    def load(cls, path="generated/reference_graph.json"):
+        """Загружает граф, сохранённый методом save()"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['documents'], array('i', data['indptr']), array('i', data['indices']))
+
+def document_body(doc):
+    """Текст документа без front matter (в нём указан собственный doc_id)"""
+    if 'raw_content' in doc:
+        return doc['raw_content']
+    content = doc['content']
+    if content.startswith('---\n'):
+        end = content.find('\n---\n', 4)
+        if end != -1:
+            return content[end + 5:]
+    return content
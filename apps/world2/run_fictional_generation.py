@@ -1,15 +1,39 @@
 #!/usr/bin/env python3
 # apps/world2/run_fictional_generation.py
+import argparse
 import sys
 import os
-import time
+import random
 import shutil
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # Общий конвейер pipeline.py
+
+from checkpoint import GenerationCheckpoint
+from pipeline import STATE_FILE, Pipeline, Stage, print_summary
+import fictional_document_generator
+from fictional_document_generator import (generate_qa_pairs, load_document_records, load_world_data,
+                                          save_generation_stats, save_world_data)
+from fictional_world_bible import FictionalWorldBuilder
+from entity_index import EntityIndex, save_entity_index
+from provenance_index import ProvenanceIndex, save_provenance_index
+from reference_graph import ReferenceGraph
+from qa_engine import generate_fact_qa_pairs, generate_multi_hop_qa_pairs
+from bm25_index import BM25Index, save_bm25_index
+from chunk_corpus import chunk_knowledge_base
+from hard_negatives import mine_hard_negatives
+import columnar_export
+from corpus_store import save_corpus_store
+from validate_fictional_corpus import FictionalCorpusValidator
+import evaluate_retrieval
+
+CHECKPOINT_FOLDER = "checkpoints"
+KNOWLEDGE_BASE = "knowledge_base"
+GENERATED = "generated"
 
 def cleanup_old_folders():
     """Очищает старые папки перед генерацией"""
-    folders_to_clean = ["knowledge_base", "generated", "fictional_documents"]
+    folders_to_clean = ["knowledge_base", "generated", "fictional_documents", CHECKPOINT_FOLDER]
 
     for folder in folders_to_clean:
         if os.path.exists(folder):
@@ -18,64 +42,168 @@ def cleanup_old_folders():
                 print(f"  Cleaned up: {folder}/")
             except Exception as e:
                 print(f"  Warning: Could not clean {folder}: {e}")
+    if os.path.exists(STATE_FILE):
+        os.remove(STATE_FILE)
 
-def run_script(script_name):
-    """Запускает Python скрипт"""
-    try:
-        print(f"  Running: {script_name}")
+def generated(name):
+    return os.path.join(GENERATED, name)
 
-        if script_name == "fictional_world_bible.py":
-            import fictional_world_bible
-            if hasattr(fictional_world_bible, 'main'):
-                fictional_world_bible.main()
-            else:
-                print(f"  ❌ No main() in {script_name}")
-                return False
+# Шаги конвейера: функции уровня модуля, каждая выполняется в отдельном процессе
 
-        elif script_name == "fictional_document_generator.py":
-            import fictional_document_generator
-            if hasattr(fictional_document_generator, 'main'):
-                fictional_document_generator.main()
-            else:
-                print(f"  ❌ No main() in {script_name}")
-                return False
+def build_world(seed=None):
+    """Мир и карта терминов в generated/"""
+    if seed is not None:
+        random.seed(seed)
+    builder = FictionalWorldBuilder()
+    world_data, _ = builder.build_world()
+    os.makedirs(GENERATED, exist_ok=True)
+    save_world_data(world_data, builder.categories, GENERATED)
 
-        else:
-            print(f"  ❌ Unknown script: {script_name}")
-            return False
+def generate_documents(generator_args):
+    """Документы базы знаний и их записи для следующих шагов"""
+    fictional_document_generator.main([*generator_args, '--world-dir', GENERATED, '--documents-only'])
+
+def build_document_indexes():
+    """Индексы упоминаний сущностей, происхождения фактов и граф ссылок"""
+    documents = load_document_records(GENERATED)
+    save_entity_index(documents, GENERATED)
+    save_provenance_index(documents, GENERATED)
+    ReferenceGraph.from_documents(documents).save(generated("reference_graph.json"))
+
+def build_retrieval_index():
+    """Фрагменты с байтовыми смещениями и BM25 индекс"""
+    chunk_knowledge_base(KNOWLEDGE_BASE, generated("chunks.jsonl"))
+    save_bm25_index(KNOWLEDGE_BASE, GENERATED)
+
+def build_qa_pairs(seed=None):
+    """QA пары всех типов и hard negatives к ним"""
+    if seed is not None:
+        random.seed(seed)  # Выборка многоходовых путей
+    world_data, terms_map = load_world_data(GENERATED)
+    documents = load_document_records(GENERATED)
+    entity_index = EntityIndex.load(generated("entity_index.json"))
+    provenance = ProvenanceIndex.load(generated("provenance_index.json"))
+    generate_qa_pairs(documents, world_data, terms_map, GENERATED, provenance)
+    generate_fact_qa_pairs(world_data, provenance, GENERATED)
+    generate_multi_hop_qa_pairs(ReferenceGraph.load(generated("reference_graph.json")), documents, GENERATED)
+    mine_hard_negatives(world_data, KNOWLEDGE_BASE, GENERATED, BM25Index.load(generated("bm25_index")), entity_index,
+                        provenance=provenance)
+
+def export_corpus(sqlite_store=False):
+    """Колоночный экспорт (если установлен pyarrow) и SQLite хранилище (с --sqlite-store)"""
+    if columnar_export.pa is not None:
+        columnar_export.export_columnar(KNOWLEDGE_BASE, GENERATED)
+    else:
+        print("⚠️  Skipping columnar export: pyarrow is not installed")
+    if sqlite_store:
+        save_corpus_store(load_document_records(GENERATED), GENERATED)
 
-        return True
+def save_stats():
+    world_data, _ = load_world_data(GENERATED)
+    save_generation_stats(load_document_records(GENERATED), world_data, GENERATED)
 
-    except Exception as e:
-        print(f"  ❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+def validate_corpus():
+    FictionalCorpusValidator(KNOWLEDGE_BASE, GENERATED).generate_coherence_report()
+
+def analyze_retrieval():
+    """Оценка BM25 на QA парах: насколько набор сложен для поиска"""
+    evaluate_retrieval.main(['--knowledge-base', KNOWLEDGE_BASE, '--generated', GENERATED])
+
+QA_OUTPUTS = ["qa_pairs.jsonl", "few_shot_qa_pairs.jsonl", "chain_of_thought_qa_pairs.jsonl",
+              "fact_qa_pairs.jsonl", "multi_hop_qa_pairs.jsonl"]
+
+def build_stages(seed=None, generator_args=(), resume=False, checkpoint_every=1000, sqlite_store=False):
+    """Шаги генерации мира 2; зависимости выводятся из inputs/outputs"""
+    generator_args = list(generator_args)
+    if seed is not None:
+        generator_args += ['--seed', str(seed)]
+    # --resume не меняет результат, поэтому не входит в ключ актуальности
+    documents_args = generator_args + ['--checkpoint-dir', CHECKPOINT_FOLDER,
+                                       '--checkpoint-every', str(checkpoint_every)]
+    if resume:
+        documents_args.append('--resume')
+    documents_outputs = [KNOWLEDGE_BASE, generated("knowledge_base_index.json"), generated("documents.jsonl")]
+    if any(arg.split('=')[0] == '--token-budget' for arg in generator_args):
+        documents_outputs.append(generated("corpus_plan_report.json"))
+    world = [generated("fictional_world.json"), generated("terms_map.json")]
+    export_outputs = [generated("corpus.db")] if sqlite_store else []
+    if columnar_export.pa is not None:
+        export_outputs.append(generated("columnar"))
+
+    stages = [
+        # Без --seed каждый прогон строит новый мир (и, значит, новый корпус), а не берёт прошлый;
+        # продолжение прерванной генерации остаётся в мире контрольной точки
+        Stage("world", build_world, outputs=world, args=(seed,), reproducible=seed is not None or resume,
+              description="Building fictional world with unique terms"),
+        Stage("documents", generate_documents, inputs=world, outputs=documents_outputs,
+              args=(documents_args,), params=generator_args, description="Generating documents"),
+        Stage("index", build_document_indexes, inputs=[generated("documents.jsonl")],
+              outputs=[generated("entity_index.json"), generated("provenance_index.json"),
+                       generated("reference_graph.json")],
+              description="Indexing entities, fact provenance and references"),
+        Stage("retrieval", build_retrieval_index, inputs=[KNOWLEDGE_BASE],
+              outputs=[generated("chunks.jsonl"), generated("bm25_index")],
+              description="Chunking documents and building the BM25 index"),
+        Stage("qa", build_qa_pairs, args=(seed,),
+              inputs=[*world, generated("documents.jsonl"), generated("entity_index.json"),
+                      generated("provenance_index.json"), generated("reference_graph.json"),
+                      generated("bm25_index"), KNOWLEDGE_BASE],
+              outputs=[generated(name) for name in QA_OUTPUTS],
+              description="Generating QA pairs and hard negatives"),
+        Stage("export", export_corpus, args=(sqlite_store,),
+              inputs=[KNOWLEDGE_BASE, generated("knowledge_base_index.json"), generated("documents.jsonl"),
+                      *(generated(name) for name in QA_OUTPUTS)],
+              outputs=export_outputs, description="Exporting columnar files and the SQLite store"),
+        Stage("stats", save_stats, inputs=[generated("documents.jsonl"), generated("fictional_world.json")],
+              outputs=[generated("generation_stats.json")], description="Saving generation statistics"),
+        Stage("validation", validate_corpus,
+              inputs=[KNOWLEDGE_BASE, generated("terms_map.json"), generated("entity_index.json")],
+              outputs=[generated("validation_report.json")], description="Validating the corpus"),
+        Stage("analysis", analyze_retrieval,
+              inputs=[KNOWLEDGE_BASE, generated("qa_pairs.jsonl"), generated("bm25_index")],
+              outputs=[generated("retrieval_report.json")], description="Evaluating BM25 retrieval on QA pairs")
+    ]
+    # Без pyarrow и --sqlite-store экспортировать нечего
+    return [stage for stage in stages if stage.name != "export" or export_outputs]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fictional universe generation pipeline")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for a reproducible world, corpus and QA pairs")
+    parser.add_argument('--force', action='store_true',
+                        help="Clean outputs and rerun every stage even if it is up to date")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Stages run concurrently when independent (default: CPU count)")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Continue an interrupted document generation from {CHECKPOINT_FOLDER}/")
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+                        help="Documents between checkpoints")
+    parser.add_argument('--sqlite-store', action='store_true',
+                        help="Also export the corpus to generated/corpus.db (SQLite with FTS5)")
+    # Остальные аргументы передаются генератору документов (--token-budget, --lengths, ...)
+    args, generator_args = parser.parse_known_args(argv)
+    if args.force and args.resume:
+        parser.error("--force discards the checkpoint that --resume continues from")
 
-def main():
     print("🎭 Fictional Universe Generator v2.0")
     print("=" * 60)
     print("Creating unique documents with new folder structure")
 
-    # Очищаем старые папки
-    print("\n🧹 Cleaning up old folders...")
-    cleanup_old_folders()
-
-    # Шаги генерации
-    steps = [
-        ("Building fictional world with unique terms", "fictional_world_bible.py"),
-        ("Generating 50 documents with new structure", "fictional_document_generator.py")
-    ]
+    resuming = args.resume and GenerationCheckpoint(CHECKPOINT_FOLDER).exists()
+    if resuming:
+        print(f"\n♻️  Resuming from {CHECKPOINT_FOLDER}/")
+    elif args.resume:
+        print(f"\n⚠️  No checkpoint in {CHECKPOINT_FOLDER}/, starting from scratch")
+    if args.force:
+        # Очищаем старые папки
+        print("\n🧹 Cleaning up old folders...")
+        cleanup_old_folders()
 
-    for desc, script in steps:
-        print(f"\n📝 {desc}")
-        print("-" * 40)
-        success = run_script(script)
-        if success:
-            print("  ✅ Success")
-        else:
-            print("  ⚠️  Issues encountered")
-        time.sleep(0.5)
+    print("\n📝 Running pipeline stages")
+    print("-" * 40)
+    stages = build_stages(args.seed, generator_args, resuming, args.checkpoint_every, args.sqlite_store)
+    results = Pipeline(stages, STATE_FILE, args.workers, force=args.force).run()
+    print_summary(results)
 
     # Проверяем результаты
     print("\n" + "=" * 60)
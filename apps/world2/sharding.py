@@ -0,0 +1,78 @@
+# apps/world2/sharding.py
+import hashlib
+import json
+import os
+import random
+
+MANIFEST_FILE = "shard_manifest.json"
+
+def shard_range(total, index, count):
+    """Позиции [start, stop) плана из total документов для шарда index из count"""
+    return total * index // count, total * (index + 1) // count
+
+def world_fingerprint(world_data, terms_map):
+    """Отпечаток мира: шарды одного корпуса должны строиться на одном мире"""
+    data = json.dumps({'world_data': world_data, 'terms_map': terms_map}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+class Shard:
+    """Шард i из n корпуса с общим зерном
+
+    Мир, номера шаблонов и план документов строятся из общего зерна
+    одинаково во всех шардах; шард генерирует только свой непрерывный
+    диапазон плана с глобальными идентификаторами документов, а выборы
+    документов берутся из собственного потока, производного от зерна и
+    номера шарда. Перечисление шаблонов делится между шардами через
+    смещение и шаг, так что тела документов не повторяются между шардами.
+    """
+
+    def __init__(self, index, count, seed):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} out of range for {count} shards")
+        self.index = index
+        self.count = count
+        self.seed = seed
+
+    @classmethod
+    def parse(cls, spec, seed):
+        """Разбирает "i/n" (например, "0/4")"""
+        index, _, count = spec.partition('/')
+        return cls(int(index), int(count), seed)
+
+    @property
+    def stream_seed(self):
+        """Зерно потока выборов шарда"""
+        digest = hashlib.sha256(f"{self.seed}:{self.index}/{self.count}".encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def range(self, total):
+        return shard_range(total, self.index, self.count)
+
+    def seed_generator(self, generator):
+        """Переключает генератор на поток выборов шарда (после общей подготовки)"""
+        random.seed(self.stream_seed)
+        if generator.rng is not random:
+            generator.rng.seed(self.stream_seed)
+        generator.content_gen.set_shard(self.index, self.count)
+
+    def manifest(self, plan, world_data, terms_map):
+        start, stop = self.range(len(plan))
+        return {
+            'shard': self.index,
+            'shards': self.count,
+            'seed': self.seed,
+            'plan_documents': len(plan),
+            'start': start,
+            'stop': stop,
+            'world_fingerprint': world_fingerprint(world_data, terms_map)
+        }
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count}, seed={self.seed})"
+
+def save_shard_manifest(manifest, generated_folder="generated"):
+    path = os.path.join(generated_folder, MANIFEST_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"✓ Shard manifest saved to {path}")
+    return path
@@ -0,0 +1,274 @@
+# apps/world2/shared_world.py
+import struct
+from array import array
+from collections.abc import Mapping, Sequence
+from multiprocessing import shared_memory
+
+# Виды узлов дерева мира
+KIND_NONE, KIND_BOOL, KIND_INT, KIND_FLOAT, KIND_STR, KIND_LIST, KIND_DICT = range(7)
+
+MAGIC = b'SWLD'
+# magic, число узлов, детей, строк, размер блоба строк (байт)
+HEADER = struct.Struct('<4s4x4q')
+FLOAT = struct.Struct('<d')
+INT64 = struct.Struct('<q')
+
+class _Freezer:
+    """Раскладывает JSON-подобное дерево в плоские таблицы узлов и строк"""
+
+    def __init__(self):
+        self.kinds = array('q')
+        self.a = array('q')  # str: номер строки; list/dict: первый ребёнок; скаляр: значение
+        self.b = array('q')  # list/dict: число детей
+        self.child_nodes = array('q')
+        self.child_keys = array('q')  # Номер строки ключа (-1 у элементов списка)
+        self.strings = {}  # Одинаковые строки хранятся один раз
+
+    def string(self, text):
+        return self.strings.setdefault(text, len(self.strings))
+
+    def node(self, value):
+        index = len(self.kinds)
+        if value is None:
+            self._add(KIND_NONE, 0, 0)
+        elif isinstance(value, bool):
+            self._add(KIND_BOOL, int(value), 0)
+        elif isinstance(value, int):
+            self._add(KIND_INT, value, 0)
+        elif isinstance(value, float):
+            self._add(KIND_FLOAT, INT64.unpack(FLOAT.pack(value))[0], 0)
+        elif isinstance(value, str):
+            self._add(KIND_STR, self.string(value), 0)
+        elif isinstance(value, Mapping):
+            self._container(KIND_DICT, [(self.string(str(key)), item) for key, item in value.items()])
+        elif isinstance(value, (list, tuple)):
+            self._container(KIND_LIST, [(-1, item) for item in value])
+        else:
+            raise TypeError(f"Cannot share value of type {type(value).__name__}")
+        return index
+
+    def _add(self, kind, a, b):
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+
+    def _container(self, kind, items):
+        node = len(self.kinds)
+        start = len(self.child_nodes)
+        self._add(kind, start, len(items))
+        # Дети контейнера лежат подряд: места резервируются до обхода вложенных узлов
+        self.child_nodes.extend([0] * len(items))
+        self.child_keys.extend(key for key, _ in items)
+        for offset, (_, item) in enumerate(items):
+            self.child_nodes[start + offset] = self.node(item)
+        return node
+
+    def tables(self):
+        blob = bytearray()
+        offsets = array('q', [0])
+        for text in self.strings:  # Порядок вставки совпадает с номерами строк
+            blob += text.encode('utf-8')
+            offsets.append(len(blob))
+        return [self.kinds, self.a, self.b, self.child_nodes, self.child_keys, offsets], bytes(blob)
+
+class SharedWorld:
+    """Данные мира в разделяемой памяти только для чтения
+
+    Мир (world_data и terms_map) один раз раскладывается в таблицы: узлы
+    дерева, индексы детей и UTF-8 блоб уникальных строк с таблицей
+    смещений. Процессы-воркеры подключаются к блоку по имени и читают
+    его через представления SharedDict/SharedList без копирования и
+    распаковки, поэтому память не растёт с числом воркеров. Строки
+    декодируются при обращении.
+
+    Создатель блока отвечает за unlink(); воркеры только close().
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        magic, nodes, children, strings, blob_size = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory block {shm.name} does not hold a shared world")
+        sizes = (nodes, nodes, nodes, children, children, strings + 1)
+        # Блок округляется до страницы, поэтому приводится только область таблиц
+        blob_start = HEADER.size + sum(sizes) * INT64.size
+        words = memoryview(shm.buf)[HEADER.size:blob_start].cast('q')
+        tables = []
+        position = 0
+        for size in sizes:
+            tables.append(words[position:position + size])
+            position += size
+        self.kinds, self.a, self.b, self.child_nodes, self.child_keys, self.offsets = tables
+        self.blob = memoryview(shm.buf)[blob_start:blob_start + blob_size]
+        # Ключ словаря -> номер строки; различных ключей (имён полей) немного
+        self.key_ids = {self.string(key): key for key in set(self.child_keys) if key >= 0}
+        self.root = self.value(0)
+
+    @classmethod
+    def create(cls, world_data, terms_map, name=None):
+        """Замораживает мир в новый блок разделяемой памяти"""
+        freezer = _Freezer()
+        freezer.node({'world_data': world_data, 'terms_map': terms_map})
+        tables, blob = freezer.tables()
+        size = HEADER.size + sum(len(table) for table in tables) * INT64.size + len(blob)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        HEADER.pack_into(shm.buf, 0, MAGIC, len(freezer.kinds), len(freezer.child_nodes),
+                         len(freezer.strings), len(blob))
+        position = HEADER.size
+        for table in tables:
+            data = table.tobytes()
+            shm.buf[position:position + len(data)] = data
+            position += len(data)
+        shm.buf[position:position + len(blob)] = blob
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Подключается к уже созданному блоку (в процессе-воркере)"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def world_data(self):
+        return self.root['world_data']
+
+    @property
+    def terms_map(self):
+        return self.root['terms_map']
+
+    def string(self, index):
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def value(self, node):
+        kind = self.kinds[node]
+        if kind == KIND_STR:
+            return self.string(self.a[node])
+        if kind == KIND_DICT:
+            return SharedDict(self, self.a[node], self.b[node])
+        if kind == KIND_LIST:
+            return SharedList(self, self.a[node], self.b[node])
+        if kind == KIND_INT:
+            return self.a[node]
+        if kind == KIND_FLOAT:
+            return FLOAT.unpack(INT64.pack(self.a[node]))[0]
+        if kind == KIND_BOOL:
+            return bool(self.a[node])
+        return None
+
+    def close(self):
+        # Представления держат memoryview блока: их нужно отпустить до закрытия
+        self.kinds = self.a = self.b = self.child_nodes = self.child_keys = self.offsets = None
+        self.blob = self.root = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+class SharedList(Sequence):
+    """Список мира в разделяемой памяти (только чтение)"""
+
+    __slots__ = ('world', 'start', 'length')
+
+    def __init__(self, world, start, length):
+        self.world, self.start, self.length = world, start, length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("SharedList index out of range")
+        return self.world.value(self.world.child_nodes[self.start + index])
+
+    def __iter__(self):
+        world = self.world
+        for position in range(self.start, self.start + self.length):
+            yield world.value(world.child_nodes[position])
+
+    def __eq__(self, other):
+        if isinstance(other, (SharedList, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def to_python(self):
+        return [to_python(item) for item in self]
+
+    def __repr__(self):
+        return f"SharedList({self.to_python()!r})"
+
+class SharedDict(Mapping):
+    """Словарь мира в разделяемой памяти (только чтение)"""
+
+    __slots__ = ('world', 'start', 'length')
+
+    def __init__(self, world, start, length):
+        self.world, self.start, self.length = world, start, length
+
+    def _position(self, key):
+        key_id = self.world.key_ids.get(key, -1)
+        if key_id >= 0:
+            keys = self.world.child_keys
+            for position in range(self.start, self.start + self.length):
+                if keys[position] == key_id:
+                    return position
+        return None
+
+    def __getitem__(self, key):
+        position = self._position(key)
+        if position is None:
+            raise KeyError(key)
+        return self.world.value(self.world.child_nodes[position])
+
+    def __contains__(self, key):
+        return self._position(key) is not None
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        world = self.world
+        for position in range(self.start, self.start + self.length):
+            yield world.string(world.child_keys[position])
+
+    def to_python(self):
+        return {key: to_python(value) for key, value in self.items()}
+
+    def __repr__(self):
+        return f"SharedDict({self.to_python()!r})"
+
+def to_python(value):
+    """Обычные dict/list из представлений разделяемой памяти (например, для json.dump)"""
+    if isinstance(value, (SharedDict, SharedList)):
+        return value.to_python()
+    return value
+
+_worker_world = None
+
+def attach_worker(name):
+    """Инициализатор пула процессов: подключает воркер к разделяемому миру"""
+    global _worker_world
+    _worker_world = SharedWorld.attach(name)
+
+def worker_world():
+    """Разделяемый мир текущего воркера (после attach_worker)"""
+    if _worker_world is None:
+        raise RuntimeError("Worker is not attached to a shared world")
+    return _worker_world
@@ -0,0 +1,81 @@
+# apps/world2/simhash_index.py
+import hashlib
+
+import numpy as np
+
+try:
+    from .bm25_index import tokenize
+except ImportError:
+    from bm25_index import tokenize
+
+FINGERPRINT_BITS = 64
+
+def shingles(text, size=3):
+    """Перекрывающиеся n-граммы слов текста (признаки SimHash)"""
+    tokens = tokenize(text)
+    if len(tokens) < size:
+        return [' '.join(tokens)] if tokens else []
+    return [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+def simhash(text, size=3):
+    """64-битный отпечаток SimHash по шинглам слов
+
+    Хеши признаков раскладываются на биты одной матрицей numpy; бит
+    отпечатка равен 1, если у большинства признаков этот бит установлен.
+    """
+    features = shingles(text, size)
+    if not features:
+        return 0
+    digests = b''.join(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest() for feature in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(features)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+class SimHashIndex:
+    """Индекс отпечатков SimHash с поиском соседей в пределах max_distance бит
+
+    Отпечаток режется на max_distance + 1 полос; по принципу Дирихле
+    у отпечатков на расстоянии не больше max_distance хотя бы одна полоса
+    совпадает целиком. Поэтому поиск проверяет только кандидатов из
+    таблиц полос, а не все сохранённые отпечатки.
+    """
+
+    def __init__(self, max_distance=3, bits=FINGERPRINT_BITS):
+        self.max_distance = max_distance
+        self.bits = bits
+        bands = max_distance + 1
+        width, extra = divmod(bits, bands)
+        self.bands = []  # (сдвиг, маска) каждой полосы
+        shift = 0
+        for band in range(bands):
+            band_width = width + (1 if band < extra else 0)
+            self.bands.append((shift, (1 << band_width) - 1))
+            shift += band_width
+        self.tables = [{} for _ in self.bands]
+        self.size = 0
+
+    def add(self, fingerprint):
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            table.setdefault((fingerprint >> shift) & mask, []).append(fingerprint)
+        self.size += 1
+
+    def nearest(self, fingerprint):
+        """Ближайший сохранённый отпечаток в пределах max_distance: (отпечаток, расстояние) или None"""
+        best = None
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            for candidate in table.get((fingerprint >> shift) & mask, ()):
+                distance = hamming_distance(fingerprint, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (candidate, distance)
+                    if distance == 0:
+                        return best
+        return best
+
+    def __contains__(self, fingerprint):
+        return self.nearest(fingerprint) is not None
+
+    def __len__(self):
+        return self.size
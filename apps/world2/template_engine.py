@@ -0,0 +1,510 @@
+# apps/world2/template_engine.py
+import json
+import math
+import os
+import re
+
+TEMPLATES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# {{ и }} — литеральные скобки, {…} — слот
+TOKEN_PATTERN = re.compile(r'\{\{|\}\}|\{([^{}]*)\}')
+# {name}, {name.field}, {name!lower}
+REF_PATTERN = re.compile(r'^([A-Za-z_]\w*)(?:\.(\w+))?(?:!(\w+))?$')
+INT_PATTERN = re.compile(r'^int:(-?\d+)-(-?\d+)$')
+
+FILTERS = {'lower': str.lower, 'upper': str.upper, 'title': str.title}
+
+class TemplateError(ValueError):
+    """Ошибка в описании шаблона"""
+
+class Text:
+    """Последовательность литералов и слотов"""
+
+    __slots__ = ('parts', 'capacity')
+
+    def __init__(self, parts):
+        # Соседние литералы склеиваются при компиляции
+        merged = []
+        for part in parts:
+            if isinstance(part, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += part
+            elif part != '':
+                merged.append(part)
+        self.parts = tuple(merged)
+        self.capacity = math.prod(part.capacity for part in self.parts if not isinstance(part, str))
+
+    def render(self, ctx):
+        return ''.join([part if part.__class__ is str else part.render(ctx) for part in self.parts])
+
+    def render_rank(self, ctx, rank):
+        out = []
+        for part in self.parts:
+            if part.__class__ is str:
+                out.append(part)
+            else:
+                rank, sub_rank = divmod(rank, part.capacity)
+                out.append(part.render_rank(ctx, sub_rank))
+        return ''.join(out)
+
+    def nodes(self):
+        return [part for part in self.parts if not isinstance(part, str)]
+
+class Choice:
+    """Выбор одного варианта; рендерится только выбранная ветка"""
+
+    __slots__ = ('options', 'capacity')
+
+    def __init__(self, options):
+        if not options:
+            raise TemplateError("Choice slot needs at least one option")
+        self.options = tuple(options)
+        # Ёмкость — сумма по веткам: слоты невыбранных веток не размножают комбинации
+        self.capacity = sum(option.capacity for option in self.options)
+
+    def render(self, ctx):
+        return ctx.rng.choice(self.options).render(ctx)
+
+    def render_rank(self, ctx, rank):
+        for option in self.options:
+            if rank < option.capacity:
+                return option.render_rank(ctx, rank)
+            rank -= option.capacity
+        raise IndexError(rank)
+
+    def nodes(self):
+        return []  # Ссылки внутри веток условны
+
+class Int:
+    """Целое число из отрезка [low, high]"""
+
+    __slots__ = ('low', 'high', 'capacity')
+
+    def __init__(self, low, high):
+        if high < low:
+            raise TemplateError(f"Empty int range {low}-{high}")
+        self.low, self.high = low, high
+        self.capacity = high - low + 1
+
+    def render(self, ctx):
+        return str(ctx.rng.randint(self.low, self.high))
+
+    def render_rank(self, ctx, rank):
+        return str(self.low + rank)
+
+    def nodes(self):
+        return []
+
+class Character:
+    """Вымышленный персонаж по роли (роль может браться из параметра: $param)"""
+
+    __slots__ = ('role',)
+    capacity = 1
+
+    def __init__(self, role):
+        self.role = role
+
+    def render(self, ctx):
+        role = ctx.params[self.role[1:]] if self.role.startswith('$') else self.role
+        return ctx.content_gen.get_character(role)
+
+    def render_rank(self, ctx, rank):
+        return self.render(ctx)
+
+    def nodes(self):
+        return []
+
+# Поле с именем сущности по категориям мира
+ENTITY_NAME_FIELDS = {'characters': 'fictional_name', 'magic_items': 'fictional', 'historical_events': 'fictional'}
+
+def join_values(values):
+    """Объединяет значения в читаемый список"""
+    values = list(values)
+    if len(values) < 2:
+        return ''.join(values)
+    return f"{', '.join(values[:-1])} and {values[-1]}"
+
+def field_text(value):
+    """Текст поля записи мира: списки — через join_values"""
+    return join_values(value) if isinstance(value, list) else str(value)
+
+def entity_name(category, entry):
+    return entry.get(ENTITY_NAME_FIELDS.get(category, 'name'))
+
+class WorldRecord(dict):
+    """Поля записи мира; entity — имя сущности (None, если подставлены только значения по умолчанию)"""
+
+    __slots__ = ('category', 'entity')
+
+    def __init__(self, fields, category, entity=None):
+        super().__init__(fields)
+        self.category = category
+        self.entity = entity
+
+class WorldEntry:
+    """Случайная запись мира (например, регион); значение — словарь полей
+
+    match отбирает записи по значениям полей ($param — из параметра
+    шаблона). Число записей зависит от мира и параметров, а шаблон
+    компилируется один раз, поэтому ёмкость слота считается при рендере
+    (count), а номер записи при перечислении — часть номера комбинации.
+    """
+
+    __slots__ = ('category', 'defaults', 'match')
+
+    def __init__(self, category, defaults=None, match=None):
+        self.category = category
+        self.defaults = defaults or {}
+        self.match = match or {}
+
+    def _entries(self, content_gen, params):
+        entries = content_gen.world_data.get(self.category, [])
+        if not self.match:
+            return entries
+        match = {field: params[value[1:]] if isinstance(value, str) and value.startswith('$') else value
+                 for field, value in self.match.items()}
+        return [entry for entry in entries if all(entry.get(field) == value for field, value in match.items())]
+
+    def count(self, content_gen, params):
+        """Число различных значений слота в мире (не меньше одного: без записей — значения по умолчанию)"""
+        return max(1, len(self._entries(content_gen, params)))
+
+    def _entry(self, ctx, entry):
+        if entry is None:
+            return WorldRecord(self.defaults, self.category)
+        name = ctx.content_gen.record_mention(entity_name(self.category, entry), self.category)
+        return WorldRecord({**self.defaults, **entry}, self.category, name)
+
+    def render(self, ctx):
+        entries = self._entries(ctx.content_gen, ctx.params)
+        return self._entry(ctx, ctx.rng.choice(entries) if entries else None)
+
+    def render_rank(self, ctx, rank):
+        entries = self._entries(ctx.content_gen, ctx.params)
+        return self._entry(ctx, entries[rank] if entries else None)
+
+    def nodes(self):
+        return []
+
+class Ref:
+    """Ссылка на именованный слот шаблона (значение одно на весь рендер)"""
+
+    __slots__ = ('name', 'field', 'filter')
+    capacity = 1
+
+    def __init__(self, name, field=None, filter_name=None):
+        if filter_name is not None and filter_name not in FILTERS:
+            raise TemplateError(f"Unknown filter !{filter_name}")
+        self.name, self.field, self.filter = name, field, filter_name
+
+    def render(self, ctx):
+        value = ctx.value(self.name)
+        fact = None
+        if self.field is not None:
+            record, value = value, field_text(value.get(self.field, ''))
+            if isinstance(record, WorldRecord) and record.entity is not None and self.field in record \
+                    and value != record.entity:
+                # Поле записи мира в тексте (кроме имени) — факт мира для QA пар
+                fact = (f"{record.category}.{self.field}", record.entity)
+        else:
+            slot = ctx.template.slots[self.name]
+            if slot.fact:
+                fact = (slot.fact, ctx.value(slot.subject) if slot.subject else None)
+        text = FILTERS[self.filter](value) if self.filter else value
+        if fact is None or not ctx.record_facts:
+            return text
+        # Факт записывается там, где его текст выводится, вместе с позицией в документе
+        return ctx.content_gen.record_fact(*fact, value, text)
+
+    def render_rank(self, ctx, rank):
+        return self.render(ctx)
+
+    def nodes(self):
+        return []
+
+class Slot:
+    """Именованный слот: узел значения и (необязательно) факт мира
+
+    fact — имя атрибута, subject — слот, значение которого называет
+    сущность факта (например, эликсир для его ингредиента). Факт
+    записывается при каждом выводе слота в текст документа.
+    """
+
+    __slots__ = ('node', 'fact', 'subject')
+
+    def __init__(self, node, fact=None, subject=None):
+        self.node = node
+        self.fact = fact
+        self.subject = subject
+
+class RenderContext:
+    """Состояние одного рендера: значения именованных слотов и источник выборов"""
+
+    __slots__ = ('template', 'content_gen', 'rng', 'params', 'values', 'slot_ranks', 'record_facts', 'retained')
+
+    def __init__(self, template, content_gen, params, slot_ranks=None, retained=None):
+        self.template = template
+        self.content_gen = content_gen
+        self.rng = content_gen.rng
+        self.params = params
+        self.values = {}
+        self.slot_ranks = slot_ranks
+        self.record_facts = True  # Факты записываются только в тексте документа, не в метаданных
+        # Значения постоянных слотов прошлого черновика: имя -> (значение, упомянутые сущности)
+        self.retained = retained
+
+    def value(self, name):
+        if name in self.values:
+            return self.values[name]
+        if self.retained is not None and name in self.template.fixed:
+            value = self._retained_value(name)
+        else:
+            value = self._render_slot(name)
+        self.values[name] = value
+        return value
+
+    def _render_slot(self, name):
+        slot = self.template.slots[name]
+        if self.slot_ranks is None:
+            return slot.node.render(self)
+        # Условные слоты при перечислении фиксируются на первом варианте
+        return slot.node.render_rank(self, self.slot_ranks.get(name, 0))
+
+    def _retained_value(self, name):
+        """Значение постоянного слота: из прошлого черновика или рендер с учётом его упоминаний"""
+        mentions = self.content_gen.document_mentions
+        if name in self.retained:
+            value, slot_mentions = self.retained[name]
+        else:
+            # Упоминания слота собираются отдельно: откат черновика их стирает, а значение остаётся
+            self.content_gen.document_mentions = {}
+            try:
+                value = self._render_slot(name)
+            finally:
+                slot_mentions, self.content_gen.document_mentions = self.content_gen.document_mentions, mentions
+            self.retained[name] = (value, slot_mentions)
+        for entity, category in slot_mentions.items():
+            mentions.setdefault(entity, category)
+        return value
+
+def compile_text(text):
+    """Компилирует строку с слотами в узел Text"""
+    if isinstance(text, list):
+        text = "\n".join(text)
+    parts = []
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        parts.append(text[position:match.start()])
+        position = match.end()
+        token = match.group(0)
+        if token in ('{{', '}}'):
+            parts.append(token[0])
+        else:
+            parts.append(compile_inline(match.group(1)))
+    parts.append(text[position:])
+    return Text(parts)
+
+def compile_inline(spec):
+    """Слот внутри текста: {name}, {int:1-30}, {character:hero}, {a|b|c}"""
+    if '|' in spec:
+        return Choice([Text([option]) for option in spec.split('|')])
+    match = INT_PATTERN.match(spec)
+    if match:
+        return Int(int(match.group(1)), int(match.group(2)))
+    if spec.startswith('character:'):
+        return Character(spec[len('character:'):])
+    match = REF_PATTERN.match(spec)
+    if match:
+        return Ref(*match.groups())
+    raise TemplateError(f"Cannot parse slot {{{spec}}}")
+
+def compile_slot(definition):
+    """Именованный слот из описания: строка, список вариантов или словарь с типом"""
+    if isinstance(definition, str):
+        return Slot(compile_text(definition))
+    if isinstance(definition, list):
+        return Slot(Choice([compile_text(option) for option in definition]))
+    fact = definition.get('fact')
+    if 'choice' in definition:
+        node = Choice([compile_text(option) for option in definition['choice']])
+    elif 'int' in definition:
+        low, high = definition['int']
+        node = Int(low, high)
+    elif 'character' in definition:
+        node = Character(definition['character'])
+    elif 'world' in definition:
+        node = WorldEntry(definition['world'], definition.get('defaults'), definition.get('match'))
+    elif 'text' in definition:
+        node = compile_text(definition['text'])
+    else:
+        raise TemplateError(f"Unknown slot type: {sorted(definition)}")
+    return Slot(node, fact, definition.get('subject'))
+
+class CompiledTemplate:
+    """Шаблон, скомпилированный в дерево узлов
+
+    Рендер проходит только по выбранным веткам, поэтому стоит столько,
+    сколько текста реально выводится. Ёмкость (число различных текстов)
+    считается по структуре: произведение по последовательностям и сумма
+    по веткам выбора, с учётом безусловно используемых именованных слотов;
+    слоты записей мира добавляют множителем число подходящих записей
+    (capacity_for).
+    """
+
+    def __init__(self, name, definition):
+        self.name = name
+        self.params = definition.get('params', {})
+        self.slots = {slot_name: compile_slot(slot) for slot_name, slot in definition.get('slots', {}).items()}
+        self.body = compile_text(definition['text'])
+        self.document = definition.get('document')
+        self.metadata = {key: compile_text(value) if isinstance(value, (str, list)) else value
+                         for key, value in (self.document or {}).get('metadata', {}).items()}
+
+        for node in self._all_refs():
+            if node.name not in self.slots:
+                raise TemplateError(f"Template {name} refers to undefined slot {{{node.name}}}")
+        for slot_name, slot in self.slots.items():
+            if slot.subject is not None and slot.subject not in self.slots:
+                raise TemplateError(f"Fact slot {slot_name} of template {name} has undefined subject {slot.subject!r}")
+
+        self.unconditional = self._unconditional_slots()
+        self.fixed = self._fixed_slots()
+
+    def _all_refs(self):
+        stack = [self.body] + [slot.node for slot in self.slots.values()] + \
+                [value for value in self.metadata.values() if isinstance(value, Text)]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Ref):
+                yield node
+            elif isinstance(node, Text):
+                stack.extend(node.nodes())
+            elif isinstance(node, Choice):
+                stack.extend(node.options)
+
+    def _unconditional_slots(self):
+        """Слоты, которые попадают в текст при любых выборах (в порядке обнаружения)"""
+        found = []
+        stack = [self.body]
+        while stack:
+            node = stack.pop(0)
+            for child in node.nodes():
+                if isinstance(child, Ref) and child.name not in found:
+                    found.append(child.name)
+                    stack.append(self.slots[child.name].node)
+                elif isinstance(child, Text):
+                    stack.append(child)
+        return found
+
+    def _fixed_slots(self):
+        """Слоты, значение которых не зависит от случайных выборов (персонажи и текст из них)
+
+        Слот постоянен, если это персонаж по роли или текст из литералов,
+        персонажей и ссылок на постоянные слоты без фактов (разметка факта
+        ссылается на учёт фактов конкретного черновика).
+        """
+        fixed = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, slot in self.slots.items():
+                if name not in fixed and self._is_fixed(slot.node, fixed):
+                    fixed.add(name)
+                    changed = True
+        return frozenset(fixed)
+
+    def _is_fixed(self, node, fixed):
+        if isinstance(node, Character):
+            return True
+        if not isinstance(node, Text):
+            return False
+        for part in node.nodes():
+            if isinstance(part, Ref):
+                if part.field is not None or part.name not in fixed or self.slots[part.name].fact:
+                    return False
+            elif not self._is_fixed(part, fixed):
+                return False
+        return True
+
+    def _slot_capacities(self, content_gen, params):
+        """Ёмкость каждого безусловного слота (для записей мира — по миру и параметрам)"""
+        return {name: node.count(content_gen, params) if isinstance(node, WorldEntry) else node.capacity
+                for name, node in ((name, self.slots[name].node) for name in self.unconditional)}
+
+    def capacity_for(self, content_gen, params=None):
+        """Число различных текстов шаблона в мире content_gen при данных параметрах"""
+        params = {**self.params, **(params or {})}
+        return self.body.capacity * math.prod(self._slot_capacities(content_gen, params).values())
+
+    def _context(self, content_gen, params, rank, retained=None):
+        params = {**self.params, **params}
+        if rank is None:
+            return RenderContext(self, content_gen, params, retained=retained), None
+        slot_ranks = {}
+        for name, capacity in self._slot_capacities(content_gen, params).items():
+            rank, slot_ranks[name] = divmod(rank, capacity)
+        return RenderContext(self, content_gen, params, slot_ranks), rank
+
+    def render(self, content_gen, params=None, rank=None, retained=None):
+        """Текст шаблона; rank задаёт номер комбинации вместо случайных выборов
+
+        retained — словарь, общий для повторных рендеров одного фрагмента:
+        постоянные слоты (self.fixed) считаются один раз, а заново
+        выбираются только слоты со случайными выборами.
+        """
+        ctx, body_rank = self._context(content_gen, params or {}, rank, retained)
+        return self.body.render(ctx) if rank is None else self.body.render_rank(ctx, body_rank)
+
+    def render_document(self, content_gen, params=None, rank=None):
+        """Текст и метаданные типа документа; метаданные видят те же значения слотов"""
+        ctx, body_rank = self._context(content_gen, params or {}, rank)
+        content = self.body.render(ctx) if rank is None else self.body.render_rank(ctx, body_rank)
+        ctx.record_facts = False
+        metadata = {key: value.render(ctx) if isinstance(value, Text) else value
+                    for key, value in self.metadata.items()}
+        return content, metadata
+
+class TemplateRegistry:
+    """Реестр скомпилированных шаблонов; каждый компилируется один раз
+
+    Шаблоны загружаются из JSON файлов папки templates/. Описание с
+    разделом "document" задаёт новый тип документа (число документов
+    и метаданные), который генератор подхватывает без изменения кода.
+    """
+
+    def __init__(self):
+        self.templates = {}
+
+    def register(self, name, definition):
+        self.templates[name] = CompiledTemplate(name, definition)
+        return self.templates[name]
+
+    def load_folder(self, folder=TEMPLATES_FOLDER):
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith('.json'):
+                with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
+                    definition = json.load(f)
+                self.register(definition.get('name', filename[:-len('.json')]), definition)
+        return self
+
+    def get(self, name):
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise TemplateError(f"Unknown template: {name}") from None
+
+    def __contains__(self, name):
+        return name in self.templates
+
+    def document_types(self):
+        """Типы документов из реестра: имя -> число документов в наборе"""
+        return {name: template.document.get('count', 0)
+                for name, template in self.templates.items() if template.document is not None}
+
+_default_registry = None
+
+def default_registry():
+    """Реестр шаблонов из папки templates/ (загружается один раз на процесс)"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = TemplateRegistry().load_folder()
+    return _default_registry
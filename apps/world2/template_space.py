@@ -0,0 +1,155 @@
+# apps/world2/template_space.py
+import hashlib
+import math
+import random
+
+class SlotSource:
+    """Источник выборов для шаблона: записывает основания слотов и отдаёт заданные цифры
+
+    Реализует те же методы, что и модуль random (choice, randint, sample),
+    поэтому подставляется в ContentGenerator.rng вместо него. Без цифр
+    выборы делаются генератором rng (используется при трассировке).
+    """
+
+    def __init__(self, digits=None, rng=None):
+        self.digits = digits
+        self.rng = rng
+        self.radices = []
+
+    def _draw(self, radix):
+        position = len(self.radices)
+        self.radices.append(radix)
+        if self.digits is None:
+            return self.rng.randrange(radix) if self.rng is not None else 0
+        digit = self.digits[position] if position < len(self.digits) else 0
+        if digit >= radix:
+            raise ValueError(f"Slot {position} has {radix} options, digit {digit} does not fit")
+        return digit
+
+    def choice(self, options):
+        return options[self._draw(len(options))]
+
+    def randint(self, a, b):
+        return a + self._draw(b - a + 1)
+
+    def sample(self, population, k):
+        # Размещение без повторений: слоты с основаниями n, n-1, ..., n-k+1
+        pool = list(population)
+        return [pool.pop(self._draw(len(pool))) for _ in range(k)]
+
+    def random(self):
+        raise TypeError("Continuous random() draws cannot be enumerated")
+
+class FeistelPermutation:
+    """Псевдослучайная перестановка чисел 0..size-1 без хранения таблицы
+
+    Сеть Фейстеля задаёт биекцию на 2^bits ≥ size; значения за пределами
+    диапазона проходятся дальше по циклу (cycle walking), что сохраняет биекцию.
+    """
+
+    def __init__(self, size, seed=0, rounds=4):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        bits += bits % 2
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        self.width = (self.half + 7) // 8
+        self.rounds = rounds
+        self.key = hashlib.blake2b(str(seed).encode('utf-8'), digest_size=16).digest()
+
+    def _round(self, value, round_number):
+        digest = hashlib.shake_256(self.key + value.to_bytes(self.width, 'big') + bytes([round_number]))
+        return int.from_bytes(digest.digest(self.width), 'big') & self.mask
+
+    def __call__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = index
+        while True:
+            left, right = value >> self.half, value & self.mask
+            for round_number in range(self.rounds):
+                left, right = right, left ^ self._round(right, round_number)
+            value = (left << self.half) | right
+            if value < self.size:
+                return value
+
+class RankSpace:
+    """Номера комбинаций 0..capacity-1, выдаваемые без повторов в псевдослучайном порядке
+
+    offset и stride делят перестановку между шардами: шард i из n берёт
+    позиции i, i + n, i + 2n, ..., поэтому шарды с тем же зерном не
+    повторяют комбинации друг друга.
+    """
+
+    def __init__(self, capacity, seed=0, offset=0, stride=1):
+        self.capacity = capacity
+        self.permutation = FeistelPermutation(capacity, seed)
+        self.offset = offset
+        self.stride = stride
+        self.drawn = 0
+
+    def next_rank(self):
+        """Следующий ещё не выданный номер комбинации"""
+        position = self.offset + self.drawn * self.stride
+        if position >= self.capacity:
+            raise ValueError(f"Template space exhausted: all {self.capacity:,} combinations used")
+        rank = self.permutation(position)
+        self.drawn += 1
+        return rank
+
+    def remaining(self):
+        return max(0, (self.capacity - self.offset + self.stride - 1) // self.stride - self.drawn)
+
+class TemplateSpace(RankSpace):
+    """Пространство выборов шаблона как число в смешанной системе счисления
+
+    Каждый вызов choice/randint/sample в шаблоне — слот с основанием, равным
+    числу вариантов. Трассировка проверяет, что последовательность оснований
+    не зависит от выборов, а пробы отбрасывают слоты, которые влияют на текст
+    не всегда (например, варианты внутри невыбранного элемента списка), — они
+    фиксируются на первом варианте. Разные номера комбинаций дают разные тексты,
+    а номера выдаются по псевдослучайной перестановке, так что повторов нет
+    без перегенерации и без множества хешей.
+    """
+
+    def __init__(self, render, seed=0, probes=8):
+        self.render = render  # render(SlotSource) -> текст
+        self._random = random.Random(f"{seed}:trace")
+
+        trace = SlotSource(rng=self._random)
+        render(trace)
+        self.radices = trace.radices
+        for _ in range(probes - 1):
+            probe = SlotSource(rng=self._random)
+            render(probe)
+            if probe.radices != self.radices:
+                raise ValueError("Template slots depend on earlier choices and cannot be enumerated")
+
+        self.live = self._live_slots(probes)
+        super().__init__(math.prod(self.radices[i] for i in self.live), seed)
+
+    def _live_slots(self, probes):
+        """Слоты, смена значения которых меняет текст во всех пробах"""
+        live = [radix > 1 for radix in self.radices]
+        for _ in range(probes):
+            digits = [self._random.randrange(radix) for radix in self.radices]
+            base = self.render(SlotSource(digits))
+            for position, radix in enumerate(self.radices):
+                if not live[position]:
+                    continue
+                changed = list(digits)
+                changed[position] = (digits[position] + 1 + self._random.randrange(radix - 1)) % radix
+                if self.render(SlotSource(changed)) == base:
+                    live[position] = False
+        return [position for position, flag in enumerate(live) if flag]
+
+    def unrank(self, rank):
+        """Цифры всех слотов для номера комбинации (нефиксированные слоты — по рангу)"""
+        digits = [0] * len(self.radices)
+        for position in self.live:
+            rank, digits[position] = divmod(rank, self.radices[position])
+        return digits
+
+    def draw(self):
+        """Цифры следующей ещё не выданной комбинации"""
+        return self.unrank(self.next_rank())
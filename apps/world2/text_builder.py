@@ -0,0 +1,57 @@
+# apps/world2/text_builder.py
+import re
+
+WORD_PATTERN = re.compile(r'\S+')
+SENTENCE_END_PATTERN = re.compile(r'[.!?]["*)]*\s|\n\n')
+
+def count_words(text):
+    """Количество слов так же, как в knowledge_base_index.json (split по пробелам)"""
+    return len(text.split())
+
+def trim_to_words(text, max_words, exact=False):
+    """Обрезает текст до max_words слов
+
+    По умолчанию отступает к последней границе предложения или абзаца,
+    чтобы не обрывать фразу; с exact=True режет ровно по слову.
+    """
+    if max_words <= 0:
+        return ''
+    end = None
+    for number, match in enumerate(WORD_PATTERN.finditer(text), 1):
+        end = match.end()
+        if number == max_words:
+            break
+    else:
+        return text
+    if exact:
+        return text[:end]
+
+    boundary = None
+    for match in SENTENCE_END_PATTERN.finditer(text, 0, end + 1):
+        boundary = match.start() + 1
+    return text[:boundary].rstrip() if boundary else ''
+
+class TextBuilder:
+    """Собирает текст из частей и склеивает один раз: время линейно по длине
+
+    Ведёт счётчик слов, чтобы генерация по бюджету не пересчитывала весь текст.
+    """
+
+    def __init__(self, text=''):
+        self.parts = []
+        self.words = 0
+        if text:
+            self.append(text)
+
+    def append(self, text):
+        self.parts.append(text)
+        self.words += count_words(text)
+        return self
+
+    def extend(self, texts):
+        for text in texts:
+            self.append(text)
+        return self
+
+    def build(self):
+        return ''.join(self.parts)
@@ -4,6 +4,11 @@ import os
 import re
 from collections import Counter
 
+try:
+    from .entity_index import EntityIndex
+except ImportError:
+    from entity_index import EntityIndex
+
 class FictionalCorpusValidator:
     def __init__(self, knowledge_base_folder="knowledge_base", generated_folder="generated"):
         self.knowledge_base_folder = knowledge_base_folder
@@ -19,6 +24,10 @@ class FictionalCorpusValidator:
         else:
             self.terms_map = {"term_mappings": {}}
 
+        # Индекс упоминаний сущностей, если генератор его сохранил
+        entity_index_path = os.path.join(generated_folder, "entity_index.json")
+        self.entity_index = EntityIndex.load(entity_index_path) if os.path.exists(entity_index_path) else None
+
     def load_documents(self):
         """Загружает документы из knowledge_base папки"""
         if not os.path.exists(self.knowledge_base_folder):
@@ -60,16 +69,20 @@ class FictionalCorpusValidator:
             print("✓ No original Asterix terms found")
             return True
 
+    def term_categories(self):
+        """Категории terms_map: {категория: {оригинал: вымышленный термин}}"""
+        categories = self.terms_map.get('categories', self.terms_map)
+        return {category: terms for category, terms in categories.items()
+                if category != 'term_mappings' and isinstance(terms, dict)}
+
     def analyze_term_usage(self):
         """Анализирует использование вымышленных терминов"""
         # Получаем термины из terms_map.json
         all_fictional_terms = []
 
-        # Получаем все вымышленные термины из mapping
-        if 'categories' in self.terms_map:
-            for category, terms_dict in self.terms_map['categories'].items():
-                if isinstance(terms_dict, dict):
-                    all_fictional_terms.extend(terms_dict.values())
+        # Получаем все вымышленные термины из mapping (категории на верхнем уровне или в "categories")
+        for category, terms_dict in self.term_categories().items():
+            all_fictional_terms.extend(terms_dict.values())
 
         # Также проверяем term_mappings
         if 'term_mappings' in self.terms_map:
@@ -80,12 +93,21 @@ class FictionalCorpusValidator:
                         all_fictional_terms.append(value)
 
         term_usage = Counter()
+        all_fictional_terms = [term for term in dict.fromkeys(all_fictional_terms) if isinstance(term, str)]
 
-        for doc in self.documents:
-            content_lower = doc['content'].lower()
+        if self.entity_index is not None:
+            # Термины те же, что и без индекса; индекс лишь знает, в какие документы вставлен термин,
+            # а термин, которого генератор не записал, не использован (0)
             for term in all_fictional_terms:
-                if isinstance(term, str) and term.lower() in content_lower:
-                    term_usage[term] += 1
+                count = self.entity_index.document_count(term)
+                if count:
+                    term_usage[term] = count
+        else:
+            for doc in self.documents:
+                content_lower = doc['content'].lower()
+                for term in all_fictional_terms:
+                    if term.lower() in content_lower:
+                        term_usage[term] += 1
 
         print(f"\nFound {len(term_usage)} unique fictional terms used")
         if term_usage:
@@ -97,11 +119,11 @@ class FictionalCorpusValidator:
             print("⚠️  No fictional terms detected in documents")
             # Показываем примеры терминов, которые должны быть
             print("Example terms that should be present:")
-            if 'categories' in self.terms_map:
-                for category in ['characters', 'items']:
-                    if category in self.terms_map['categories']:
-                        terms = list(self.terms_map['categories'][category].values())[:3]
-                        print(f"  {category}: {', '.join(terms)}")
+            categories = self.term_categories()
+            for category in ['characters', 'items']:
+                if category in categories:
+                    terms = list(categories[category].values())[:3]
+                    print(f"  {category}: {', '.join(terms)}")
 
         return term_usage
 
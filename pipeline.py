@@ -0,0 +1,239 @@
+# pipeline.py
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+import traceback
+
+STATE_FILE = ".pipeline_state.json"
+
+class Stage:
+    """Шаг конвейера: функция и пути, которые она читает и пишет
+
+    run(*args) вызывается в отдельном процессе; params (по умолчанию args)
+    входят в ключ актуальности шага. Зависимости шагов не
+    задаются вручную: шаг зависит от шага, чьи outputs пересекаются с его
+    inputs (совпадают или вложены друг в друга); after добавляет явный
+    порядок для зависимостей не через файлы. Перед запуском старые outputs
+    удаляются, чтобы в папках не оставалось файлов прошлых прогонов.
+    reproducible=False — результат шага случаен (например, мир без зерна),
+    поэтому шаг никогда не считается актуальным и выполняется каждый прогон.
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), args=(), params=None, after=(), description=None,
+                 reproducible=True):
+        self.name = name
+        self.run = run
+        self.inputs = [os.path.normpath(path) for path in inputs]
+        self.outputs = [os.path.normpath(path) for path in outputs]
+        self.args = tuple(args)
+        self.params = self.args if params is None else params
+        self.after = tuple(after)
+        self.description = description or name
+        self.reproducible = reproducible
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+def paths_overlap(a, b):
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+class ContentHasher:
+    """SHA-256 содержимого файлов и папок
+
+    Хеш файла кэшируется по (размер, mtime_ns), поэтому неизменённые
+    файлы не перечитываются; кэш хранится в состоянии конвейера.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or {}  # path -> [size, mtime_ns, digest]
+
+    def file_digest(self, path):
+        stat = os.stat(path)
+        cached = self.cache.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return self.cache[path][2]
+
+    def digest(self, path):
+        """Хеш файла или папки (имена и содержимое всех файлов); None — пути нет"""
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, folders, names in os.walk(path):
+            folders.sort()
+            for name in sorted(names):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                digest.update(self.file_digest(file_path).encode('ascii'))
+        return digest.hexdigest()
+
+def _run_stage(run, args):
+    """Выполняет шаг в процессе пула; вывод собирается и печатается одним блоком"""
+    output = io.StringIO()
+    started = time.perf_counter()
+    ok = True
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            run(*args)
+        except (Exception, SystemExit):
+            traceback.print_exc()
+            ok = False
+    return ok, output.getvalue(), time.perf_counter() - started
+
+class Pipeline:
+    """DAG шагов генерации с пропуском актуальных шагов и параллельным запуском
+
+    Шаг актуален, если он воспроизводим, с его последнего успешного запуска
+    не изменились содержимое inputs и аргументы, а outputs существуют и
+    совпадают по содержимому с записанными. Актуальные шаги пропускаются, независимые
+    шаги (все зависимости выполнены) запускаются одновременно, каждый в
+    новом процессе. Если шаг упал, зависящие от него шаги не запускаются,
+    остальные выполняются. Состояние хранится в .pipeline_state.json.
+    """
+
+    def __init__(self, stages, state_path=STATE_FILE, workers=None, force=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+        self.dependencies = self._dependencies()
+        self.state = {'stages': {}, 'hashes': {}}
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        self.hasher = ContentHasher(self.state['hashes'])
+
+    def _dependencies(self):
+        dependencies = {}
+        for stage in self.stages.values():
+            needs = set(stage.after)
+            for other in self.stages.values():
+                if other is not stage and any(paths_overlap(path, output)
+                                              for path in stage.inputs for output in other.outputs):
+                    needs.add(other.name)
+            unknown = needs - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {sorted(unknown)}")
+            dependencies[stage.name] = needs
+        self.order = self._topological_order(dependencies)
+        return dependencies
+
+    @staticmethod
+    def _topological_order(dependencies):
+        order = []
+        remaining = dict(dependencies)
+        while remaining:
+            ready = [name for name, needs in remaining.items() if needs <= set(order)]
+            if not ready:
+                raise ValueError(f"Pipeline stages form a cycle: {sorted(remaining)}")
+            order.extend(ready)
+            for name in ready:
+                del remaining[name]
+        return order
+
+    def stage_key(self, stage):
+        """Хеш параметров и содержимого inputs шага"""
+        data = json.dumps({
+            'params': stage.params,
+            'inputs': {path: self.hasher.digest(path) for path in stage.inputs}
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def up_to_date(self, stage, key):
+        record = self.state['stages'].get(stage.name)
+        if self.force or not stage.reproducible or record is None or record['key'] != key:
+            return False
+        return all(self.hasher.digest(path) == digest and digest is not None
+                   for path, digest in record['outputs'].items())
+
+    def save_state(self):
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(temporary_path, self.state_path)
+
+    def run(self):
+        """Выполняет конвейер; результат — {stage: {'status', 'seconds'}}"""
+        results = {}
+        pending = list(self.order)
+        running = set()
+        finished = queue.Queue()
+
+        with multiprocessing.Pool(self.workers, maxtasksperchild=1) as pool:
+            while pending or running:
+                for name in list(pending):
+                    needs = self.dependencies[name]
+                    if any(results.get(need, {}).get('status') in ('failed', 'blocked') for need in needs):
+                        results[name] = {'status': 'blocked', 'seconds': 0.0}
+                        pending.remove(name)
+                        print(f"  ⏭️  {name}: not run, a stage it depends on failed")
+                        continue
+                    if not all(need in results for need in needs):
+                        continue
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    key = self.stage_key(stage)
+                    if self.up_to_date(stage, key):
+                        results[name] = {'status': 'skipped', 'seconds': 0.0}
+                        print(f"  ✓ {name}: up to date")
+                        continue
+                    for path in stage.outputs:
+                        if os.path.isdir(path):
+                            shutil.rmtree(path)
+                        elif os.path.exists(path):
+                            os.remove(path)
+                    print(f"  ▶ {name}: {stage.description}")
+                    running.add(name)
+                    pool.apply_async(_run_stage, (stage.run, stage.args),
+                                     callback=lambda result, name=name, key=key: finished.put((name, key, result)),
+                                     error_callback=lambda error, name=name, key=key:
+                                     finished.put((name, key, (False, f"{error!r}\n", 0.0))))
+
+                if not running:
+                    continue
+                name, key, (ok, output, seconds) = finished.get()
+                running.remove(name)
+                stage = self.stages[name]
+                print(f"\n📝 {name} ({seconds:.1f}s)")
+                print("-" * 40)
+                print(output, end='' if output.endswith('\n') else '\n')
+                missing = [path for path in stage.outputs if not os.path.exists(path)]
+                if ok and missing:
+                    print(f"  ⚠️  {name} did not produce {', '.join(missing)}")
+                    ok = False
+                if ok:
+                    self.state['stages'][name] = {
+                        'key': key,
+                        'outputs': {path: self.hasher.digest(path) for path in stage.outputs}
+                    }
+                    self.save_state()
+                    print("  ✅ Success")
+                else:
+                    self.state['stages'].pop(name, None)
+                    self.save_state()
+                    print("  ❌ Failed")
+                results[name] = {'status': 'ran' if ok else 'failed', 'seconds': round(seconds, 3)}
+
+        # Кэш хешей не хранит удалённые за прогон файлы
+        for path in [path for path in self.hasher.cache if not os.path.exists(path)]:
+            del self.hasher.cache[path]
+        self.save_state()
+        return {name: results[name] for name in self.order}
+
+def print_summary(results):
+    print("\n⏱️  Pipeline stages:")
+    for name, result in results.items():
+        print(f"  {name:12} {result['status']:8} {result['seconds']:.1f}s")
@@ -52,6 +52,87 @@ def test_world2():
         from validate_fictional_corpus import FictionalCorpusValidator, main as validate_main
         print("✓ validate_fictional_corpus.py imports successfully")
 
+        from entity_index import EntityIndex
+        print("✓ entity_index.py imports successfully")
+
+        from provenance_index import ProvenanceIndex
+        print("✓ provenance_index.py imports successfully")
+
+        from qa_engine import iter_fact_qa_pairs
+        print("✓ qa_engine.py imports successfully")
+
+        from reference_graph import ReferenceGraph
+        print("✓ reference_graph.py imports successfully")
+
+        from bm25_index import BM25Index
+        print("✓ bm25_index.py imports successfully")
+
+        from evaluate_retrieval import evaluate, main as evaluate_main
+        print("✓ evaluate_retrieval.py imports successfully")
+
+        from hashing_vectorizer import HashingVectorIndex
+        print("✓ hashing_vectorizer.py imports successfully")
+
+        from chunk_corpus import chunk_knowledge_base
+        print("✓ chunk_corpus.py imports successfully")
+
+        from columnar_export import export_columnar
+        print("✓ columnar_export.py imports successfully")
+
+        from corpus_store import CorpusStore
+        print("✓ corpus_store.py imports successfully")
+
+        from hard_negatives import mine_hard_negatives
+        print("✓ hard_negatives.py imports successfully")
+
+        from generate_distractors import main as distractors_main
+        print("✓ generate_distractors.py imports successfully")
+
+        from text_builder import TextBuilder
+        print("✓ text_builder.py imports successfully")
+
+        from corpus_planner import CorpusPlanner
+        print("✓ corpus_planner.py imports successfully")
+
+        from document_record import DocumentRecord
+        print("✓ document_record.py imports successfully")
+
+        from simhash_index import SimHashIndex
+        print("✓ simhash_index.py imports successfully")
+
+        from template_space import TemplateSpace
+        print("✓ template_space.py imports successfully")
+
+        from template_engine import TemplateRegistry
+        print("✓ template_engine.py imports successfully")
+
+        from batched_random import BatchedRandom
+        print("✓ batched_random.py imports successfully")
+
+        from shared_world import SharedWorld
+        print("✓ shared_world.py imports successfully")
+
+        from checkpoint import GenerationCheckpoint
+        print("✓ checkpoint.py imports successfully")
+
+        from sharding import Shard
+        print("✓ sharding.py imports successfully")
+
+        from merge_shards import merge_shards
+        print("✓ merge_shards.py imports successfully")
+
+        from batch_worlds import build_worlds
+        print("✓ batch_worlds.py imports successfully")
+
+        from pipeline import Pipeline
+        print("✓ pipeline.py imports successfully")
+
+        from generation_daemon import GenerationDaemon
+        print("✓ generation_daemon.py imports successfully")
+
+        from daemon_client import DaemonClient
+        print("✓ daemon_client.py imports successfully")
+
         # Проверяем, что есть main функции
         print("\n✓ World 2: All imports OK!")
         return True
@@ -62,11 +143,78 @@ def test_world2():
         traceback.print_exc()
         return False
 
+class SimulatedCrash(Exception):
+    """Сбой генерации посреди набора документов"""
+
+def test_world2_resume():
+    """Продолжение с контрольной точки даёт тот же корпус, что и непрерывный прогон"""
+    print("\n" + "="*60)
+    print("TESTING WORLD 2 RESUME FROM CHECKPOINT")
+    print("="*60)
+
+    import contextlib
+    import io
+    import tempfile
+
+    world2_path = os.path.join(os.path.dirname(__file__), "apps", "world2")
+    sys.path.insert(0, world2_path)
+    import fictional_document_generator
+
+    generator_class = fictional_document_generator.FictionalDocumentGenerator
+    generate_document = generator_class._generate_document
+
+    def run(folder, args, crash_after=None):
+        calls = [0]
+
+        def crashing(self, *a, **kw):
+            calls[0] += 1
+            if calls[0] > crash_after:
+                raise SimulatedCrash(f"after {crash_after} documents")
+            return generate_document(self, *a, **kw)
+
+        if crash_after is not None:
+            generator_class._generate_document = crashing
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fictional_document_generator.main([
+                    "--seed", "11", "--output-dir", folder, "--documents-only",
+                    "--checkpoint-dir", os.path.join(folder, "checkpoints"), "--checkpoint-every", "5", *args
+                ])
+        except SimulatedCrash:
+            pass
+        finally:
+            generator_class._generate_document = generate_document
+
+    def corpus(folder):
+        knowledge_base = os.path.join(folder, "knowledge_base")
+        texts = {}
+        for name in sorted(os.listdir(knowledge_base)):
+            with open(os.path.join(knowledge_base, name), 'r', encoding='utf-8') as f:
+                texts[name] = f.read()
+        return texts
+
+    modes = {
+        "random": [],
+        "batched rng": ["--batched-rng"],
+        "enumerate templates": ["--enumerate-templates"],
+        "enumerate templates, batched rng": ["--enumerate-templates", "--batched-rng"]
+    }
+    for mode, args in modes.items():
+        with tempfile.TemporaryDirectory() as folder:
+            full, resumed = os.path.join(folder, "full"), os.path.join(folder, "resumed")
+            run(full, args)
+            run(resumed, args, crash_after=17)
+            run(resumed, args + ["--resume"])
+            assert corpus(resumed) == corpus(full), f"Resumed corpus differs from a full run ({mode})"
+        print(f"✓ Resume from checkpoint reproduces the corpus ({mode})")
+
+    return True
+
 def main():
     print("Testing both RAG test data generators...")
 
     success1 = test_world1()
-    success2 = test_world2()
+    success2 = test_world2() and test_world2_resume()
 
     print("\n" + "="*60)
     print("TEST RESULTS SUMMARY")